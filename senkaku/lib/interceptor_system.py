@@ -55,9 +55,10 @@ class InterceptorSystem:
         missile.interceptors += 1
         
         # schedule interception
-        self.carrier.s.schedule_event(time + intercept_time,
-                                      lambda t, self=self, missile=missile:
-                                      self.intercept(t, missile))
+        missile.intercept_events.append(
+            self.carrier.s.schedule_event(time + intercept_time,
+                                          lambda t, self=self, missile=missile:
+                                          self.intercept(t, missile)))
         print('{}: {} launching interceptor towards {} missile. Distance {} km.'.format(
             time, self.name, missile.kind,
             self.carrier.location.distance_to(missile.location)))
@@ -95,10 +96,10 @@ class InterceptorSystem:
     
         # calculate if missile is killed
         if random.random() < intercept_prob:
-            missile.state = 'destroyed'
             print('{}: {} interceptor destroyed {} missile. Distance {} km.'.format(
                 time, self.name, missile.kind,
                 self.carrier.location.distance_to(missile.location)))
+            missile.destroy(time)
         else:
             print('{}: {} interceptor missed {} missile. Distance {} km.'.format(
                 time, self.name, missile.kind,
@@ -42,9 +42,9 @@ class Launcher(Entity):
         m = Missile(self.s, self.kind, self.location, target, self.missile_speed)
         self.s.enable_missile_tracking(time)
         impact_time = time + self.missile_flight_duration(target)
-        self.s.schedule_event(impact_time,
-                              lambda t, m=m, target=target:
-                              m.missile_impact(t, target))
+        m.impact_event = self.s.schedule_event(impact_time,
+                                               lambda t, m=m, target=target:
+                                               m.missile_impact(t, target))
         
         if self.reloads > 0:
             self.state = 'reloading'
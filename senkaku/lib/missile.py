@@ -17,6 +17,11 @@ class Missile(Entity):
         # The number of interceptors currently en-route to this missile.
         self.interceptors = 0
         
+        # Handles for the pending impact and interception events, so that they can be
+        # dropped as soon as the missile is destroyed or hits its target.
+        self.impact_event = None
+        self.intercept_events = []
+        
         if kind == 'cruise':
             pass
         elif kind == 'ballistic':
@@ -31,6 +36,24 @@ class Missile(Entity):
         print('{}: {} missile impact on {}.'.format(time, self.kind, target.name))
         target.resolve_missile_impact(self.kind)
         self.state = 'impacted'
+        self._cancel_intercepts(time)
+        
+    def destroy(self, time):
+        """Mark the missile destroyed, and cancel its impact and any other interceptors."""
+        self.state = 'destroyed'
+        if self.impact_event is not None:
+            self.impact_event.cancel()
+        self._cancel_intercepts(time)
+        
+    def _cancel_intercepts(self, time):
+        pending = [e for e in self.intercept_events if e.state == 'pending']
+        for event in pending:
+            event.cancel()
+        if pending:
+            print('{}: {} missile no-longer in flight, {} interceptor(s) wasted.'.format(
+                time, self.kind, len(pending)))
+        self.interceptors -= len(pending)
+        self.intercept_events = []
         
     def status_string(self):
         return 'Missile {}. State: {}. Interceptors: {}.'.format(
@@ -1,4 +1,4 @@
-from heapq import heappop, heappush
+from heapq import heapify, heappop, heappush
 
 from lib.aegis_ashore import AegisAshore
 from lib.airbase import Airbase
@@ -12,6 +12,23 @@ from lib.renderer import Renderer
 from lib.sam import SAM
 from lib.ship import Ship
 
+# Cancelled events stay in the queue until they are popped. Once they make up more than
+# half of the queue (and there are at least this many), the queue is rebuilt without them.
+MIN_CANCELLED_TO_COMPACT = 1024
+
+class Event:
+    """Handle for a scheduled event, which can be used to cancel it."""
+    def __init__(self, s, func):
+        self.s = s
+        self.func = func
+        self.state = 'pending'
+        
+    def cancel(self):
+        """Cancel the event. Has no effect if the event already happened."""
+        if self.state == 'pending':
+            self.state = 'cancelled'
+            self.s.note_cancelled_event()
+
 class Simulation:
     def __init__(self):
         self.event_queue = []
@@ -28,6 +45,7 @@ class Simulation:
         
         self.last_event_time = -1
         self.next_event_id = 0
+        self.num_cancelled_events = 0
         self.missile_tracking_enabled = False
         
         # We begin the missile position updating loop.
@@ -48,8 +66,10 @@ class Simulation:
         Returns:
           True iff an event was processed.
         """
+        self._discard_cancelled_events()
         if len(self.event_queue) > 0:
-            time, _, func = heappop(self.event_queue)
+            time, _, event = heappop(self.event_queue)
+            event.state = 'done'
             if self.last_event_time != time:
                 if len(self.render_times) > self.num_renders_written:
                     render_time = self.render_times[self.num_renders_written]
@@ -62,7 +82,7 @@ class Simulation:
                 if time % 100 == 0:
                     print('{}: Simulation ongoing.'.format(time))
                     
-            func(time)
+            event.func(time)
             
             self.last_event_time = time
             return True
@@ -78,13 +98,35 @@ class Simulation:
           event: A lambda that takes the time the event happens
                  as an argument, and resolves the effects of the
                  event (including enqueuing any future events).
+        Returns:
+          An Event handle, which can be used to cancel the event.
         """
+        handle = Event(self, event)
         # We add an "event id" field to handle events which happen at
         # the same time. This is just an ever-increasing integer, so it
         # ensures that events happening at the same time step happen in
         # the order they were enqueued.
-        heappush(self.event_queue, (time, self.next_event_id, event))
-        self.next_event_id += 1      
+        heappush(self.event_queue, (time, self.next_event_id, handle))
+        self.next_event_id += 1
+        return handle
+
+    def note_cancelled_event(self):
+        """Called when an event is cancelled. Cancelled events are left in the queue,
+        and skipped when they are reached, but if they start to make up most of the
+        queue it is rebuilt without them."""
+        self.num_cancelled_events += 1
+        if (self.num_cancelled_events >= MIN_CANCELLED_TO_COMPACT and
+                2 * self.num_cancelled_events > len(self.event_queue)):
+            self.event_queue = [entry for entry in self.event_queue
+                                if entry[2].state != 'cancelled']
+            heapify(self.event_queue)
+            self.num_cancelled_events = 0
+
+    def _discard_cancelled_events(self):
+        """Pop cancelled events off the front of the queue."""
+        while self.event_queue and self.event_queue[0][2].state == 'cancelled':
+            heappop(self.event_queue)
+            self.num_cancelled_events -= 1
 
     def enable_missile_tracking(self, time):
         """Tell the simulation to start tracking the locations of missiles.
@@ -170,6 +212,7 @@ class Simulation:
 
     def print_state(self):
         print()
+        self._discard_cancelled_events()
         if len(self.event_queue) > 0:
             next_event_time = self.event_queue[0][0]
         else:
@@ -1,13 +1,20 @@
 from abc import ABC, abstractmethod
-from datetime import timedelta
+
+import numpy as np
 
 from lib.enums import TLOKind
-from lib.intelligence_types import Observation
-from lib.time import format_time
+from lib.intelligence_types import ObservationBatch
+from lib.time import to_minutes
 
 class Analyzer(ABC):
-    def __init__(self, c):
+    def __init__(self, c, rng):
+        """
+        Args:
+          c: Config object.
+          rng: numpy Generator this analyzer draws from.
+        """
         self.c = c
+        self.rng = rng
         super().__init__()
     
     @abstractmethod
@@ -15,10 +22,10 @@ class Analyzer(ABC):
         """Analyze observations emitted by an Observer.
         
         Args:
-          observations: A sequence of observations (positive and negative).
-          t: Current simulation time.
+          observations: An ObservationBatch (positive and negative observations).
+          t: Current simulation time (minutes since start).
         Returns:
-          A collection of Observations representing what the analysis process believes
+          An ObservationBatch representing what the analysis process believes
           to be TELs. Can still contain negative examples to represent false positives
           in the analysis process.
         
@@ -28,23 +35,45 @@ class Analyzer(ABC):
         """  
         pass
     
+    def wants_observations(self, t):
+        """Whether the analyzer would use observations passed to analyze() at time t.
+        
+        Observers are only asked to produce observations if so, since producing them can
+        be expensive.
+        """
+        return True
+    
 def timing_stats(name, start_t, ml_t, final_t):
-    return "{} ML analysis started at {}, finished at {}. Human analysis finished at {}.".format(
-        name, format_time(start_t), format_time(ml_t), format_time(final_t))
+    return "{} ML analysis started at minute {}, finished at minute {}. Human analysis finished at minute {}.".format(
+        name, start_t, ml_t, final_t)
 
 def analysis_stats(start_obs, ml_obs, final_obs):
     lines = ["  Positive rates per TELKind:"]
     for kind in TLOKind: 
-        p = sum([o.multiplicity for o in final_obs if o.tlo_kind == kind])
-        op = sum([o.multiplicity for o in start_obs if o.tlo_kind == kind])
+        p = int(final_obs.multiplicity[final_obs.tlo_kind == kind].sum())
+        op = int(start_obs.multiplicity[start_obs.tlo_kind == kind].sum())
         pr = p/op if op else 0
         lines.append("    {}: {}/{} ({:.2%})".format(kind.name, p, op, pr))
     return "\n".join(lines)
     
+def positive_rates(p_from_kind, non_tlo_positive_rate):
+    """Array of the chance of keeping an observation, indexed by its TLO kind + 1.
+
+    Args:
+      p_from_kind: Dict of the chance for each TLOKind. Kinds not in it are never kept.
+      non_tlo_positive_rate: Chance for observations of no TLO.
+    """
+    rates = np.zeros(max(TLOKind) + 2)
+    rates[0] = non_tlo_positive_rate
+    for kind, p in p_from_kind.items():
+        rates[kind + 1] = p
+    return rates
+
 class ImageryAnalyzer(Analyzer):
-    def __init__(self, c, name):
-        super().__init__(c)
+    def __init__(self, c, rng, name):
+        super().__init__(c, rng)
         self.name = name
+        self.ml_processing_minutes = to_minutes(c.ml_processing_duration)
         
         # (start_t, start_obs), representing data not yet processed.
         self.ml_processing = None
@@ -55,33 +84,35 @@ class ImageryAnalyzer(Analyzer):
         # Time when latest batch of human processing started. Only set if self.human_processing is not None.
         self.human_processing_start_t = None
         
-    def process(self, observations, p_from_kind, non_tlo_positive_rate):
-        sampled_observations = []
-        for obs in observations:
-            if obs.tlo_kind is None:
-                p = non_tlo_positive_rate
-            else:
-                p = p_from_kind[obs.tlo_kind]
-
-            sampled_obs = obs.sample(p)
-            if sampled_obs is not None:
-                sampled_observations.append(sampled_obs)
-        return sampled_observations
+        # Chance of each processing step keeping an observation, indexed by TLO kind + 1
+        # (so that observations of no TLO, with kind -1, come first).
+        self.ml_rates = positive_rates(c.ml_positive_rates, c.ml_non_tlo_positive_rate)
+        self.human_rates = positive_rates(c.human_positive_rates, 0)
+        
+    def process(self, observations, rates):
+        return observations.sample(rates[observations.tlo_kind + 1], self.rng)
         
     def human_process(self, observations):
-        return self.process(observations, self.c.human_positive_rates, 0)
+        return self.process(observations, self.human_rates)
     
     def ml_process(self, observations):
-        return self.process(observations, self.c.ml_positive_rates,
-                            self.c.ml_non_tlo_positive_rate)
+        return self.process(observations, self.ml_rates)
+    
+    def wants_observations(self, t):
+        # New observations are only picked up once ML processing of the previous batch
+        # is done, and are dropped otherwise.
+        if self.ml_processing is None:
+            return True
+        start_t, _ = self.ml_processing
+        return t - start_t >= self.ml_processing_minutes
     
     def analyze(self, observations, t):
-        final_obs = []
+        final_obs = ObservationBatch.empty()
         
         if self.human_processing:
             start_t, start_obs, ml_t, ml_obs = self.human_processing
-            num_observations = sum([o.multiplicity for o in ml_obs])
-            elapsed_minutes = (t - self.human_processing_start_t).seconds / 60
+            num_observations = ml_obs.multiplicity.sum()
+            elapsed_minutes = t - self.human_processing_start_t
             if elapsed_minutes * self.c.human_examples_per_minute >= num_observations:
                 final_obs = self.human_process(ml_obs)
                 if self.c.debug:
@@ -94,7 +125,7 @@ class ImageryAnalyzer(Analyzer):
             start_t, start_obs = self.ml_processing
             # This could alternatively be done by assuming a
             # "ml_example_per_minute" value.
-            if t - start_t >= self.c.ml_processing_duration:
+            if t - start_t >= self.ml_processing_minutes:
                 ml_obs = self.ml_process(start_obs)
                 self.waiting_for_human_processing = (start_t, start_obs, t, ml_obs)
                 self.ml_processing = None
@@ -104,14 +135,14 @@ class ImageryAnalyzer(Analyzer):
             self.human_processing_start_t = t
             self.waiting_for_human_processing = None
         
-        if not self.ml_processing and observations:
+        if not self.ml_processing and len(observations):
             self.ml_processing = (t, observations)
             
         return final_obs
     
 class PassthroughAnalyzer(Analyzer):
-    def __init__(self, c):
-        super().__init__(c)
+    def __init__(self, c, rng):
+        super().__init__(c, rng)
         
     def analyze(self, observations, t):
         return observations
\ No newline at end of file
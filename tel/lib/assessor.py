@@ -1,10 +1,12 @@
 from collections import defaultdict
 from copy import deepcopy
 from dataclasses import dataclass
-from datetime import timedelta
 from math import floor, ceil
 from typing import Dict
-from uuid import uuid4
+
+import numpy as np
+
+from lib.time import MINUTE
 
 def missile_retaliation_prob(c, m):
     """Probability US missile defense successfully destroys m missiles."""
@@ -22,35 +24,43 @@ class AssessmentStats:
     mated_missiles_remaining: int
     retaliation_prob: float
 
-def assess(c, t, files):
-    tels_to_destroy = []
-    total_roam_time = timedelta()
-    for f in files.values():
-        f.obs.sort()
-        obs = f.obs[-1]
-        total_roam_time += f.tel.roaming_time_since_observation(obs, t)
-        area = f.tel.destruction_area(obs, t, t)
-        # Insert a random integer (uuid) to give a total order.
-        tels_to_destroy.append((area, uuid4(), f.tel, obs))
-    avg_roam_time = (total_roam_time/len(tels_to_destroy)) / timedelta(minutes=1)
+def assess(c, t, tracker):
+    """Assess whether a first strike could destroy every TEL, given what is known about
+    where the TELs are.
+    
+    Args:
+      c: Config object.
+      t: Current simulation time (minutes since start).
+      tracker: The Tracker holding the US's files on the TELs.
+    Returns:
+      AssessmentStats.
+    """
+    fleet = tracker.fleet
+    indices = tracker.tel_indices
+    roam_time = fleet.roaming_time(indices, tracker.latest_t, t)
+    avg_roam_time = int(roam_time.sum()) / len(indices)
     
-    tels_to_destroy.sort()
     arsenal = deepcopy(c.arsenal)
-    remaining_tels = []
+    flight_times = [nuke.flight_time / MINUTE for nuke in arsenal]
+    # TELs are attacked in order of how much area has to be destroyed to destroy them
+    # now, with ties broken by the order of the files.
+    order = np.argsort(fleet.destruction_areas(indices, roam_time, 0), kind='stable')
+    indices = indices[order]
+    roam_time = roam_time[order]
+    # The area for each flight time, as an array over the TELs.
+    areas_by_time = [fleet.destruction_areas(indices, roam_time, key) for key in flight_times]
     area_to_destroy_by_time = {}
-    for nuke in arsenal:
-        flight_time_min = nuke.flight_time / timedelta(minutes=1)
-        area_to_destroy_by_time[flight_time_min] = 0
-    for area, _, tel, obs in tels_to_destroy:
-        for key in area_to_destroy_by_time.keys():
-            flight_time = timedelta(minutes=key)
-            area_to_destroy_by_time[key] += tel.destruction_area(obs, t, t + flight_time)
+    for key, areas in zip(flight_times, areas_by_time):
+        area_to_destroy_by_time[key] = float(areas.sum())
+    areas_by_tel = list(zip(*[areas.tolist() for areas in areas_by_time]))
+    
+    remaining_tels = []
+    for i, areas in zip(indices.tolist(), areas_by_tel):
         destroyed_km = 0
         num_missiles = 0
         km_to_destroy = 0
         destroyed = False
-        for nuke in arsenal:
-            km_to_destroy = tel.destruction_area(obs, t, t + nuke.flight_time)
+        for nuke, km_to_destroy in zip(arsenal, areas):
             while nuke.number >= c.nukes_per_tel and destroyed_km < km_to_destroy:
                 nuke.number -= c.nukes_per_tel
                 destroyed_km += nuke.km2
@@ -59,10 +69,10 @@ def assess(c, t, files):
                 destroyed = True
                 break           
         if not destroyed:
-            remaining_tels.append(tel)
+            remaining_tels.append(i)
         if c.debug:
             print('Used {} missiles to destroy {}, {:,.0f} km^2 destroyed, {:,.0f} km^2 required.'.format(
-                num_missiles, tel.name, destroyed_km, km_to_destroy))
+                num_missiles, fleet.name(i), destroyed_km, km_to_destroy))
     
     missiles_remaining = len(remaining_tels)
     if c.debug:
@@ -75,7 +85,7 @@ def assess(c, t, files):
 
         if len(remaining_tels) > 0:
             print('First strike not possible, {} TELs remaining.'.format(missiles_remaining))
-    mated_missiles_remaining = len([tel for tel in remaining_tels if tel.mated])        
+    mated_missiles_remaining = int(fleet.mated[remaining_tels].sum())
     retaliation_prob = missile_retaliation_prob(c, mated_missiles_remaining)
     return AssessmentStats(avg_roam_time, area_to_destroy_by_time, missiles_remaining,
                            mated_missiles_remaining, retaliation_prob)
\ No newline at end of file
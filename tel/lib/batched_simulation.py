@@ -0,0 +1,477 @@
+from datetime import datetime
+import math
+
+import numpy as np
+
+from lib.assessor import AssessmentStats, missile_retaliation_prob
+from lib.config import DefaultConfig
+from lib.enums import TELState, TLOKind, SimulationMode, Weather
+from lib.location import SunTable
+from lib.observer import daylight_fraction, truck_utilization_fraction
+from lib.rng import RandomStreams, stable_hash
+from lib.simulation import TZ
+from lib.tel_base import load_bases, load_tels_from_bases
+from lib.tel_fleet import TELFleet, schedule_tables
+from lib.time import MINUTE, to_minutes, to_datetime
+from lib.timeline import weather_timeline, shore_timeline
+
+class BatchedImageryAnalyzer:
+    """The ImageryAnalyzer pipeline (ML, then humans), for every replication at once.
+
+    Each stage holds at most one batch of observations per replication, stored as counts
+    per TLO column rather than as Observation objects.
+    """
+    def __init__(self, c, rng, replications, tlo_kinds, tel_columns):
+        """
+        Args:
+          c: Config object.
+          rng: numpy Generator this analyzer draws from.
+          replications: Number of replications.
+          tlo_kinds: TLOKind of each TLO column.
+          tel_columns: Indices of the columns holding real TELs, in tracker order.
+        """
+        self.c = c
+        self.rng = rng
+        self.ml_processing_minutes = to_minutes(c.ml_processing_duration)
+        self.ml_p = np.array([c.ml_positive_rates[kind] for kind in tlo_kinds])
+        self.human_p = c.human_positive_rates[TLOKind.TEL]
+        self.tel_columns = tel_columns
+
+        R, T = replications, len(tlo_kinds)
+        # Batch being processed by ML: start time, counts per TLO column and non-TLO count.
+        self.ml_active = np.zeros(R, dtype=bool)
+        self.ml_t = np.zeros(R, dtype=np.int64)
+        self.ml_counts = np.zeros((R, T), dtype=np.int64)
+        self.ml_non_tlo = np.zeros(R, dtype=np.int64)
+        # Batches finished by ML, not yet started by humans.
+        self.waiting_active = np.zeros(R, dtype=bool)
+        self.waiting_t = np.zeros(R, dtype=np.int64)
+        self.waiting_counts = np.zeros((R, T), dtype=np.int64)
+        self.waiting_total = np.zeros(R, dtype=np.int64)
+        # Batches being processed by humans.
+        self.human_active = np.zeros(R, dtype=bool)
+        self.human_t = np.zeros(R, dtype=np.int64)
+        self.human_start_t = np.zeros(R, dtype=np.int64)
+        self.human_counts = np.zeros((R, T), dtype=np.int64)
+        self.human_total = np.zeros(R, dtype=np.int64)
+
+    def analyze(self, counts, non_tlo, has_obs, t):
+        """Analyze one minute of observations.
+
+        Args:
+          counts: (replications, TLO columns) array of observation counts.
+          non_tlo: (replications,) array of non-TLO observation counts.
+          has_obs: Whether the observer produced any observations (including non-TLO
+            ones) this minute. Same for every replication.
+          t: Current simulation time (minutes since start).
+        Returns:
+          None if nothing finished processing, otherwise (detected, obs_t), where
+          detected is a (replications, TELs) boolean array of TELs positively
+          identified and obs_t is a (replications,) array of the observation times.
+        """
+        result = None
+
+        done = self.human_active & ((t - self.human_start_t) * self.c.human_examples_per_minute
+                                    >= self.human_total)
+        if done.any():
+            detected = np.zeros((len(done), len(self.tel_columns)), dtype=bool)
+            tel_counts = self.human_counts[done][:, self.tel_columns]
+            detected[done] = self.rng.binomial(n=tel_counts, p=self.human_p) > 0
+            result = (detected, self.human_t.copy())
+            self.human_active[done] = False
+
+        done = self.ml_active & (t - self.ml_t >= self.ml_processing_minutes)
+        if done.any():
+            ml_counts = self.rng.binomial(n=self.ml_counts[done], p=self.ml_p)
+            ml_non_tlo = self.rng.binomial(n=self.ml_non_tlo[done],
+                                           p=self.c.ml_non_tlo_positive_rate)
+            self.waiting_active[done] = True
+            self.waiting_t[done] = self.ml_t[done]
+            self.waiting_counts[done] = ml_counts
+            self.waiting_total[done] = ml_counts.sum(axis=1) + ml_non_tlo
+            self.ml_active[done] = False
+
+        move = self.waiting_active & ~self.human_active
+        if move.any():
+            self.human_active[move] = True
+            self.human_t[move] = self.waiting_t[move]
+            self.human_start_t[move] = t
+            self.human_counts[move] = self.waiting_counts[move]
+            self.human_total[move] = self.waiting_total[move]
+            self.waiting_active[move] = False
+
+        if has_obs:
+            start = ~self.ml_active
+            self.ml_active[start] = True
+            self.ml_t[start] = t
+            self.ml_counts[start] = counts[start]
+            self.ml_non_tlo[start] = non_tlo[start]
+
+        return result
+
+class BatchedSimulation:
+    """Several independent replications of the same simulation, advanced in lock step.
+
+    Rather than looping over TLOs once per replication, all state has a leading
+    replication axis: TEL schedules, weather and EMCON are (replications, TELs) arrays,
+    each observer makes one random draw per minute covering every replication, and the
+    tracker only keeps the time of the latest observation of each TEL. A TEL's state is
+    a deterministic function of its schedule offset, so it's looked up from a table
+    rather than driven by events.
+
+    The model is the same as Simulation's (and the statistics match), but individual
+    replications don't reproduce a Simulation with the same seed, since the random
+    draws are made in a different order. There is no rendering, snapshotting or
+    per-observation record; use Simulation when those are needed.
+    """
+    def __init__(self,
+                 c=None,
+                 replications=10,
+                 start_datetime=datetime.fromisoformat('2021-01-20T12:00:00'),
+                 runtime=None,
+                 rng_seed=None):
+        """Initialize the simulation.
+        c: An optional Config object (defaults to DefaultConfig).
+        replications: Number of independent replications to run.
+        start_datetime: datetime object representing when the simulation starts.
+          No timezone should be specified (assumed to be local time in China).
+        runtime: timedelta indicating how long to run for. Required.
+        rng_seed: Optional integer. If provided, use a fixed seed which should make
+          the simulation deterministic. If not provided use a random seed.
+        """
+        if runtime is None:
+            raise ValueError('BatchedSimulation requires a runtime.')
+        self.c = c if c is not None else DefaultConfig()
+        if to_minutes(self.c.intelligence_interval) != 1:
+            raise ValueError('BatchedSimulation only supports a one minute intelligence_interval.')
+        if self.c.sar_constellation is not None:
+            raise ValueError('BatchedSimulation does not support sar_constellation.')
+        if self.c.road_network_filename is not None:
+            raise ValueError('BatchedSimulation does not support road_network_filename.')
+        if self.c.population_raster_filename is not None:
+            raise ValueError('BatchedSimulation does not support population_raster_filename.')
+        self.replications = replications
+        self.rng = RandomStreams(rng_seed)
+        self.start_t = start_datetime.replace(tzinfo=TZ)
+        self.t = 0
+        self.end_t = to_minutes(runtime)
+
+        self.ts = []
+        # List of AssessmentStats for each replication.
+        self.assessment_stats = [[] for _ in range(replications)]
+
+        self._load()
+        self._init_schedules()
+        self._init_intelligence()
+
+    def to_datetime(self, t=None):
+        """Convert a simulation time (defaults to the current time) into a timezone-aware datetime."""
+        return to_datetime(self.start_t, self.t if t is None else t)
+
+    def _load(self):
+        """Load the TELs and TLOs from the config, and lay them out as array columns.
+
+        The TEL objects are only used for their names, kinds and bases. Everything
+        that differs between replications is drawn separately below.
+        """
+        c = self.c
+        # Hack alert: Loading constructs TEL objects, which make random draws. Give them
+        # their own streams so they don't disturb the ones used below.
+        template_rng = RandomStreams(self.rng.spawn(1)[0])
+        fleet = TELFleet(c, template_rng)
+        if c.simulation_mode == SimulationMode.BASE_LOCAL:
+            self.bases = load_bases(c, template_rng, fleet)
+            units = [tel for base in self.bases for tel in base.tels]
+            trucks = [tlo for base in self.bases for tlo in base.tlos
+                      if tlo.kind == TLOKind.TRUCK]
+            self.unit_base = np.array([self.bases.index(tel.base) for tel in units])
+            self.truck_base = np.arange(len(self.bases))
+        elif c.simulation_mode == SimulationMode.FREE_ROAMING:
+            self.bases = None
+            units, tlos = load_tels_from_bases(c, template_rng, fleet)
+            trucks = [tlo for tlo in tlos if tlo.kind == TLOKind.TRUCK]
+
+        # "Units" are TELs and decoys, which follow a TEL schedule. TLO columns are the
+        # units followed by the trucks.
+        self.units = units
+        self.trucks = trucks
+        self.tlo_kinds = [tel.tlo_kind for tel in units] + [TLOKind.TRUCK] * len(trucks)
+        self.tlo_multiplicity = np.array(
+            [1] * len(units) + [math.floor(tlo.multiplicity) for tlo in trucks], dtype=np.int64)
+        self.tel_columns = np.array([i for i, tel in enumerate(units)
+                                     if tel.tlo_kind == TLOKind.TEL])
+        self.tels = [units[i] for i in self.tel_columns]
+
+    def _init_schedules(self):
+        c = self.c
+        rng = self.rng
+        R, U, N = self.replications, len(self.units), len(self.tels)
+
+        # The state of a TEL with offset o at time t only depends on its phase
+        # (t - o) % loop_time, so tabulate the schedule entry and the cumulative
+        # roaming time for every phase (the same tables as TELFleet uses).
+        tables = schedule_tables(c.tel_schedule)
+        self.loop_time = tables.loop_time
+        self.schedule_states = tables.entry_states
+        self.entry_at_phase = tables.entry_at_phase
+        self.roam_before_phase = tables.roam_before_phase
+
+        self.offsets = rng.schedules.integers(self.loop_time, size=(R, U))
+        self.tel_offsets = self.offsets[:, self.tel_columns]
+        self.mated = rng.schedules.random((R, N)) < c.mating_fraction
+        self.entry = None
+        self.emcon = np.zeros((R, N), dtype=bool)
+
+        # Weather is per base, or per TEL if the TELs aren't tied to bases, and is
+        # sampled for the whole run up front, with a timeline row per (replication, region).
+        num_regions = len(self.bases) if self.bases else U
+        self.visibility_by_weather = np.zeros(max(Weather) + 1)
+        self.visibility_by_weather[Weather.CLEAR] = 1
+        self.visibility_by_weather[Weather.CLOUDY] = c.cloudy_visibility
+        self.weather = weather_timeline(c, rng, R * num_regions, self.t, self.end_t)
+
+        if self.bases:
+            self.base_sar_offsets = np.array(
+                [stable_hash(base.name + "SAR") % c.sar_cadence_min for base in self.bases])
+            self.base_offshore = np.array([base.offshore_observability for base in self.bases])
+            self.base_tiles = c.satellite_tiles_per_base
+            self.base_sun = SunTable([base.location.lat for base in self.bases],
+                                     [base.location.lon for base in self.bases])
+        else:
+            self.unit_sar_offsets = np.array(
+                [stable_hash(tel.name + "SAR") % c.sar_cadence_min for tel in self.units])
+            self.near_shore = shore_timeline(c, rng, R * U, self.t, self.end_t)
+            # Hack alert: Give each TEL a random location in each replication, as in
+            # TEL.__init__().
+            self.unit_sun = SunTable(rng.locations.uniform(25, 45, size=R * U),
+                                     rng.locations.uniform(80, 120, size=R * U))
+
+        self.sigint_offsets = np.array(
+            [stable_hash(tel.name + 'SIGINT') % 60 for tel in self.tels])
+
+    def _init_intelligence(self):
+        c = self.c
+        R = self.replications
+        self.eo_rng = self.rng.get('EO observer')
+        self.sar_rng = self.rng.get('SAR observer')
+        self.standoff_rng = self.rng.get('Standoff observer')
+        self.sigint_rng = self.rng.get('SIGINT observer')
+        self.ground_rng = self.rng.get('Ground sensor observer')
+        self.eo_analyzer = BatchedImageryAnalyzer(
+            c, self.rng.get('EO analyzer'), R, self.tlo_kinds, self.tel_columns)
+        self.sar_analyzer = BatchedImageryAnalyzer(
+            c, self.rng.get('SAR analyzer'), R, self.tlo_kinds, self.tel_columns)
+        self.standoff_analyzer = BatchedImageryAnalyzer(
+            c, self.rng.get('Standoff analyzer'), R, self.tlo_kinds, self.tel_columns)
+
+        # Time of the latest observation of each TEL. Every TEL's location is known at
+        # the start of the simulation.
+        self.last_obs_t = np.zeros((R, len(self.tels)), dtype=np.int64)
+
+        self.retaliation_prob_by_count = np.array(
+            [missile_retaliation_prob(c, m) for m in range(len(self.tels) + 1)])
+        self.flight_times = [nuke.flight_time / MINUTE for nuke in c.arsenal]
+
+    def run(self):
+        """Run every replication until the end time."""
+        while self.t <= self.end_t:
+            self.step()
+
+    def step(self):
+        """Advance every replication by one minute."""
+        t = self.t
+        self._update_schedules(t)
+        self._process(t)
+        self.t += 1
+
+    def _update_schedules(self, t):
+        c = self.c
+        entry = self.entry_at_phase[(t - self.offsets) % self.loop_time]
+        if self.entry is None:
+            changed = np.ones(entry.shape, dtype=bool)
+        else:
+            changed = entry != self.entry
+        self.entry = entry
+        self.state = self.schedule_states[entry]
+
+        # TELs decide whether to practice EMCON, and pass ground sensors, each time
+        # they change state.
+        tel_changed = changed[:, self.tel_columns]
+        num_changed = np.count_nonzero(tel_changed)
+        if num_changed:
+            self.emcon[tel_changed] = self.rng.emcon.random(num_changed) < c.emcon_fraction
+        tel_state = self.state[:, self.tel_columns]
+        self.entered_gate = tel_changed & ((tel_state == TELState.LEAVING_BASE) |
+                                           (tel_state == TELState.ARRIVING_BASE))
+
+    def _imaging_probabilities(self, now):
+        """Per-column probabilities of being seen by EO, SAR and standoff SAR.
+
+        Returns:
+          A dict from observer name to (p, tiles, has_obs), where p is a
+          (replications, TLO columns) array, tiles is the number of satellite tiles
+          examined and has_obs is whether the observer is looking anywhere at all.
+        """
+        c = self.c
+        t = self.t
+        # TELs and decoys in physical shelters can't be observed by satellites.
+        unobstructed = ((self.state != TELState.IN_BASE) &
+                        (self.state != TELState.SHELTERING)).astype(float)
+        R = self.replications
+        visibility = self.visibility_by_weather[self.weather.value_at(t).reshape(R, -1)]
+
+        if self.bases:
+            day = self.base_sun.is_day(now).astype(float)
+            truck_util = truck_utilization_fraction(c, day)
+            sar = ((t - self.base_sar_offsets) % c.sar_cadence_min < c.sar_duration_min)
+            sar = sar.astype(float)
+            offshore = self.base_offshore
+
+            eo_p = np.hstack([day[self.unit_base] * unobstructed * visibility[:, self.unit_base],
+                              day * truck_util * visibility])
+            sar_p = np.hstack([sar[self.unit_base] * unobstructed,
+                               np.broadcast_to(sar * truck_util, visibility.shape)])
+            standoff_p = np.hstack([offshore[self.unit_base] * unobstructed,
+                                    np.broadcast_to(offshore * truck_util, visibility.shape)])
+
+            eo_tiles = np.sum(day) * math.floor(self.base_tiles)
+            sar_tiles = np.sum(sar) * math.floor(self.base_tiles)
+            standoff_tiles = sum(math.floor(self.base_tiles * vis) for vis in offshore if vis > 0)
+            return {
+                'EO': (eo_p, eo_tiles, day.any()),
+                'SAR': (sar_p, sar_tiles, sar.any()),
+                'Standoff': (standoff_p, standoff_tiles, (offshore > 0).any()),
+            }
+        else:
+            day = self.unit_sun.is_day(now).astype(float).reshape(R, -1)
+            sar = ((t - self.unit_sar_offsets) % c.sar_cadence_min < c.sar_duration_min)
+            # Trucks aren't tied to a TEL, so use the composite estimates.
+            truck_day = daylight_fraction(now, self.trucks[0])
+            truck_util = truck_utilization_fraction(c, truck_day)
+            truck_visibility = (1 * c.weather_probabilities[Weather.CLEAR] +
+                                c.cloudy_visibility * c.weather_probabilities[Weather.CLOUDY])
+            near_shore = self.near_shore.value_at(t).reshape(R, -1)
+
+            def with_trucks(unit_p, truck_p):
+                return np.hstack([unit_p, np.full((R, len(self.trucks)), truck_p)])
+
+            return {
+                'EO': (with_trucks(day * unobstructed * visibility,
+                                   truck_day * truck_util * truck_visibility),
+                       math.floor(c.satellite_tiles), True),
+                'SAR': (with_trucks(sar * unobstructed, c.sar_uptime * truck_util),
+                        math.floor(c.satellite_tiles * c.sar_uptime), True),
+                'Standoff': (with_trucks(near_shore * unobstructed,
+                                         c.offshore_observability * truck_util),
+                             math.floor(c.satellite_tiles * c.offshore_observability), True),
+            }
+
+    def _process(self, t):
+        c = self.c
+        now = self.to_datetime()
+
+        probabilities = self._imaging_probabilities(now)
+        for name, rng, analyzer in [('EO', self.eo_rng, self.eo_analyzer),
+                                    ('SAR', self.sar_rng, self.sar_analyzer),
+                                    ('Standoff', self.standoff_rng, self.standoff_analyzer)]:
+            p, tiles, has_obs = probabilities[name]
+            if has_obs:
+                counts = rng.binomial(n=self.tlo_multiplicity, p=p)
+                non_tlo = tiles - counts.sum(axis=1)
+            else:
+                counts = non_tlo = None
+            result = analyzer.analyze(counts, non_tlo, has_obs, t)
+            if result is not None:
+                detected, obs_t = result
+                self.last_obs_t = np.where(
+                    detected, np.maximum(self.last_obs_t, obs_t[:, None]), self.last_obs_t)
+
+        # SIGINT: each TEL not practicing EMCON gets one chance per hour to be detected.
+        minute_of_hour = (self.start_t.minute + t) % 60
+        columns = np.flatnonzero(self.sigint_offsets == minute_of_hour)
+        if len(columns):
+            detected = ((self.sigint_rng.random((self.replications, len(columns)))
+                         < c.sigint_hourly_detect_chance) & ~self.emcon[:, columns])
+            self.last_obs_t[:, columns] = np.where(detected, t, self.last_obs_t[:, columns])
+
+        # Ground sensors: one chance as a TEL leaves or arrives at base.
+        num_entered = np.count_nonzero(self.entered_gate)
+        if num_entered:
+            detected = (self.ground_rng.random(num_entered) <
+                        c.ground_sensor_positive_rates[TLOKind.TEL])
+            entered_t = self.last_obs_t[self.entered_gate]
+            self.last_obs_t[self.entered_gate] = np.where(detected, t, entered_t)
+
+        self.ts.append(t)
+        for r, stats in enumerate(self._assess(t)):
+            self.assessment_stats[r].append(stats)
+
+    def _roam_minutes(self, t):
+        """Total minutes each TEL has spent roaming between time 0 and t (which may be an
+        array), following its schedule."""
+        shifted = t - self.tel_offsets
+        loops, phase = np.divmod(shifted, self.loop_time)
+        return loops * self.roam_before_phase[-1] + self.roam_before_phase[phase]
+
+    def _assess(self, t):
+        """Vectorized equivalent of assessor.assess(), for every replication at once.
+
+        Returns:
+          A list with an AssessmentStats for each replication.
+        """
+        c = self.c
+        R, N = self.last_obs_t.shape
+        roam_time = self._roam_minutes(t) - self._roam_minutes(self.last_obs_t)
+        avg_roam_time = roam_time.mean(axis=1)
+
+        tel_state = self.state[:, self.tel_columns]
+        in_base = (tel_state == TELState.IN_BASE) | (tel_state == TELState.ARRIVING_BASE)
+
+        def destruction_area(extra_minutes):
+            roam_dist = c.tel_speed_kmph * ((roam_time + extra_minutes) / 60)
+            roam_area = math.pi * roam_dist**2
+            return np.where(in_base, -1, roam_area * c.destruction_area_factor)
+
+        # Ties are broken by TEL (file) index, as in assess().
+        order = np.argsort(destruction_area(0), axis=1, kind='stable')
+        areas = [destruction_area(flight_time) for flight_time in self.flight_times]
+        # (nuke, rank, replication) array of the area to destroy for the TEL of each rank.
+        sorted_areas = np.stack([np.take_along_axis(area, order, axis=1).T for area in areas])
+
+        numbers = np.tile([nuke.number for nuke in c.arsenal], (R, 1))
+        sorted_remaining = np.zeros((N, R), dtype=bool)
+        # TELs in base sort first, and are destroyed along with their base.
+        first_rank = in_base.sum(axis=1).min()
+        for rank in range(first_rank, N):
+            if (numbers < c.nukes_per_tel).all():
+                # Out of nukes everywhere: only the TELs in base are destroyed.
+                sorted_remaining[rank:] = sorted_areas[0, rank:] > 0
+                break
+            destroyed_km = np.zeros(R)
+            destroyed = np.zeros(R, dtype=bool)
+            for k, nuke in enumerate(c.arsenal):
+                km_to_destroy = sorted_areas[k, rank]
+                # Closed form of assess()'s loop which fires nukes of this type until the
+                # TEL is destroyed or they run out.
+                needed = np.where(~destroyed & (destroyed_km < km_to_destroy),
+                                  np.ceil((km_to_destroy - destroyed_km) / nuke.km2), 0)
+                used = np.minimum(needed, numbers[:, k] // c.nukes_per_tel).astype(np.int64)
+                numbers[:, k] -= used * c.nukes_per_tel
+                destroyed_km += used * nuke.km2
+                destroyed |= destroyed_km >= km_to_destroy
+            sorted_remaining[rank] = ~destroyed
+        remaining = np.zeros((R, N), dtype=bool)
+        np.put_along_axis(remaining, order, sorted_remaining.T, axis=1)
+
+        missiles_remaining = remaining.sum(axis=1)
+        mated_missiles_remaining = (remaining & self.mated).sum(axis=1)
+        retaliation_prob = self.retaliation_prob_by_count[mated_missiles_remaining]
+        area_sums = [area.sum(axis=1) for area in areas]
+        return [AssessmentStats(
+                    float(avg_roam_time[r]),
+                    {flight_time: float(area_sum[r])
+                     for flight_time, area_sum in zip(self.flight_times, area_sums)},
+                    int(missiles_remaining[r]),
+                    int(mated_missiles_remaining[r]),
+                    float(retaliation_prob[r]))
+                for r in range(R)]
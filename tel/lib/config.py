@@ -5,12 +5,19 @@ import math
 from typing import Optional, FrozenSet, List, Tuple, Dict
 
 from lib.enums import TELKind, TELState, TLOKind, Weather, SimulationMode, NukeType
+from lib.satellites import SatelliteConstellation
 
 tel_kinds_continental_us = frozenset({TELKind.DF_31A, TELKind.DF_31AG})
 tel_kinds_alaska_hawaii = tel_kinds_continental_us | frozenset({TELKind.DF_31})
 tel_kinds_guam = tel_kinds_alaska_hawaii | frozenset({TELKind.DF_26})
 tel_kinds_us_allies = tel_kinds_guam | frozenset({TELKind.DF_21AE})
 
+# Roughly the size of the commercial SAR constellations in orbit today: 24 satellites in
+# sun-synchronous orbits, which can image up to ~450 km to either side of their track.
+commercial_sar_constellation = SatelliteConstellation(
+    num_planes=6, satellites_per_plane=4, altitude_km=560, inclination_deg=97.7,
+    access_radius_km=450)
+
 @dataclass
 class DefaultConfig:
     # Print out verbose debugging information.
@@ -53,6 +60,18 @@ class DefaultConfig:
     
     # Files containing external data.
     bases_filename: str = 'data/tel_bases.csv'
+    # Optional edge list of a road network (see lib/road_network.py). If set, every TEL has
+    # an explicit position, and roaming TELs drive along the roads at tel_speed_kmph.
+    road_network_filename: Optional[str] = None
+    # How often the positions of roaming TELs are moved along the roads.
+    road_movement_interval: timedelta = timedelta(minutes=1)
+    # Optional population density raster (a .npy file of persons per km2, see
+    # lib/population.py). If set, trucks are spread over the raster's cells, each with its
+    # own daylight and weather, rather than being a single TLO per base.
+    population_raster_filename: Optional[str] = None
+    # (lat_min, lat_max, lon_min, lon_max) covered by the raster. Row 0 of the raster is
+    # the southern edge, and column 0 the western edge.
+    population_raster_bounds: Tuple[float, float, float, float] = (18, 54, 73, 135)
         
     output_dir: str = 'output/test'
         
@@ -65,6 +84,11 @@ class DefaultConfig:
         Weather.CLOUDY: .35,
         Weather.OVERCAST: .35,
     })
+    # Optional Markov chain for the weather. If set, maps each kind of weather to the
+    # probabilities of the weather after the next change, so that e.g. overcast spells
+    # can last longer than weather_change_frequency. Otherwise each change is drawn
+    # independently from weather_probabilities (which is always used for the initial weather).
+    weather_transition_probabilities: Optional[Dict[Weather, Dict[Weather, float]]] = None
     # Probability of observing a TEL with EO at a given moment in time when it's cloudy.
     cloudy_visibility: float = 0.5
    
@@ -95,6 +119,12 @@ class DefaultConfig:
     sar_cadence_min: int = 30
     # How long each SAR pass lasts (maintains visibility of a given point).
     sar_duration_min: int = 5
+    # Optional constellation of SAR satellites (see lib/satellites.py), such as
+    # commercial_sar_constellation. If set, each base (or, for free-roaming TELs, each
+    # sar_region_size_deg square of China) is in view of SAR whenever a satellite passes
+    # within range of it, instead of following sar_cadence_min and sar_duration_min.
+    sar_constellation: Optional[SatelliteConstellation] = None
+    sar_region_size_deg: float = 1
     
     # Chances that an image will be classified as a TEL by an ML algorithm or a human, respectively.
     # Defined for each kind of TLO, so it represents either a true positive or a false positive rate
@@ -116,6 +146,11 @@ class DefaultConfig:
     })
     human_examples_per_minute: float = 7800
         
+    # How often the intelligence process (observation, analysis and assessment) runs. Longer
+    # intervals are cheaper, and give the same statistics at the times assessed, except that
+    # imagery taken earlier in an interval uses the weather as of the end of the interval.
+    intelligence_interval: timedelta = timedelta(minutes=1)
+    
     # Probability (once per hour indendently for each TEL) to detect a TEL not practicing emissions control.
     sigint_hourly_detect_chance: float = 0.05
     
@@ -149,6 +184,24 @@ class DefaultConfig:
         
     # Increase China's number of TELs by this ratio.
     tel_count_multiplier: float = 1
+
+    # Optional early stopping. If set, maps metric names (AssessmentStats fields such as
+    # 'retaliation_prob', or raw.csv area columns such as 'area_to_destroy_12.4min') to
+    # target half-widths. The simulation then ends as soon as the 95% confidence interval
+    # of every listed metric's mean is at least that narrow, after discarding the warm-up
+    # period (chosen by the MSER-5 rule). Intervals come from the method of batch means.
+    convergence_targets: Optional[Dict[str, float]] = None
+    # How often to check for convergence, and how long to run before the first check.
+    # Runs always go on for at least convergence_num_batches batches.
+    convergence_check_interval: timedelta = timedelta(hours=1)
+    convergence_min_runtime: timedelta = timedelta(hours=6)
+    # Number of batches used for the batch means confidence interval, and the shortest
+    # a batch can be. Batches shorter than a day or a TEL schedule loop aren't fully
+    # independent, so the interval can be too narrow for metrics which follow those
+    # cycles. Setting convergence_min_batch to None makes every batch cover at least a
+    # day and a whole loop, at the cost of runs of several weeks.
+    convergence_num_batches: int = 10
+    convergence_min_batch: Optional[timedelta] = timedelta(hours=2)
         
     def __post_init__(self):
         satellite_tiles_per_km2 = self.road_km_per_km2 * self.satellite_tiles_per_road_km
@@ -177,11 +230,11 @@ class DefaultConfig:
 
             self.satellite_tiles_per_base = self.tel_area_km2 * satellite_tiles_per_km2
 
-            # Number of heavy trucks per person on average.
-            self.trucks_per_person = self.trucks_in_china / self.population_of_china
-
         elif self.simulation_mode == SimulationMode.FREE_ROAMING:
             self.satellite_tiles = satellite_tiles_per_km2 * self.area_of_china_km2
+
+        # Number of heavy trucks per person on average.
+        self.trucks_per_person = self.trucks_in_china / self.population_of_china
         
         # Percentage of time a given location is visible from SAR satellites.
         self.sar_uptime = self.sar_duration_min / self.sar_cadence_min
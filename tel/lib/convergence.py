@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+import math
+from types import SimpleNamespace
+
+import numpy as np
+
+from lib.config import MediumAlert
+from lib.time import to_minutes
+
+# Two-sided 95% critical values of Student's t distribution, by degrees of freedom.
+# Beyond the table the normal approximation is close enough.
+T_CRITICAL_95 = [
+    None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+AREA_METRIC_PREFIX = 'area_to_destroy_'
+
+# Shortest batch (in simulated minutes) for batch means, if the config doesn't set one.
+# The assessments follow the daily daylight cycle and the TEL schedule loop, so shorter
+# batches aren't fully independent.
+CYCLE_BATCH_MINUTES = 24 * 60
+
+@dataclass
+class ConvergenceResult:
+    metric: str
+    # Target half-width of the confidence interval.
+    target: float
+    # Number of minutes dropped from the start of the run as warm-up.
+    warmup_minutes: int
+    mean: float
+    # Half-width of the 95% confidence interval for the mean. Infinite if there aren't
+    # enough samples to compute it yet.
+    half_width: float
+
+    @property
+    def converged(self):
+        return self.half_width <= self.target
+
+    def summary(self):
+        return '{}: {:,.4f} +/- {:,.4f} (target {:,.4f}), after discarding {} minutes of warm-up.'.format(
+            self.metric, self.mean, self.half_width, self.target, self.warmup_minutes)
+
+def metric_value(stats, metric):
+    """Look up a metric in an AssessmentStats.
+
+    Args:
+      stats: An AssessmentStats.
+      metric: The name of one of its fields, or 'area_to_destroy_<minutes>min' for one
+        entry of area_to_destroy_by_time (the same names as the columns of raw.csv).
+    """
+    if metric.startswith(AREA_METRIC_PREFIX) and metric.endswith('min'):
+        flight_time = float(metric[len(AREA_METRIC_PREFIX):-len('min')])
+        return stats.area_to_destroy_by_time[flight_time]
+    if metric == 'area_to_destroy_by_time' or not hasattr(stats, metric):
+        raise ValueError('Unknown convergence metric {}.'.format(metric))
+    return getattr(stats, metric)
+
+def mser_truncation(x, batch_size=5):
+    """Number of initial samples to discard as warm-up, by the MSER-5 rule.
+
+    The series is averaged in batches of batch_size, and the cut is placed (in the first
+    half of the series) where the standard error of the mean of what remains is
+    smallest.
+    """
+    n = len(x) // batch_size
+    if n < 2:
+        return 0
+    y = np.asarray(x[:n * batch_size], dtype=float).reshape(n, batch_size).mean(axis=1)
+    # Sums of y[d:] and y[d:]**2 for every cut d.
+    sums = np.cumsum(y[::-1])[::-1]
+    sums_sq = np.cumsum(y[::-1]**2)[::-1]
+    counts = n - np.arange(n)
+    sse = np.maximum(sums_sq - sums**2 / counts, 0)
+    mser = sse / counts**2
+    return int(np.argmin(mser[:n // 2 + 1])) * batch_size
+
+def batch_means_interval(x, num_batches, min_batch_size=1):
+    """Mean and 95% confidence interval half-width of a correlated series, by the method
+    of batch means. The oldest samples are dropped if the series doesn't divide evenly.
+
+    Args:
+      x: The series.
+      num_batches: Number of batches to split it into.
+      min_batch_size: Fewest samples in a batch. Batches must be long enough for their
+        means to be close to independent, e.g. at least one period of a periodic series.
+    Returns:
+      (mean, half_width). half_width is infinite if there are fewer than num_batches
+      batches of min_batch_size samples.
+    """
+    batch_size = len(x) // num_batches
+    if num_batches < 2 or batch_size < max(min_batch_size, 1):
+        return (float(np.mean(x)) if len(x) else math.nan), math.inf
+    x = np.asarray(x[len(x) - batch_size * num_batches:], dtype=float)
+    means = x.reshape(num_batches, batch_size).mean(axis=1)
+    dof = num_batches - 1
+    t = T_CRITICAL_95[dof] if dof < len(T_CRITICAL_95) else 1.96
+    return float(means.mean()), t * float(means.std(ddof=1)) / math.sqrt(num_batches)
+
+def batch_minutes(c, loop_time):
+    """Shortest batch (in minutes) for batch means: c.convergence_min_batch, or if that
+    isn't set, a day or the TEL schedule loop time, whichever is longer."""
+    if c.convergence_min_batch is not None:
+        return to_minutes(c.convergence_min_batch)
+    return max(loop_time, CYCLE_BATCH_MINUTES)
+
+def min_convergence_minutes(c, loop_time):
+    """How long a simulation must run before it can possibly have converged."""
+    return max(to_minutes(c.convergence_min_runtime),
+               c.convergence_num_batches * batch_minutes(c, loop_time))
+
+def check_convergence(c, ts, assessment_stats, loop_time):
+    """Check whether the assessment stream has converged.
+
+    Args:
+      c: Config object, with convergence_targets set.
+      ts: Simulation time (minutes since start) of each assessment.
+      assessment_stats: List of AssessmentStats.
+      loop_time: Length of the TEL schedule loop, in minutes.
+    Returns:
+      A list with a ConvergenceResult for each metric in c.convergence_targets.
+    """
+    min_batch_size = math.ceil(batch_minutes(c, loop_time) /
+                               to_minutes(c.intelligence_interval))
+    results = []
+    for metric, target in c.convergence_targets.items():
+        x = [metric_value(stats, metric) for stats in assessment_stats]
+        cut = mser_truncation(x)
+        mean, half_width = batch_means_interval(x[cut:], c.convergence_num_batches,
+                                                min_batch_size)
+        warmup_minutes = ts[cut] - ts[0] if cut < len(ts) else 0
+        results.append(ConvergenceResult(metric, target, warmup_minutes, mean, half_width))
+    return results
+
+# Tests
+_rng = np.random.default_rng(0)
+_x = np.concatenate([np.linspace(10, 1, 100), _rng.normal(1, .1, 900)])
+assert 90 <= mser_truncation(_x) <= 110
+_mean, _half_width = batch_means_interval(_x[100:], 20)
+assert abs(_mean - 1) < _half_width < .05
+assert batch_means_interval([1, 2], 20)[1] == math.inf
+# A periodic series doesn't converge until there are enough whole periods.
+_x = np.sin(np.arange(1000) * 2 * math.pi / 100)
+assert batch_means_interval(_x[:100], 20, min_batch_size=100)[1] == math.inf
+assert batch_means_interval(_x, 5, min_batch_size=100)[1] < .01
+# With the default batch settings, a series which has settled down stops within a day.
+_c = MediumAlert(convergence_targets={'retaliation_prob': .01})
+_stats = [SimpleNamespace(retaliation_prob=p) for p in _rng.normal(.2, .05, 24 * 60)]
+assert min_convergence_minutes(_c, loop_time=1280) <= 20 * 60
+assert check_convergence(_c, list(range(24 * 60)), _stats, loop_time=1280)[0].converged
+_c.convergence_min_batch = None
+assert not check_convergence(_c, list(range(24 * 60)), _stats, loop_time=1280)[0].converged
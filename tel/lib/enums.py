@@ -53,4 +53,4 @@ class NukeType:
     name: str
     flight_time: timedelta
     number: int
-    km2: float
\ No newline at end of file
+    km2: float
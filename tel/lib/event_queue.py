@@ -0,0 +1,246 @@
+from heapq import heapify, heappop, heappush
+
+# Number of one-minute slots in the wheel. Three days comfortably covers the longest
+# TEL schedule loop in the configs (32 hours at low alert), so in practice only events
+# scheduled unusually far ahead (or off the minute grid) end up in the overflow heap.
+DEFAULT_WHEEL_MINUTES = 3 * 24 * 60
+
+# Cancelled events are left in the queue as tombstones and skipped when popped. Once they
+# make up more than half of the queue (and there are at least this many), the queue is
+# compacted to reclaim the space.
+MIN_CANCELLED_TO_COMPACT = 1024
+
+class Event:
+    """A single scheduled event.
+
+    The Event is also the handle returned when the event is scheduled, and can be used
+    to cancel it. Cancelling is cheap: the event is only marked as cancelled, and is
+    skipped when it reaches the front of the queue. Cancelling an event which has
+    already happened has no effect.
+    """
+    __slots__ = ('func', 'queue', 'cancelled')
+
+    def __init__(self, func):
+        """
+        Args:
+          func: A lambda (with no arguments) that resolves the effects of the event.
+        """
+        self.func = func
+        # The EventQueue the event is waiting in, or None once it has been popped.
+        self.queue = None
+        self.cancelled = False
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            if self.queue is not None:
+                self.queue.note_cancelled()
+
+class PeriodicEvent(Event):
+    """An event which repeats on a fixed interval.
+
+    Rather than creating a new event each time it fires, the simulation pushes the same
+    PeriodicEvent back onto the queue. Several callbacks with the same schedule can share
+    one PeriodicEvent, in which case they are resolved together (in the order they were
+    added) as a single queue entry.
+    """
+    __slots__ = ('callbacks', 'next_t', 'interval', 'end_t')
+
+    def __init__(self, callback, first_t, interval, end_t=None):
+        """
+        Args:
+          callback: A lambda (with no arguments) to call each time the event fires.
+          first_t: Time of the first occurrence, in minutes since the start of the simulation.
+          interval: Minutes between occurrences.
+          end_t: Optional time after which the event no longer repeats.
+        """
+        super().__init__(None)
+        self.callbacks = [callback]
+        self.next_t = first_t
+        self.interval = interval
+        self.end_t = end_t
+
+    def add(self, callback):
+        """Add a callback to this event.
+
+        Returns:
+          A handle which can be used to cancel just this callback.
+        """
+        self.callbacks.append(callback)
+        return BatchedEventHandle(self, callback)
+
+class BatchedEventHandle:
+    """Handle for one callback sharing a PeriodicEvent with others."""
+    __slots__ = ('periodic', 'callback')
+
+    def __init__(self, periodic, callback):
+        self.periodic = periodic
+        self.callback = callback
+
+    def cancel(self):
+        # Replace the list rather than modifying it, in case the event is in the middle
+        # of firing. The cancellation then takes effect from the next occurrence.
+        callbacks = [c for c in self.periodic.callbacks if c is not self.callback]
+        self.periodic.callbacks = callbacks
+        if not callbacks:
+            self.periodic.cancel()
+
+class EventQueue:
+    """A calendar queue (time wheel) of simulation events.
+
+    Almost every event in the simulation happens on a whole minute, so events are
+    bucketed into a ring of one-minute slots, and each slot is a plain list kept in
+    enqueue order. Pushing an event is an append, and popping one is an index into
+    the current slot, so no time comparisons are needed on the fast path.
+
+    Events that fall between minutes, or further in the future than the wheel covers,
+    are kept in an overflow heap and merged in as the wheel advances. Events are
+    always returned in (time, enqueue order) order, the same guarantee as a heap of
+    (time, event_id, event) tuples.
+
+    Times are numbers (minutes since the start of the simulation). The queue never
+    moves backwards, so events must not be pushed earlier than the last popped time.
+    """
+
+    def __init__(self, wheel_minutes=DEFAULT_WHEEL_MINUTES):
+        self.wheel_minutes = wheel_minutes
+        self.slots = [[] for _ in range(wheel_minutes)]
+        # Heap of (time, event_id, event) for events that don't fit on the wheel.
+        self.overflow = []
+        # The minute the wheel is currently draining, and the index of the next event
+        # in that minute's slot.
+        self.minute = 0
+        self.pos = 0
+        self.wheel_count = 0
+        self.next_event_id = 0
+        # Approximate number of cancelled events still in the queue.
+        self.num_cancelled = 0
+
+    def __len__(self):
+        return self.wheel_count + len(self.overflow)
+
+    def push(self, t, event):
+        """Add an event to the queue.
+
+        Args:
+          t: Time of the event, in minutes since the start of the simulation.
+          event: An Event (or PeriodicEvent).
+        """
+        event.queue = self
+        event_id = self.next_event_id
+        self.next_event_id += 1
+
+        minute = int(t)
+        if minute == t and self.minute <= minute < self.minute + self.wheel_minutes:
+            self.slots[minute % self.wheel_minutes].append((event_id, event))
+            self.wheel_count += 1
+        else:
+            heappush(self.overflow, (t, event_id, event))
+
+    def pop(self, until=None):
+        """Remove and return the earliest event in the queue which hasn't been cancelled.
+
+        Args:
+          until: Optional time. If the earliest event is later than this, it is left in
+            the queue and None is returned.
+        Returns:
+          A (t, event) tuple, or None if there is no such event.
+        """
+        overflow = self.overflow
+        while True:
+            while self.wheel_count > 0:
+                slot = self.slots[self.minute % self.wheel_minutes]
+                if self.pos < len(slot):
+                    event_id, event = slot[self.pos]
+                    if overflow and (overflow[0][0], overflow[0][1]) < (self.minute, event_id):
+                        break
+                    if event.cancelled:
+                        self.pos += 1
+                        self.wheel_count -= 1
+                        self._discard_cancelled(event)
+                        continue
+                    if until is not None and self.minute > until:
+                        return None
+                    self.pos += 1
+                    self.wheel_count -= 1
+                    event.queue = None
+                    return self.minute, event
+
+                # This minute is drained. Anything left in the overflow heap before the next
+                # minute has to come out before the wheel advances.
+                if overflow and overflow[0][0] < self.minute + 1:
+                    break
+                slot.clear()
+                self.pos = 0
+                self.minute += 1
+
+            if not overflow:
+                return None
+            t, _, event = overflow[0]
+            if event.cancelled:
+                heappop(overflow)
+                self._discard_cancelled(event)
+                continue
+            if until is not None and t > until:
+                return None
+            heappop(overflow)
+            if self.wheel_count == 0 and t >= self.minute + 1:
+                # The wheel is empty, so jump it straight to the overflow event rather than
+                # stepping through the empty minutes in between.
+                self.slots[self.minute % self.wheel_minutes].clear()
+                self.pos = 0
+                self.minute = int(t)
+            event.queue = None
+            return t, event
+
+    def _discard_cancelled(self, event):
+        event.queue = None
+        if self.num_cancelled > 0:
+            self.num_cancelled -= 1
+
+    def note_cancelled(self):
+        """Record that an event still waiting in the queue was cancelled, compacting the
+        queue if cancelled events now make up most of it."""
+        self.num_cancelled += 1
+        if (self.num_cancelled >= MIN_CANCELLED_TO_COMPACT and
+                2 * self.num_cancelled > len(self)):
+            self.compact()
+
+    def compact(self):
+        """Remove all cancelled events from the queue."""
+        current = self.minute % self.wheel_minutes
+        wheel_count = 0
+        for i, slot in enumerate(self.slots):
+            if i == current:
+                slot[:] = [entry for entry in slot[self.pos:] if not entry[1].cancelled]
+                self.pos = 0
+            elif slot:
+                slot[:] = [entry for entry in slot if not entry[1].cancelled]
+            wheel_count += len(slot)
+        self.wheel_count = wheel_count
+        self.overflow = [entry for entry in self.overflow if not entry[2].cancelled]
+        heapify(self.overflow)
+        self.num_cancelled = 0
+
+# Tests
+_q = EventQueue(wheel_minutes=4)
+_events = {name: Event(name) for name in 'abcdefgh'}
+for _t, _e in [(2, 'a'), (0.5, 'b'), (2, 'c'), (10, 'd'), (0, 'e'), (2.0, 'f'), (3, 'h')]:
+    _q.push(_t, _events[_e])
+assert [_q.pop()[1].func for _ in range(3)] == ['e', 'b', 'a']
+_q.push(2, _events['g'])
+_events['f'].cancel()
+_events['h'].cancel()
+assert [(_t, _e.func) for _t, _e in [_q.pop() for _ in range(3)]] == [(2, 'c'), (2, 'g'), (10, 'd')]
+assert _q.pop() is None
+_q.push(12, _events['a'])
+assert _q.pop(until=11) is None
+assert _q.pop(until=12)[1].func == 'a'
+# Cancelling an event which has already been popped doesn't count as a tombstone.
+_q = EventQueue(wheel_minutes=4)
+_q.push(1, _events['b'])
+_q.pop()[1].cancel()
+assert _q.num_cancelled == 0
+_q.push(2, _events['c'])
+_events['c'].cancel()
+assert _q.num_cancelled == 1 and _q.pop() is None and _q.num_cancelled == 0
@@ -0,0 +1,121 @@
+from collections import Counter
+import csv
+import os
+
+import numpy as np
+
+from lib.enums import TELKind, TLOKind, SimulationMode
+from lib.rng import stable_hash
+
+# Config fields which affect what is loaded from the bases file. (Fields only set for
+# one simulation mode count as None in the other.)
+LOAD_FIELDS = ('simulation_mode', 'tel_kinds', 'tel_count_multiplier', 'decoy_ratio',
+               'secret_decoy_ratio', 'trucks_per_person', 'tel_area_km2', 'trucks_in_china')
+
+# Cache of FleetTemplates, keyed by (bases file path, its modification time, LOAD_FIELDS).
+_templates = {}
+
+class FleetTemplate:
+    """Everything loaded from a TEL bases file which is the same in every run: the bases,
+    and the kind, base and name of every TEL and decoy.
+
+    Templates are read once per file and config (see fleet_template()) and are never
+    modified, so that every simulation loading the same file can share one. Anything
+    random (schedule offsets, mating, locations of free-roaming TELs) is drawn when a
+    TELFleet is loaded from the template.
+
+    Per-TEL data is stored as read-only arrays, in the order the TELs were listed in the
+    file (which is also the order of their uids).
+    """
+    def __init__(self, c):
+        """Read c.bases_filename.
+
+        Args:
+          c: Config object.
+        """
+        self.free_roaming = c.simulation_mode != SimulationMode.BASE_LOCAL
+        # Bases (with at least one TEL), for Base Local mode.
+        self.base_names = []
+        self.base_lat = []
+        self.base_lon = []
+        self.base_offshore = []
+        self.base_trucks = []
+        # Names of the rows of the file the TELs came from, used to name the TELs.
+        self.group_names = []
+        columns = {name: [] for name in ('group', 'number', 'kind', 'tlo_kind', 'base')}
+        count_by_kind = Counter()
+
+        with open(c.bases_filename) as csvfile:
+            for row in csv.DictReader(csvfile):
+                group = len(self.group_names)
+                base = -1 if self.free_roaming else len(self.base_names)
+                num_units = len(columns['group'])
+                for tel_kind in TELKind:
+                    if c.tel_kinds is not None and tel_kind not in c.tel_kinds:
+                        continue
+                    if tel_kind.name not in row:
+                        print("No column for {} in TEL base csv file".format(tel_kind.name))
+                        continue
+
+                    num_tels = round(c.tel_count_multiplier * int(row[tel_kind.name]))
+                    for tlo_kind, count in (
+                            (TLOKind.TEL, num_tels),
+                            (TLOKind.DECOY, int(c.decoy_ratio * num_tels)),
+                            (TLOKind.SECRET_DECOY, int(c.secret_decoy_ratio * num_tels))):
+                        for _ in range(count):
+                            columns['group'].append(group)
+                            columns['number'].append(count_by_kind[(row['name'], tlo_kind, tel_kind)])
+                            count_by_kind[(row['name'], tlo_kind, tel_kind)] += 1
+                            columns['kind'].append(int(tel_kind))
+                            columns['tlo_kind'].append(int(tlo_kind))
+                            columns['base'].append(base)
+
+                if self.free_roaming:
+                    self.group_names.append(row['name'])
+                elif len(columns['group']) > num_units:
+                    # Bases without any TELs are skipped.
+                    self.group_names.append(row['name'])
+                    self.base_names.append(row['name'])
+                    self.base_lat.append(float(row['latitude']))
+                    self.base_lon.append(float(row['longitude']))
+                    self.base_offshore.append(float(row['offshore_observability']))
+                    self.base_trucks.append(c.trucks_per_person * float(row['population_density']) *
+                                            c.tel_area_km2)
+        self.trucks_in_china = c.trucks_in_china
+
+        self.group = self._column(columns['group'], np.int32)
+        self.number = self._column(columns['number'], np.int32)
+        self.kind = self._column(columns['kind'], np.int8)
+        self.tlo_kind = self._column(columns['tlo_kind'], np.int8)
+        self.base = self._column(columns['base'], np.int32)
+        self.tlo_kinds = [TLOKind(kind) for kind in columns['tlo_kind']]
+        names = [self.name(i) for i in range(self.size)]
+        self.sigint_hash = self._column([stable_hash(name + 'SIGINT') for name in names], np.int64)
+        self.sar_hash = self._column([stable_hash(name + 'SAR') for name in names], np.int64)
+
+    @staticmethod
+    def _column(values, dtype):
+        column = np.array(values, dtype=dtype)
+        column.setflags(write=False)
+        return column
+
+    @property
+    def size(self):
+        return len(self.group)
+
+    def name(self, i):
+        """Human readable name of TEL i."""
+        return '{}_{}_{}_{}'.format(self.group_names[self.group[i]],
+                                    TLOKind(self.tlo_kind[i]).name,
+                                    TELKind(self.kind[i]).name, self.number[i])
+
+def fleet_template(c):
+    """The FleetTemplate for the config's bases file, read only the first time it's needed
+    (or if the file has changed since)."""
+    path = os.path.abspath(c.bases_filename)
+    key = (path, os.path.getmtime(path), tuple(getattr(c, name, None) for name in LOAD_FIELDS))
+    template = _templates.get(key)
+    if template is None:
+        template = FleetTemplate(c)
+        _templates[key] = template
+    return template
@@ -1,63 +1,107 @@
 from collections import defaultdict, namedtuple, Counter
 from datetime import timedelta
+from functools import partial
 
 from lib.enums import DetectionMethod
-from lib.observer import EOObserver, SARObserver, StandoffObserver, SigIntObserver, GroundSensorObserver
+from lib.intelligence_types import ObservationBatch
+from lib.observer import (EOObserver, SARObserver, StandoffObserver, SigIntObserver,
+                          GroundSensorObserver, ImagingTargets)
 from lib.analyzer import ImageryAnalyzer, PassthroughAnalyzer
 from lib.tracker import PerfectTracker, RealisticTracker
 from lib.assessor import assess
+from lib.time import to_minutes
 
 class Intelligence:
     """Class representing US intelligence efforts to locate TELs."""
-    def __init__(self, c):
+    def __init__(self, c, rng):
+        """
+        Args:
+          c: Config object.
+          rng: The simulation's RandomStreams. Each observer and analyzer gets its own stream.
+        """
         self.c = c
-        self.eo_observer = EOObserver(c)
-        self.eo_analyzer = ImageryAnalyzer(c, "EO")
-        self.sar_observer = SARObserver(c)
-        self.sar_analyzer = ImageryAnalyzer(c, "SAR")
-        self.standoff_observer = StandoffObserver(c)
-        self.standoff_analyzer = ImageryAnalyzer(c, "Standoff")
-        self.sigint_observer = SigIntObserver(c)
-        self.sigint_analyzer = PassthroughAnalyzer(c)
-        self.ground_observer = GroundSensorObserver(c)
-        self.ground_analyzer = PassthroughAnalyzer(c)
+        self.eo_observer = EOObserver(c, rng.get('EO observer'))
+        self.eo_analyzer = ImageryAnalyzer(c, rng.get('EO analyzer'), "EO")
+        self.sar_observer = SARObserver(c, rng.get('SAR observer'))
+        self.sar_analyzer = ImageryAnalyzer(c, rng.get('SAR analyzer'), "SAR")
+        self.standoff_observer = StandoffObserver(c, rng.get('Standoff observer'))
+        self.standoff_analyzer = ImageryAnalyzer(c, rng.get('Standoff analyzer'), "Standoff")
+        self.sigint_observer = SigIntObserver(c, rng.get('SIGINT observer'))
+        self.sigint_analyzer = PassthroughAnalyzer(c, rng.get('SIGINT analyzer'))
+        self.ground_observer = GroundSensorObserver(c, rng.get('Ground sensor observer'))
+        self.ground_analyzer = PassthroughAnalyzer(c, rng.get('Ground sensor analyzer'))
         self.perfect_tracker = PerfectTracker(c)
         self.realistic_tracker = RealisticTracker(c)
         
         self.ts = []
         self.assessment_stats = []
+        # Time of the previous intelligence tick, and the number of ticks so far.
+        self.last_t = None
+        self.num_ticks = 0
+        self.interval = to_minutes(c.intelligence_interval)
+        self.tick_rng = rng.get('Intelligence ticks')
+        self.imaging = [
+            (self.eo_observer, self.eo_analyzer),
+            (self.sar_observer, self.sar_analyzer),
+            (self.standoff_observer, self.standoff_analyzer),
+        ]
     
     def start(self, s):
-        s.schedule_event_relative(lambda: self.process(s), timedelta(),
-                                  repeat_interval=timedelta(minutes=1))
+        if self.interval == 1:
+            s.schedule_event_relative(partial(self.process, s), timedelta(),
+                                      repeat_interval=self.c.intelligence_interval)
+        else:
+            s.schedule_event_relative(partial(self.process, s), timedelta())
+        targets = ImagingTargets(s)
+        for observer, _ in self.imaging:
+            observer.start(targets)
+        self.sigint_observer.start(s)
+        self.ground_observer.start(s)
         self.perfect_tracker.start(s)
         self.realistic_tracker.start(s)
     
     def process(self, s):
+        # ObservationBatches from every pipeline, joined once for the trackers.
         all_obs = []
-
-        raw_eo_obs = self.eo_observer.observe(s)
-        analyzed_eo_obs = self.eo_analyzer.analyze(raw_eo_obs, s.t)
-        all_obs += analyzed_eo_obs
-        
-        raw_sar_obs = self.sar_observer.observe(s)
-        analyzed_sar_obs = self.sar_analyzer.analyze(raw_sar_obs, s.t)
-        all_obs += analyzed_sar_obs
+        # Each tick covers the minutes since the previous one.
+        t0 = s.t if self.last_t is None else self.last_t + 1
+        t1 = s.t
+        self.last_t = s.t
         
-        raw_standoff_obs = self.standoff_observer.observe(s)
-        analyzed_standoff_obs = self.standoff_analyzer.analyze(raw_standoff_obs, s.t)
-        all_obs += analyzed_standoff_obs
+        # The imagery pipelines are stepped through every minute of the interval, which
+        # is cheap, since observers are only asked for a snapshot in the minutes when
+        # ML processing is free to pick it up.
+        for t in range(t0, t1 + 1):
+            for observer, analyzer in self.imaging:
+                if analyzer.wants_observations(t):
+                    raw_obs = observer.observe(s, t, t)
+                else:
+                    raw_obs = ObservationBatch.empty()
+                all_obs.append(analyzer.analyze(raw_obs, t))
         
-        raw_sigint_obs = self.sigint_observer.observe(s)
-        analyzed_sigint_obs = self.sigint_analyzer.analyze(raw_sigint_obs, s.t)
-        all_obs += analyzed_sigint_obs
+        raw_sigint_obs = self.sigint_observer.observe(s, t0, t1)
+        analyzed_sigint_obs = self.sigint_analyzer.analyze(raw_sigint_obs, t1)
+        all_obs.append(analyzed_sigint_obs)
         
-        raw_ground_obs = self.ground_observer.observe(s)
-        analyzed_ground_obs = self.ground_analyzer.analyze(raw_ground_obs, s.t)
-        all_obs += analyzed_ground_obs
+        raw_ground_obs = self.ground_observer.observe(s, t0, t1)
+        analyzed_ground_obs = self.ground_analyzer.analyze(raw_ground_obs, t1)
+        all_obs.append(analyzed_ground_obs)
         
+        all_obs = ObservationBatch.concatenate(all_obs)
         self.perfect_tracker.assign_observations(all_obs)
         self.realistic_tracker.assign_observations(all_obs)
         
         self.ts.append(s.t)
-        self.assessment_stats.append(assess(self.c, s.t, self.perfect_tracker.files))
\ No newline at end of file
+        self.assessment_stats.append(assess(self.c, s.t, self.perfect_tracker))
+        
+        self.num_ticks += 1
+        if self.interval != 1:
+            self._schedule_next_tick(s)
+    
+    def _schedule_next_tick(self, s):
+        # Tick n happens at a random minute in [n*interval, (n+1)*interval), rather than
+        # exactly on the interval. Otherwise the assessments could stay in step with
+        # periodic parts of the simulation (such as the imagery pipelines' ML batches),
+        # and not be a fair sample of the minute-by-minute results.
+        t = self.num_ticks * self.interval + int(self.tick_rng.integers(self.interval))
+        s.schedule_event_relative(partial(self.process, s), timedelta(minutes=t - s.t))
@@ -1,96 +1,281 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from datetime import datetime
 from typing import TYPE_CHECKING, Optional, List
-from uuid import uuid4
 
-from numpy import random
+import numpy as np
 
 from lib.enums import TLOKind, TELState, DetectionMethod
 if TYPE_CHECKING:
     from lib.tel_base import TELBase
     from lib.tel import TEL
 
-@dataclass(frozen=True)
-class TLO:   
-    kind: TLOKind
-        
-    # A unique identifier. If kind=TEL, is equal to the TEL’s unique ID.
-    # Only set for TRUCK objects if they are being tracked by the US.
-    uid: Optional[int] = None
-      
-    # Convenience pointer to the corresponding TEL object, if applicable.
-    tel: Optional[TEL] = None
-    
-    # Pointer to the base the TLO is associated with. Each base is populated
-    # with a number of TLOs based on how many trucks etc. are in that area
-    # of China.
-    base: Optional[TELBase] = None
-        
-    # How many real-world objects this Python object represents. Is used to
-    # let one Python object represent e.g. 100,000 trucks in the Xinjiang
-    # region. When > 1,  this TLO does not have a unique ID.
-    multiplicity: int = 1
-        
-    # Hacky implementation using object.__setattr__() is necessary, because
-    # frozen=True prevents setting attributes normally.
-    def __init__(self, kind, tel=None, uid=None, base=None, multiplicity=1):
-        object.__setattr__(self, 'kind', kind)
-        object.__setattr__(self, 'tel', tel)
-        if multiplicity == 1 and uid is None:
-            object.__setattr__(self, 'uid', uuid4().int)
-        else:
-            object.__setattr__(self, 'uid', uid)   
-        object.__setattr__(self, 'base', base)
-        object.__setattr__(self, 'multiplicity', multiplicity)
-        
+class IdAllocator:
+    """Hands out unique IDs for the objects in one simulation (TELs, tracked TLOs).
+
+    IDs are small integers counting up from 0, which are much cheaper to store, hash and
+    compare than random UUIDs, and are the same from run to run.
+    """
+    __slots__ = ('next_id',)
+
+    def __init__(self):
+        self.next_id = 0
+
+    def allocate(self):
+        uid = self.next_id
+        self.next_id += 1
+        return uid
+
+    def allocate_range(self, n):
+        """Allocate n consecutive IDs, returned as an array."""
+        uids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+        self.next_id += n
+        return uids
+
+class TLO:
+    """A TEL-Like-Object. TLOs are immutable."""
+    __slots__ = ('kind', 'uid', 'tel', 'base', 'multiplicity')
+
+    def __init__(self, kind, tel=None, uid=None, base=None, multiplicity=1, ids=None):
+        """
+        Args:
+          kind: A TLOKind.
+          tel: Convenience pointer to the corresponding TEL object, if applicable.
+          uid: A unique identifier. If kind=TEL, is equal to the TEL's unique ID.
+            Only set for TRUCK objects if they are being tracked by the US.
+          base: Pointer to the base the TLO is associated with. Each base is populated
+            with a number of TLOs based on how many trucks etc. are in that area
+            of China.
+          multiplicity: How many real-world objects this Python object represents. Is
+            used to let one Python object represent e.g. 100,000 trucks in the Xinjiang
+            region. When > 1, this TLO does not have a unique ID.
+          ids: The simulation's IdAllocator. If given, a TLO with multiplicity 1 and no
+            uid gets a new ID from it.
+        """
+        if multiplicity == 1 and uid is None and ids is not None:
+            uid = ids.allocate()
+        self.kind = kind
+        self.tel = tel
+        self.uid = uid
+        self.base = base
+        self.multiplicity = multiplicity
+
+    def __repr__(self):
+        return 'TLO(kind={}, uid={}, multiplicity={})'.format(
+            self.kind.name, self.uid, self.multiplicity)
+
     def observe(self, t, method, multiplicity):
-        """Create an Observation corresponding to this TLO."""
-        state = self.tel.state if self.tel is not None else None
-        return Observation(t=t, method=method, uid=self.uid,
-                           state=state, tlo_kind=self.kind, multiplicity=multiplicity)
-
-# Observations are immutable, and are ordered by their associated time. So,
-# a list of observations can be put in chronological order by sorting.
-@dataclass(frozen=True, order=True)
+        """Create an Observation corresponding to this TLO, as seen at time t."""
+        state = self.tel.state_at(t) if self.tel is not None else None
+        return Observation(t, method, self.uid, state, self.kind, multiplicity)
+
 class Observation:
-    # Timestamp of when the observation occurred.
-    t: datetime 
-    method: DetectionMethod
-        
-    # If set, the uid of the TLO this observation corresponds to.
-    # If None, then this observation does not correspond to a TLO.
-    uid: Optional[int] = None
-        
-    # State of the observed TEL, if applicable.
-    state: Optional[TELState] = None
-        
-    # Kind of the corresponding TLO, if applicable.
-    tlo_kind: TLOKind = None
-    
-    # How many individual observations this Observation object corresponds to.
-    multiplicity: int = 1
-        
-    def sample(self, p):
-        """Return a copy of this observation, with multiplicity adjusted according to p, or None."""
-        multiplicity = random.binomial(n=self.multiplicity, p=p)
-        if multiplicity > 0:
-            return Observation(t=self.t, method=self.method, uid=self.uid, state=self.state,
-                               tlo_kind=self.tlo_kind, multiplicity=multiplicity)
-        else:
-            return None
-
-@dataclass
+    """A piece of intelligence, collected at a single time.
+
+    Observations are immutable, and are ordered by their associated time. So, a list of
+    observations can be put in chronological order by sorting.
+    """
+    __slots__ = ('t', 'method', 'uid', 'state', 'tlo_kind', 'multiplicity')
+
+    def __init__(self, t, method, uid=None, state=None, tlo_kind=None, multiplicity=1):
+        """
+        Args:
+          t: Simulation time (minutes since start) when the observation occurred.
+          method: The DetectionMethod.
+          uid: If set, the uid of the TLO this observation corresponds to. If None, then
+            this observation does not correspond to a TLO.
+          state: State of the observed TEL, if applicable.
+          tlo_kind: Kind of the corresponding TLO, if applicable.
+          multiplicity: How many individual observations this Observation object
+            corresponds to.
+        """
+        self.t = t
+        self.method = method
+        self.uid = uid
+        self.state = state
+        self.tlo_kind = tlo_kind
+        self.multiplicity = multiplicity
+
+    def __lt__(self, other):
+        return self.t < other.t
+
+    def __le__(self, other):
+        return self.t <= other.t
+
+    def __gt__(self, other):
+        return self.t > other.t
+
+    def __ge__(self, other):
+        return self.t >= other.t
+
+    def _key(self):
+        return (self.t, self.method, self.uid, self.state, self.tlo_kind, self.multiplicity)
+
+    def __eq__(self, other):
+        return isinstance(other, Observation) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return 'Observation(t={}, method={}, uid={}, state={}, tlo_kind={}, multiplicity={})'.format(
+            self.t, self.method.name, self.uid, self.state.name if self.state else None,
+            self.tlo_kind.name if self.tlo_kind else None, self.multiplicity)
+
+# Enum values of the integer codes in ObservationBatch columns, where -1 is None.
+TEL_STATES = {-1: None, **{int(state): state for state in TELState}}
+TLO_KINDS = {-1: None, **{int(kind): kind for kind in TLOKind}}
+DETECTION_METHODS = {int(method): method for method in DetectionMethod}
+
+class ObservationBatch:
+    """A sequence of observations, stored as numpy columns with one entry per observation.
+
+    This is how observations are passed from the observers through the analyzers to the
+    trackers, since an imaging observer can make thousands of them per minute. Observation
+    objects are only made on request (see observations()), e.g. for debugging.
+
+    uid, state and tlo_kind are -1 where the Observation's would be None. Slicing a batch
+    with a slice gives views of the columns, like slicing an array. Batches should not be
+    modified once made.
+    """
+    __slots__ = ('t', 'method', 'uid', 'state', 'tlo_kind', 'multiplicity')
+
+    def __init__(self, t, method, uid, state, tlo_kind, multiplicity):
+        """
+        Args:
+          t, method, uid, state, tlo_kind: Arrays of ints, with one entry per observation,
+            or a single value shared by every observation (as for Observation).
+          multiplicity: Array of floats. Only observations which don't correspond to a
+            TLO can have a fractional multiplicity.
+        """
+        self.multiplicity = np.asarray(multiplicity, dtype=float)
+        n = len(self.multiplicity)
+        self.t = self._column(t, n)
+        self.method = self._column(method, n)
+        self.uid = self._column(uid, n)
+        self.state = self._column(state, n)
+        self.tlo_kind = self._column(tlo_kind, n)
+
+    @staticmethod
+    def _column(values, n):
+        if isinstance(values, np.ndarray) and values.dtype == np.int64:
+            return values
+        values = np.asarray(values, dtype=np.int64)
+        return values if values.ndim else np.full(n, values)
+
+    @staticmethod
+    def empty():
+        """An ObservationBatch with no observations. Since batches aren't modified, it's
+        always the same one."""
+        return _NO_OBSERVATIONS
+
+    @classmethod
+    def from_observations(cls, observations):
+        """An ObservationBatch of a sequence of Observations."""
+        if not observations:
+            return _NO_OBSERVATIONS
+        code = lambda value: -1 if value is None else int(value)
+        return cls(*zip(*[(o.t, int(o.method), code(o.uid), code(o.state), code(o.tlo_kind),
+                           o.multiplicity) for o in observations]))
+
+    @staticmethod
+    def concatenate(batches):
+        """Join a sequence of ObservationBatches. If only one of them has any observations,
+        it's returned as it is."""
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return ObservationBatch.empty()
+        if len(batches) == 1:
+            return batches[0]
+        return ObservationBatch(*[np.concatenate([getattr(batch, column) for batch in batches])
+                                  for column in ObservationBatch.__slots__])
+
+    def __len__(self):
+        return len(self.multiplicity)
+
+    def __getitem__(self, key):
+        """The observations selected by a slice, boolean mask or array of indices."""
+        return ObservationBatch(*[getattr(self, column)[key] for column in self.__slots__])
+
+    def __repr__(self):
+        return 'ObservationBatch({} observations)'.format(len(self))
+
+    def observation(self, i):
+        """Observation i of the batch, as an Observation."""
+        kind = int(self.tlo_kind[i])
+        multiplicity = float(self.multiplicity[i])
+        return Observation(int(self.t[i]), DETECTION_METHODS[int(self.method[i])],
+                           None if self.uid[i] < 0 else int(self.uid[i]),
+                           TEL_STATES[int(self.state[i])], TLO_KINDS[kind],
+                           multiplicity if kind < 0 else int(multiplicity))
+
+    def observations(self):
+        """A list with every observation of the batch, as an Observation."""
+        return [self.observation(i) for i in range(len(self))]
+
+    def sample(self, p, rng):
+        """Keep each of the individual observations with probability p.
+
+        Args:
+          p: Probability of keeping each of the individual observations. Either a single
+            value, or an array with one entry per observation.
+          rng: numpy Generator to draw from.
+        Returns:
+          An ObservationBatch with the multiplicity of each observation adjusted, without
+          the observations which have none left.
+        """
+        if not len(self):
+            return self
+        # Fractional multiplicities are rounded down.
+        multiplicity = rng.binomial(n=self.multiplicity.astype(np.int64), p=p)
+        kept = multiplicity > 0
+        return ObservationBatch(self.t[kept], self.method[kept], self.uid[kept],
+                                self.state[kept], self.tlo_kind[kept], multiplicity[kept])
+
 class File:
-    # Unique ID of the TEL this file corresponds to.
-    uid: int
-        
-    # Convenience pointer to the TEL this file corresponds to.
-    tel: TEL
-        
-    # List of observations assigned to this file.
-    obs: List[Observation] = field(default_factory=list)
-        
+    """The information the US has collected about one TEL."""
+    __slots__ = ('uid', 'tel', 'obs', 'latest')
+
+    def __init__(self, uid, tel, obs=None):
+        """
+        Args:
+          uid: Unique ID of the TEL this file corresponds to.
+          tel: Convenience pointer to the TEL this file corresponds to.
+          obs: Optional list of observations assigned to this file.
+        """
+        self.uid = uid
+        self.tel = tel
+        self.obs = obs if obs is not None else []
+        # The most recent observation in obs, kept up to date so that finding it doesn't
+        # require sorting the list (which grows for as long as the simulation runs).
+        self.latest = max(self.obs) if self.obs else None
+
     def add_observation(self, o):
-        self.obs.append(o)
\ No newline at end of file
+        self.obs.append(o)
+        if self.latest is None or not o < self.latest:
+            self.latest = o
+
+_none = np.zeros(0, dtype=np.int64)
+_NO_OBSERVATIONS = ObservationBatch(_none, _none, _none, _none, _none, np.zeros(0))
+
+# Tests
+_ids = IdAllocator()
+assert [TLO(TLOKind.TRUCK, ids=_ids).uid for _ in range(3)] == [0, 1, 2]
+assert TLO(TLOKind.TRUCK, multiplicity=10, ids=_ids).uid is None
+assert list(_ids.allocate_range(2)) == [3, 4] and _ids.allocate() == 5
+_a = Observation(5, DetectionMethod.EO, uid=1)
+_b = Observation(3, DetectionMethod.SAR, uid=2)
+assert sorted([_a, _b]) == [_b, _a]
+_f = File(1, None, [_a, _b])
+assert _f.latest is _a
+_f.add_observation(Observation(5, DetectionMethod.SIGINT, uid=1))
+assert _f.latest.method == DetectionMethod.SIGINT
+_batch = ObservationBatch.from_observations([_a, _b, Observation(4, DetectionMethod.EO,
+                                                                multiplicity=2.5)])
+assert _batch.observations()[:2] == [_a, _b] and _batch.observation(2).multiplicity == 2.5
+assert _batch[1:].uid.base is _batch.uid
+_joined = ObservationBatch.concatenate([_batch[:1], ObservationBatch.empty(), _batch])
+assert list(_joined.t) == [5, 5, 3, 4]
+assert ObservationBatch.concatenate([ObservationBatch.empty(), _batch]) is _batch
+_sampled = _batch.sample(np.array([1, 0, 1]), np.random.default_rng(0))
+assert list(_sampled.uid) == [1, -1] and list(_sampled.multiplicity) == [1, 2]
+assert len(ObservationBatch(7, DetectionMethod.SAR, -1, -1, -1, np.ones(3)).t) == 3
@@ -1,7 +1,7 @@
 from datetime import datetime
 from dateutil import tz
 import math
-import numpy.random as random
+import numpy as np
 import suntime
 
 from lib.enums import TimeOfDay
@@ -21,6 +21,8 @@ class Location:
         """
         self.lat = float(lat)
         self.lon = float(lon)
+        # Sunrise and sunset on sun_date, looked up when first needed for that date.
+        self.sun_date = None
         self.sunrise = None
         self.sunset = None
         
@@ -51,13 +53,14 @@ class Location:
         """Returns a TimeOfDay enum indicating if it's daytime or nighttime.
         
         Args:
-          t: Timezone-aware time (such as simulation.t).
+          t: Timezone-aware time (such as Simulation.to_datetime()).
         """
-        if not self.sunrise:
+        today = t.date()
+        if self.sun_date != today:
             sun = suntime.Sun(self.lat, self.lon)
-            today = t.date()
             self.sunrise = sun.get_local_sunrise_time(date=today, local_time_zone=t.tzinfo)
             self.sunset = sun.get_local_sunset_time(date=today, local_time_zone=t.tzinfo)
+            self.sun_date = today
         if self.sunrise.timetz() < t.timetz() < self.sunset.timetz():
             return TimeOfDay.DAY
         else:
@@ -72,20 +75,110 @@ class Location:
     def to_string(self):
         return '({}, {})'.format(self.lat, self.lon)
 
-def random_location():
-    """Generate a random location approximately somewhere in China.
-    Only used to give a somewhat realistic distribution of sunrise/sunset times for roaming TELs."""
-    lat = random.uniform(25, 45)
-    lon = random.uniform(80, 120)
-    return Location(lat, lon)
+def distances_km(lat1, lon1, lat2, lon2):
+    """Great circle distance in km between arrays of points, as with Location.distance_to()."""
+    phi_1 = np.radians(lat1)
+    phi_2 = np.radians(lat2)
+    delta_phi = phi_2 - phi_1
+    delta_lambda = np.radians(np.asarray(lon2) - lon1)
+    a = (np.sin(delta_phi/2)**2 +
+         np.cos(phi_1) * np.cos(phi_2) * np.sin(delta_lambda/2)**2)
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def seconds_of_day(t):
+    """Seconds since midnight of a datetime (or time)."""
+    return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6
+
+class SunTable:
+    """Sunrise and sunset times of a number of locations (bases, free-roaming TELs, ...),
+    for answering whether it's day or night at all of them at once.
+
+    Times are looked up once per location per simulated date, the first time that date
+    is asked about, so multi-day simulations use each day's own sunrise and sunset.
+    """
+    def __init__(self, lats, lons):
+        """
+        Args:
+          lats, lons: Arrays of latitudes and longitudes. Locations with a NaN latitude
+            are skipped, and are always treated as being at night.
+        """
+        self.lat = np.asarray(lats, dtype=float)
+        self.lon = np.asarray(lons, dtype=float)
+        self.known = np.flatnonzero(~np.isnan(self.lat))
+        # Map from date to (sunrise, sunset) arrays, in seconds since midnight.
+        self.by_date = {}
+
+    def __len__(self):
+        return len(self.lat)
+
+    def times(self, now):
+        """Sunrise and sunset times (seconds since midnight) of each location on now's date.
+
+        Args:
+          now: Timezone-aware time (such as Simulation.to_datetime()). All of the times
+            asked about should be in the same time zone.
+        Returns:
+          Two numpy arrays, of sunrise and sunset times.
+        """
+        today = now.date()
+        if today not in self.by_date:
+            sunrise = np.full(len(self), math.nan)
+            sunset = np.full(len(self), math.nan)
+            for i in self.known:
+                sun = suntime.Sun(self.lat[i], self.lon[i])
+                sunrise[i] = seconds_of_day(
+                    sun.get_local_sunrise_time(date=today, local_time_zone=now.tzinfo))
+                sunset[i] = seconds_of_day(
+                    sun.get_local_sunset_time(date=today, local_time_zone=now.tzinfo))
+            self.by_date[today] = (sunrise, sunset)
+        return self.by_date[today]
+
+    def is_day(self, now, indices=None):
+        """Whether it's daytime at each location, as with Location.is_day().
+
+        Args:
+          now: Timezone-aware time (such as Simulation.to_datetime()).
+          indices: Optional index or array of indices of locations. Defaults to all of them.
+        Returns:
+          A boolean array (or a single bool, if indices is a single index).
+        """
+        sunrise, sunset = self.times(now)
+        if indices is not None:
+            sunrise = sunrise[indices]
+            sunset = sunset[indices]
+        seconds = seconds_of_day(now)
+        return (sunrise < seconds) & (seconds < sunset)
+
+    def daylight_fraction(self, now):
+        """The fraction of the locations where it's daytime."""
+        return np.count_nonzero(self.is_day(now)) / len(self)
+
+def random_locations(rng, n):
+    """Generate random locations approximately somewhere in China.
+    Only used to give a somewhat realistic distribution of sunrise/sunset times for roaming TELs.
+    
+    Args:
+      rng: numpy Generator to draw from.
+      n: Number of locations.
+    Returns:
+      Arrays of latitudes and longitudes.
+    """
+    lat_lon = rng.uniform([25, 80], [45, 120], size=(n, 2))
+    return lat_lon[:, 0], lat_lon[:, 1]
 
 # Tests
 tokyo = Location(35.5895, 139.6917)
 rio = Location(-22.9068, -43.1729)
 assert math.fabs(tokyo.distance_to(rio) - 18580.0) < 10
 assert math.fabs(rio.distance_to(tokyo) - 18580.0) < 10
+assert math.fabs(distances_km([tokyo.lat], [tokyo.lon], [rio.lat], [rio.lon])[0] - 18580.0) < 10
 shanghai = Location(31.23, 121.47)
 shanghai_tz =  tz.gettz('Asia/Shanghai')
 assert shanghai.get_time_of_day(datetime.fromisoformat('2021-01-20T10:00:00+08:00')) == TimeOfDay.DAY
 assert shanghai.get_time_of_day(datetime.fromisoformat('2021-01-20T06:00:00+08:00')) == TimeOfDay.NIGHT
-
+_suns = SunTable([31.23, math.nan], [121.47, 0])
+assert list(_suns.is_day(datetime.fromisoformat('2021-01-20T10:00:00+08:00'))) == [True, False]
+assert not _suns.is_day(datetime.fromisoformat('2021-01-20T06:00:00+08:00'), 0)
+# Each date gets its own sunrise, so a June morning is light even after a January one.
+assert _suns.is_day(datetime.fromisoformat('2021-06-20T06:00:00+08:00'), 0)
+assert shanghai.get_time_of_day(datetime.fromisoformat('2021-06-20T06:00:00+08:00')) == TimeOfDay.DAY
@@ -1,25 +1,42 @@
 from abc import ABC, abstractmethod
-from datetime import timedelta
-from numpy import random
+from collections import namedtuple
+from heapq import heappop, heappush
+import math
 
-from lib.enums import DetectionMethod, TLOKind, TELState, Weather, SimulationMode, TimeOfDay
-from lib.intelligence_types import Observation
-from lib.location import Location
-from lib.time import format_time
+import numpy as np
+
+from lib.enums import DetectionMethod, TLOKind, TELState, Weather, SimulationMode
+from lib.intelligence_types import ObservationBatch
+from lib.location import SunTable
+
+# Time of an event which never happens.
+NEVER = np.iinfo(np.int64).max
 
 class Observer(ABC):
-    def __init__(self, c):
+    def __init__(self, c, rng):
+        """
+        Args:
+          c: Config object.
+          rng: numpy Generator this observer draws from.
+        """
         self.c = c
+        self.rng = rng
         super().__init__()
     
     @abstractmethod
-    def observe(self, s):
-        """Observe the current state of the simulation, and emit observations.
+    def observe(self, s, t0, t1):
+        """Observe the simulation over the minutes t0 to t1 (inclusive), and emit observations.
+        
+        Imaging observers take a single snapshot, at t1. Other observers cover every
+        minute in the interval, so that the intelligence process can run less often than
+        once a minute without missing anything.
         
         Args:
           s: The simulation object.
+          t0: First minute to observe.
+          t1: Last minute to observe. Not later than the current simulation time.
         Returns:
-          A collection of Observations representing unprocessed sensor data. Should
+          An ObservationBatch representing unprocessed sensor data. Should
           include both positive observations (corresponding to any and all TELs this
           Observer can observe at the moment), and negative observations (corresponding
           to satellite images containing no TELs, for example).
@@ -30,218 +47,434 @@ def truck_utilization_fraction(c, daylight_fraction):
     return (c.nighttime_truck_utilization*(1-daylight_fraction) +
             c.daytime_truck_utilization*daylight_fraction)
 
+# Hack alert: To estimate the percentage of China where it's daytime, check 10 locations
+# spread at different longitudes throughout the country.
+CHINA_LONGITUDE_BANDS = SunTable(np.full(10, 35.0), np.arange(78, 135, 6))
+
 def daylight_fraction(t, tlo):
-    if tlo.base or tlo.tel:
-        location = tlo.base.location if tlo.base else tlo.tel.location
-        time = location.get_time_of_day(t)
-        if time == TimeOfDay.DAY:
-            return 1
-        elif time == TimeOfDay.NIGHT:
-            return 0
-    else:
-        # Hack alert: To estimate the percentage of China where it's daytime, check
-        # 10 locations spread at different longitudes throughout the country.
-        locs = [Location(35, lon) for lon in range(78, 135, 6)]
-        num_daylight = sum([1 for l in locs if l.is_day(t)])
-        frac_daylight = num_daylight / len(locs)
-        return frac_daylight
-
-def weather_visibility(c, tlo):
-    if tlo.base or tlo.tel:
-        # Use the base's weather or local weather, depending on whether the TLO is tied
-        # to a base or not.
-        weather = tlo.base.weather if tlo.base else tlo.tel.weather
-        if weather == Weather.CLEAR:
-            return 1
-        elif weather == Weather.OVERCAST:
-            return 0
-        elif weather == Weather.CLOUDY:
-            return c.cloudy_visibility
-    else:
-        # Use a composite visibility score for TLOs not associated with a base or TEL.
-        visibility = (1 * c.weather_probabilities[Weather.CLEAR] +
-                      c.cloudy_visibility * c.weather_probabilities[Weather.CLOUDY])
-        return visibility
-    
-def obstruction_visibility(tlo):
-    # TELs and decoys in physical shelters can't be observed by satellites.
-    if tlo.tel and tlo.tel.state in {TELState.IN_BASE, TELState.SHELTERING}:
-        return 0
+    if tlo.base:
+        return 1 if tlo.base.is_day(t) else 0
+    elif tlo.tel:
+        return float(tlo.tel.fleet.daylight(t, tlo.tel.index))
     else:
-        return 1
+        return CHINA_LONGITUDE_BANDS.daylight_fraction(t)
+
+def average_weather_visibility(c):
+    """Chance of seeing an object somewhere in China, averaged over the weather."""
+    return (1 * c.weather_probabilities[Weather.CLEAR] +
+            c.cloudy_visibility * c.weather_probabilities[Weather.CLOUDY])
+
+class ImagingTargets:
+    """Everything the imaging observers look at, laid out as arrays.
 
-class EOObserver(Observer):
-    def __init__(self, c):
-        super().__init__(c)
+    The objects are split into groups, which are imaged together: one per base, or a
+    single group of every free-roaming TEL. Each group has TELs (and decoys), given by
+    fleet indices, then a truck TLO, then (if the simulation has a population raster)
+    the cells of the TruckPopulation where the group's trucks are, which are observed
+    in place of the truck TLO, and last the satellite tiles that contain no TLO.
+
+    Each of these is a "slot", and slots are sorted by group in that order, so a single
+    binomial draw covers every object an observer can see, and the observations come
+    out in order of group.
+    """
+    def __init__(self, s):
+        """
+        Args:
+          s: The simulation object. Its bases must already be started.
+        """
+        c = s.c
+        self.c = c
+        self.fleet = s.fleet
+        self.free_roaming = c.simulation_mode != SimulationMode.BASE_LOCAL
+        if self.free_roaming:
+            self.bases = [None]
+            groups = [(np.arange(s.fleet.size), s.free_tlos[s.fleet.size:])]
+            self.tiles = np.array([c.satellite_tiles], dtype=float)
+        else:
+            self.bases = s.bases
+            groups = [(base.tel_indices, base.tlos[len(base.tel_indices):])
+                      for base in s.bases]
+            self.tiles = np.full(len(s.bases), c.satellite_tiles_per_base, dtype=float)
+            # start_bases() gives every base the same weather timeline and SunTable.
+            self.weather = s.bases[0].weather
+            self.weather_rows = np.array([base.weather_index for base in s.bases])
+            self.sun = s.bases[0].sun
+            self.sun_rows = np.array([base.sun_index for base in s.bases])
+            self.sar = s.bases[0].sar
+            self.sar_rows = np.array([base.sar_index for base in s.bases])
+            self.offshore = np.array([base.offshore_observability for base in s.bases])
+        num_groups = len(groups)
+        self.num_groups = num_groups
+        self.units = np.concatenate([indices for indices, _ in groups]).astype(np.int64)
+        self.unit_group = np.repeat(np.arange(num_groups), [len(i) for i, _ in groups])
+        assert all(len(tlos) == 1 and tlos[0].kind == TLOKind.TRUCK for _, tlos in groups)
+        trucks = [tlos[0] for _, tlos in groups]
+        self.population = s.population
+        self.cell_sar_rows = None
+        if self.population is None:
+            num_trucks = [math.floor(truck.multiplicity) for truck in trucks]
+            self.cell_group = np.zeros(0, dtype=np.int64)
+            cell_trucks = np.zeros(0, dtype=np.int64)
+        else:
+            # The trucks are drawn cell by cell from the population raster instead.
+            num_trucks = [0] * num_groups
+            self.cell_group = self.population.cell_region
+            cell_trucks = self.population.trucks
+            if self.free_roaming and s.fleet.sar_regions is not None:
+                # Free-roaming cells are covered by SAR when their region is.
+                self.cell_sar_rows = s.fleet.sar_regions.locate(self.population.lat,
+                                                                self.population.lon)
+        num_units, num_cells = len(self.units), len(self.cell_group)
         
-    def observe_tlos(self, t, tlos):
-        obs = []
-        total_observed = 0
-        for tlo in tlos:
-            day_frac = daylight_fraction(t, tlo)
-
-            p_visible = 1
-            p_visible *= day_frac
-            if tlo.kind == TLOKind.TRUCK:
-                p_visible *= truck_utilization_fraction(self.c, day_frac)
-            p_visible *= obstruction_visibility(tlo)
-            p_visible *= weather_visibility(self.c, tlo)
-
-            num_observed = random.binomial(n=tlo.multiplicity, p=p_visible)
-            if num_observed > 0:
-                obs.append(tlo.observe(t, DetectionMethod.EO, num_observed))
-                total_observed += num_observed
-        return obs, total_observed
+        # Slots are listed by kind (units, trucks, cells, tiles), then put in order of
+        # group. The visibilities supplied by the observers are in the same order.
+        groups = np.arange(num_groups)
+        slot_group = np.concatenate([self.unit_group, groups, self.cell_group, groups])
+        self.order = np.argsort(slot_group, kind='stable')
+        position = np.empty(len(self.order), dtype=np.int64)
+        position[self.order] = np.arange(len(self.order))
+        self.slot_group = slot_group[self.order]
+        self.unit_slots = position[:num_units]
+        self.truck_slots = position[num_units:num_units + num_groups]
+        self.cell_slots = position[num_units + num_groups:-num_groups]
+        self.tile_slots = position[-num_groups:]
+        self.slot_n = np.concatenate([np.ones(num_units, dtype=np.int64),
+                                      np.array(num_trucks, dtype=np.int64), cell_trucks,
+                                      np.zeros(num_groups, dtype=np.int64)])[self.order]
+        # Fleet index, uid and TLOKind of the object in each slot (or -1). Cells and
+        # tiles don't correspond to a TLO.
+        self.slot_unit = np.full(len(self.order), -1, dtype=np.int64)
+        self.slot_unit[self.unit_slots] = self.units
+        self.slot_uid = np.full(len(self.order), -1, dtype=np.int64)
+        self.slot_uid[self.unit_slots] = s.fleet.uid[self.units]
+        self.slot_uid[self.truck_slots] = [-1 if truck.uid is None else truck.uid
+                                           for truck in trucks]
+        self.slot_tlo_kind = np.full(len(self.order), -1, dtype=np.int64)
+        self.slot_tlo_kind[self.unit_slots] = s.fleet.tlo_kind[self.units]
+        self.slot_tlo_kind[self.truck_slots] = TLOKind.TRUCK
+        self.slot_is_tlo = self.slot_tlo_kind >= 0
+        # The tiles aren't drawn, they're whatever wasn't observed.
+        self.tile_p = np.zeros(num_groups)
+
+    def daylight(self, now):
+        """1 for each base where it's daytime and 0 otherwise, or the fraction of China
+        where it's daytime, for free-roaming TLOs."""
+        if self.free_roaming:
+            return np.array([CHINA_LONGITUDE_BANDS.daylight_fraction(now)])
+        return self.sun.is_day(now, self.sun_rows).astype(float)
+
+    def weather_visibility(self, t):
+        """Chance of seeing an object at each base in its weather at time t, or on
+        average, for free-roaming TLOs."""
+        if self.free_roaming:
+            return np.array([average_weather_visibility(self.c)])
+        return self.fleet.visibility_by_weather[self.weather.value_at(t, self.weather_rows)]
+
+    def sar_in_view(self, t):
+        """Whether SAR satellites can see any of the targets at time t."""
+        return self.free_roaming or self.sar.any_covered(t)
+
+    def sar_coverage(self, t):
+        """1 for each base in view of SAR satellites at time t and 0 otherwise, or the
+        fraction of China in view, for free-roaming TLOs."""
+        if self.free_roaming:
+            return np.array([self.fleet.sar.fraction_covered(t)])
+        return self.sar.covered(t, self.sar_rows).astype(float)
+
+    def cell_sar_coverage(self, t, coverage):
+        """Chance each population cell is in view of SAR satellites at time t, given the
+        sar_coverage() of each group."""
+        if self.cell_sar_rows is not None:
+            return self.fleet.sar.covered(t, self.cell_sar_rows).astype(float)
+        return coverage[self.cell_group]
+
+    def offshore_coverage(self):
+        """Fraction of each base (or of China, for free-roaming TLOs) that can be seen
+        from offshore."""
+        if self.free_roaming:
+            return np.array([self.c.offshore_observability])
+        return self.offshore
+
+# Visibility of everything an ImagingObserver looks at. `coverage` is the fraction of
+# each group's satellite tiles that are imaged (groups with no coverage aren't looked at),
+# and the rest are the chance of seeing each object in the group, for each of the TELs,
+# trucks and population cells of ImagingTargets.
+Visibility = namedtuple('Visibility', ['coverage', 'units', 'trucks', 'cells'])
+
+def no_observations():
+    """Empty (uid, state, tlo_kind, multiplicity) observation columns."""
+    none = np.zeros(0, dtype=np.int64)
+    return none, none, none, np.zeros(0)
+
+class ImagingObserver(Observer):
+    """Base class for the satellite imaging observers, which take a picture of every TLO
+    they can see.
     
-    def observe(self, s):
-        obs = []
-        if self.c.simulation_mode == SimulationMode.BASE_LOCAL:
-            for base in s.bases:
-                # EOs can't see at night.
-                if base.location.is_night(s.t):
-                    continue
-
-                new_obs, num_obs = self.observe_tlos(s.t, base.tlos)
-                obs += new_obs
-                non_tlo_obs = self.c.satellite_tiles_per_base - num_obs
-                obs.append(Observation(t=s.t, method=DetectionMethod.EO,
-                                       multiplicity=non_tlo_obs))
-        elif self.c.simulation_mode == SimulationMode.FREE_ROAMING:
-            new_obs, num_obs = self.observe_tlos(s.t, s.free_tlos)
-            obs += new_obs
-            non_tlo_obs = self.c.satellite_tiles - num_obs
-            obs.append(Observation(t=s.t, method=DetectionMethod.EO,
-                                   multiplicity=non_tlo_obs))
-        return obs
-
-def sar_visibility(c, t, tlo):
-    if tlo.base or tlo.tel:
-        offset = tlo.base.sar_offset if tlo.base else tlo.tel.sar_offset
-        current_offset = ((t - offset) / timedelta(minutes=1)) % c.sar_cadence_min
-        if current_offset < c.sar_duration_min:
-            return 1
-        else:
-            return 0
-    else:
-        return c.sar_uptime
+    Observing is done once for every base together: the observers only supply the
+    visibility of each object, as arrays (see visibility()), and observe() draws how many
+    of each are seen in a single binomial draw.
+    """
+    # DetectionMethod of the observations.
+    method = None
+
+    def start(self, targets):
+        """
+        Args:
+          targets: The simulation's ImagingTargets.
+        """
+        self.targets = targets
     
-class SARObserver(Observer):
-    def __init__(self, c):
-        super().__init__(c)
-        
-    def observe_tlos(self, t, tlos):
-        obs = []
-        total_observed = 0
-        for tlo in tlos:
-            day_frac = daylight_fraction(t, tlo)
-            p_visible = 1
-            p_visible *= sar_visibility(self.c, t, tlo)
-            if tlo.kind == TLOKind.TRUCK:
-                p_visible *= truck_utilization_fraction(self.c, day_frac)
-            p_visible *= obstruction_visibility(tlo)
-            
-            num_observed = random.binomial(n=tlo.multiplicity, p=p_visible)
-            if num_observed > 0:
-                obs.append(tlo.observe(t, DetectionMethod.SAR, num_observed))
-                total_observed += num_observed
-        return obs, total_observed
+    @abstractmethod
+    def visibility(self, s, t, now):
+        """The Visibility of the targets at time t (and timezone-aware time now)."""
+        pass
+
+    def in_view(self, t):
+        """Whether any of the targets could be seen at time t. Observers which can tell
+        cheaply that none can override this, to skip working out their visibility."""
+        return True
+
+    def observe_columns(self, s, t):
+        """Observe every target at time t.
+
+        Returns:
+          (uid, state, tlo_kind, multiplicity) arrays with one entry per observation, in
+          order of group. Each group has the observations of its TELs, then of its trucks,
+          then the observation of the tiles that contain no TLO. uid, state and tlo_kind
+          are -1 if not applicable.
+        """
+        targets = self.targets
+        if not self.in_view(t):
+            return no_observations()
+        v = self.visibility(s, t, s.to_datetime(t))
+        looking = np.ones(1, dtype=bool) if targets.free_roaming else v.coverage > 0
+        if not looking.any():
+            return no_observations()
+        p = np.concatenate([v.units, v.trucks, v.cells, targets.tile_p])[targets.order]
+        p[~looking[targets.slot_group]] = 0
+        num_observed = self.rng.binomial(n=targets.slot_n, p=p)
+
+        multiplicity = num_observed.astype(float)
+        if len(targets.cell_slots):
+            multiplicity[targets.truck_slots] += np.bincount(
+                targets.cell_group, weights=multiplicity[targets.cell_slots],
+                minlength=targets.num_groups)
+        multiplicity[targets.tile_slots] = targets.tiles * v.coverage - np.bincount(
+            targets.slot_group, weights=num_observed, minlength=targets.num_groups)
+        emit = targets.slot_is_tlo & (multiplicity > 0)
+        emit[targets.tile_slots] = looking
+        slots = np.flatnonzero(emit)
+
+        units = targets.slot_unit[slots]
+        state = np.full(len(slots), -1, dtype=np.int64)
+        is_unit = units >= 0
+        state[is_unit] = targets.fleet.states_at(t, units[is_unit])
+        return (targets.slot_uid[slots], state, targets.slot_tlo_kind[slots],
+                multiplicity[slots])
+
+    def observe(self, s, t0, t1):
+        uid, state, tlo_kind, multiplicity = self.observe_columns(s, t1)
+        return ObservationBatch(t1, self.method, uid, state, tlo_kind, multiplicity)
+
+class EOObserver(ImagingObserver):
+    method = DetectionMethod.EO
     
-    def observe(self, s):
-        obs = []
-        if self.c.simulation_mode == SimulationMode.BASE_LOCAL:
-            for base in s.bases:
-                if sar_visibility(self.c, s.t, base.tlos[0]) > 0:
-                    new_obs, num_obs = self.observe_tlos(s.t, base.tlos)
-                    obs += new_obs
-                    non_tlo_obs = self.c.satellite_tiles_per_base - num_obs
-                    obs.append(Observation(t=s.t, method=DetectionMethod.SAR,
-                                            multiplicity=non_tlo_obs))
-        elif self.c.simulation_mode == SimulationMode.FREE_ROAMING:
-            new_obs, num_obs = self.observe_tlos(s.t, s.free_tlos)
-            obs += new_obs
-            non_tlo_obs = self.c.satellite_tiles * self.c.sar_uptime - num_obs
-            obs.append(Observation(t=s.t, method=DetectionMethod.SAR,
-                                   multiplicity=non_tlo_obs))
-        return obs
+    def __init__(self, c, rng):
+        super().__init__(c, rng)
+
+    def visibility(self, s, t, now):
+        targets = self.targets
+        fleet = targets.fleet
+        day = targets.daylight(now)
+        weather = targets.weather_visibility(t)
+        visible = ~fleet.obstructed_at(t, targets.units)
+        if targets.free_roaming:
+            coverage = np.ones(1)
+            units = (fleet.daylight(now, targets.units) * visible *
+                     fleet.weather_visibility(t, targets.units))
+        else:
+            # EOs can't see at night.
+            coverage = day
+            units = visible * weather[targets.unit_group]
+        trucks = day * truck_utilization_fraction(self.c, day) * weather
+        cells = np.zeros(0)
+        if targets.population:
+            cell_day = targets.population.daylight(now)
+            cells = (cell_day * truck_utilization_fraction(self.c, cell_day) *
+                     targets.population.weather_visibility(t))
+        return Visibility(coverage, units, trucks, cells)
 
+class SARObserver(ImagingObserver):
+    method = DetectionMethod.SAR
     
-def offshore_visibility(c, tlo):
-    if tlo.base:
-        return tlo.base.offshore_observability
-    elif tlo.tel:
-        return 1 if tlo.tel.near_shore else 0
-    else:
-        return c.offshore_observability
+    def __init__(self, c, rng):
+        super().__init__(c, rng)
 
-class StandoffObserver(Observer):
-    def __init__(self, c):
-        super().__init__(c)
-        
-    def observe_tlos(self, t, tlos):
-        obs = []
-        total_observed = 0
-        for tlo in tlos:
-            day_frac = daylight_fraction(t, tlo)
-            p_visible = 1
-            p_visible *= offshore_visibility(self.c, tlo)
-            if tlo.kind == TLOKind.TRUCK:
-                p_visible *= truck_utilization_fraction(self.c, day_frac)
-            p_visible *= obstruction_visibility(tlo)
-            
-            num_observed = random.binomial(n=tlo.multiplicity, p=p_visible)
-            if num_observed > 0:
-                obs.append(tlo.observe(t, DetectionMethod.OFFSHORE_SAR, num_observed))
-                total_observed += num_observed
-        return obs, total_observed
+    def in_view(self, t):
+        # Most minutes no base is under a satellite, which the SAR Coverage can tell
+        # without looking at each base.
+        return self.targets.sar_in_view(t)
+
+    def visibility(self, s, t, now):
+        targets = self.targets
+        fleet = targets.fleet
+        # Bases are only observed while SAR satellites are overhead.
+        coverage = targets.sar_coverage(t)
+        visible = ~fleet.obstructed_at(t, targets.units)
+        if targets.free_roaming:
+            units = fleet.sar_visible(t, targets.units) * visible
+        else:
+            units = visible.astype(float)
+        trucks = coverage * truck_utilization_fraction(self.c, targets.daylight(now))
+        cells = np.zeros(0)
+        if targets.population:
+            cells = (targets.cell_sar_coverage(t, coverage) *
+                     truck_utilization_fraction(self.c, targets.population.daylight(now)))
+        return Visibility(coverage, units, trucks, cells)
+
+class StandoffObserver(ImagingObserver):
+    method = DetectionMethod.OFFSHORE_SAR
     
-    def observe(self, s):
-        obs = []
-        if self.c.simulation_mode == SimulationMode.BASE_LOCAL:
-            for base in s.bases:
-                offshore_vis = offshore_visibility(self.c, base.tlos[0])
-                if offshore_vis > 0:
-                    new_obs, num_obs = self.observe_tlos(s.t, base.tlos)
-                    obs += new_obs
-                    non_tlo_obs = self.c.satellite_tiles_per_base * offshore_vis - num_obs
-                    obs.append(Observation(t=s.t, method=DetectionMethod.OFFSHORE_SAR,
-                                            multiplicity=non_tlo_obs))
-        elif self.c.simulation_mode == SimulationMode.FREE_ROAMING:
-            new_obs, num_obs = self.observe_tlos(s.t, s.free_tlos)
-            obs += new_obs
-            non_tlo_obs = self.c.satellite_tiles * self.c.offshore_observability - num_obs
-            obs.append(Observation(t=s.t, method=DetectionMethod.OFFSHORE_SAR,
-                                   multiplicity=non_tlo_obs))
-        return obs
+    def __init__(self, c, rng):
+        super().__init__(c, rng)
+
+    def visibility(self, s, t, now):
+        targets = self.targets
+        fleet = targets.fleet
+        coverage = targets.offshore_coverage()
+        visible = ~fleet.obstructed_at(t, targets.units)
+        if targets.free_roaming:
+            units = fleet.near_shore_at(t, targets.units) * visible
+        else:
+            units = coverage[targets.unit_group] * visible
+        trucks = coverage * truck_utilization_fraction(self.c, targets.daylight(now))
+        cells = np.zeros(0)
+        if targets.population:
+            cells = (coverage[targets.cell_group] *
+                     truck_utilization_fraction(self.c, targets.population.daylight(now)))
+        return Visibility(coverage, units, trucks, cells)
     
 class SigIntObserver(Observer):
-    def __init__(self, c):
-        super().__init__(c)
+    """Each TEL that isn't practicing EMCON gets one chance of being detected per hour,
+    at a fixed minute of the hour.
+    
+    Rather than rolling for every chance, the time of each TEL's next detection is drawn
+    from a geometric distribution, and only redrawn after a detection or when the TEL's
+    EMCON status changes. Since the chances are independent, the odds are the same.
+    """
+    def __init__(self, c, rng):
+        super().__init__(c, rng)
         
-    def observe(self, s):
-        obs = []
-        for tlo in s.tlos():
-            if tlo.tel and not tlo.tel.emcon:
-                offset = hash(tlo.tel.name + 'SIGINT') % 60
-                if s.t.minute == offset and random.random() < self.c.sigint_hourly_detect_chance:
-                    obs.append(tlo.observe(s.t, DetectionMethod.SIGINT, 1))
-        return obs
+    def start(self, s):
+        fleet = s.fleet
+        self.fleet = fleet
+        self.start_minute = s.start_t.minute
+        # Time of each TEL's next detection (NEVER for TELs practicing EMCON), and a heap
+        # of (time, TEL index) entries. Entries whose time isn't in next_t are stale.
+        self.next_t = np.full(fleet.size, NEVER, dtype=np.int64)
+        self.pending = []
+        # TELs whose EMCON status has changed since the last observation, and the last
+        # minute observed.
+        self.changed = np.zeros(fleet.size, dtype=bool)
+        self.last_t = s.t - 1
+        fleet.emcon_listeners.append(self.emcon_changed)
+        self._schedule(s.t, np.flatnonzero(~fleet.emcon))
+        # The detections are drawn ahead of time, so they're redrawn (by resample()) if
+        # the simulation's random number streams are reseeded.
+        s.timelines.append(self)
+
+    def emcon_changed(self, indices):
+        self.changed[indices] = True
+
+    def resample(self, t):
+        """Redraw the next detection of every TEL after the last minute observed, e.g.
+        after the random number generator has been reseeded."""
+        self.next_t[:] = NEVER
+        self.pending = []
+        self._schedule(self.last_t + 1, np.flatnonzero(~self.fleet.emcon))
+
+    def _schedule(self, t, indices):
+        """Draw the next detection of each TEL in indices, from the first chance at or
+        after time t."""
+        if len(indices) == 0:
+            return
+        first_t = t + (self.fleet.sigint_offset[indices] - self.start_minute - t) % 60
+        self._push(first_t, indices)
+
+    def _push(self, first_t, indices):
+        """Draw the next detection of each TEL in indices, given its first chance."""
+        p = self.c.sigint_hourly_detect_chance
+        if p == 0:
+            return
+        ts = first_t + 60 * (self.rng.geometric(p, len(indices)) - 1)
+        self.next_t[indices] = ts
+        for entry in zip(ts.tolist(), indices.tolist()):
+            heappush(self.pending, entry)
+        
+    def observe(self, s, t0, t1):
+        fleet = s.fleet
+        # A TEL whose EMCON status changed during the interval is treated as having had
+        # its current status since t0, which doesn't change the odds.
+        if self.changed.any():
+            changed = np.flatnonzero(self.changed)
+            self.changed[:] = False
+            self.next_t[changed] = NEVER
+            self._schedule(t0, changed[~fleet.emcon[changed]])
+
+        # Detections in the interval. A TEL can be detected more than once if the
+        # intelligence process runs less often than hourly, so each round of detections
+        # is rescheduled and the heap is checked again.
+        indices, ts = [], []
+        while self.pending and self.pending[0][0] <= t1:
+            due = []
+            while self.pending and self.pending[0][0] <= t1:
+                t, i = heappop(self.pending)
+                if self.next_t[i] == t:
+                    # A stale entry can have the same time as the current one (if the
+                    # TEL's EMCON toggled), so only the first is taken.
+                    self.next_t[i] = NEVER
+                    due.append((i, t))
+            if due:
+                due_indices, due_ts = np.array(due, dtype=np.int64).T
+                indices.append(due_indices)
+                ts.append(due_ts)
+                self._push(due_ts + 60, due_indices)
+        self.last_t = t1
+        if not indices:
+            return ObservationBatch.empty()
+        indices = np.concatenate(indices)
+        ts = np.concatenate(ts)
+        # Ordered by TEL and then by time.
+        order = np.lexsort((ts, indices))
+        return fleet.observations(indices[order], ts[order], DetectionMethod.SIGINT)
     
 class GroundSensorObserver(Observer):
-    def __init__(self, c):
-        super().__init__(c)
+    def __init__(self, c, rng):
+        super().__init__(c, rng)
+        self.positive_rates = np.zeros(max(TLOKind) + 1)
+        for kind, rate in c.ground_sensor_positive_rates.items():
+            self.positive_rates[kind] = rate
         
-    def observe(self, s):
-        obs = []
-        for tlo in s.tlos():
-            if not tlo.tel:
-                continue
-            tel = tlo.tel
-            if (tel.state == TELState.ARRIVING_BASE and not tel.ground_sensor_attempted):
-                tel.ground_sensor_attempted = True
-                if random.random() < self.c.ground_sensor_positive_rates[tlo.kind]:
-                    obs.append(tlo.observe(s.t, DetectionMethod.GROUND_SENSOR, 1))
-            elif (tel.state == TELState.LEAVING_BASE and not tel.ground_sensor_attempted):
-                tel.ground_sensor_attempted = True
-                if random.random() < self.c.ground_sensor_positive_rates[tlo.kind]:
-                    obs.append(tlo.observe(s.t, DetectionMethod.GROUND_SENSOR, 1))
-        return obs
\ No newline at end of file
+    def start(self, s):
+        self.fleet = s.fleet
+        # ObservationBatches made since the last call to observe().
+        self.pending = []
+        self.fleet.state_listeners.append(self.states_changed)
+        self.states_changed(s.t, *self.fleet.unannounced_at_start())
+
+    def states_changed(self, t, indices, states):
+        # Ground sensors get one chance each time a TEL leaves or arrives at base.
+        fleet = self.fleet
+        moving = (states == TELState.ARRIVING_BASE) | (states == TELState.LEAVING_BASE)
+        indices = indices[moving]
+        detected = (self.rng.random(len(indices)) <
+                    self.positive_rates[fleet.tlo_kind[indices]])
+        if detected.any():
+            self.pending.append(fleet.observations(
+                indices[detected], t, DetectionMethod.GROUND_SENSOR))
+
+    def observe(self, s, t0, t1):
+        # The observations were made as the TELs changed state, during the interval.
+        observations = ObservationBatch.concatenate(self.pending)
+        self.pending = []
+        return observations
@@ -0,0 +1,159 @@
+import math
+
+import numpy as np
+
+from lib.enums import Weather
+from lib.location import EARTH_RADIUS, SunTable, distances_km
+from lib.timeline import weather_timeline
+
+# km per degree of latitude.
+KM_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+class PopulationRaster:
+    """Population density (persons per km2) on a regular latitude/longitude grid.
+
+    Row 0 of the grid is the southern edge and column 0 the western edge. Cells are
+    referred to by their index in the flattened grid. The grid can be a memory-mapped
+    array, in which case only the cells which are used are read.
+    """
+    def __init__(self, density, bounds):
+        """
+        Args:
+          density: 2D array of persons per km2.
+          bounds: (lat_min, lat_max, lon_min, lon_max) covered by the grid.
+        """
+        self.density = density
+        self.lat_min, self.lat_max, self.lon_min, self.lon_max = bounds
+        self.num_rows, self.num_cols = density.shape
+        self.cell_lat = (self.lat_max - self.lat_min) / self.num_rows
+        self.cell_lon = (self.lon_max - self.lon_min) / self.num_cols
+
+    def cell_centers(self, cells):
+        """Arrays of the latitude and longitude of the center of each cell."""
+        rows, cols = np.divmod(np.asarray(cells), self.num_cols)
+        return (self.lat_min + (rows + .5) * self.cell_lat,
+                self.lon_min + (cols + .5) * self.cell_lon)
+
+    def cell_areas(self, cells):
+        """Area of each cell in km2."""
+        lat, _ = self.cell_centers(cells)
+        return (self.cell_lat * KM_PER_DEGREE) * (self.cell_lon * KM_PER_DEGREE *
+                                                  np.cos(np.radians(lat)))
+
+    def cell_density(self, cells):
+        return np.asarray(self.density.reshape(-1)[cells], dtype=float)
+
+    def cells_within(self, lat, lon, radius_km):
+        """Cells whose centers are within radius_km of (lat, lon). If there are none (for
+        a small radius), the cell containing the point."""
+        d_lat = radius_km / KM_PER_DEGREE
+        d_lon = d_lat / max(math.cos(math.radians(lat)), 1e-6)
+        row_range = self._clip_rows(lat - d_lat, lat + d_lat)
+        col_range = self._clip_cols(lon - d_lon, lon + d_lon)
+        rows, cols = np.meshgrid(np.arange(*row_range), np.arange(*col_range), indexing='ij')
+        cells = (rows * self.num_cols + cols).ravel()
+        cell_lat, cell_lon = self.cell_centers(cells)
+        cells = cells[distances_km(lat, lon, cell_lat, cell_lon) <= radius_km]
+        if len(cells) == 0:
+            row = min(max(int((lat - self.lat_min) / self.cell_lat), 0), self.num_rows - 1)
+            col = min(max(int((lon - self.lon_min) / self.cell_lon), 0), self.num_cols - 1)
+            cells = np.array([row * self.num_cols + col])
+        return cells
+
+    def _clip_rows(self, lat0, lat1):
+        return (min(max(int(math.floor((lat0 - self.lat_min) / self.cell_lat)), 0), self.num_rows),
+                min(max(int(math.ceil((lat1 - self.lat_min) / self.cell_lat)), 0), self.num_rows))
+
+    def _clip_cols(self, lon0, lon1):
+        return (min(max(int(math.floor((lon0 - self.lon_min) / self.cell_lon)), 0), self.num_cols),
+                min(max(int(math.ceil((lon1 - self.lon_min) / self.cell_lon)), 0), self.num_cols))
+
+    def populated_cells(self):
+        return np.flatnonzero(np.asarray(self.density).reshape(-1) > 0)
+
+def load_population_raster(c):
+    """Load the population raster named by the config, or None if there isn't one."""
+    if c.population_raster_filename is None:
+        return None
+    density = np.load(c.population_raster_filename, mmap_mode='r')
+    return PopulationRaster(density, c.population_raster_bounds)
+
+def synthetic_population_raster(num_rows, num_cols, seed=0, median_density=100, sigma=1.5):
+    """A made-up population raster for testing, with log-normally distributed densities.
+
+    Save it with np.save() to use it as Config.population_raster_filename.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.lognormal(math.log(median_density), sigma,
+                         size=(num_rows, num_cols)).astype(np.float32)
+
+class TruckPopulation:
+    """Trucks (which can be mistaken for TELs) spread over the cells of a population
+    raster, in proportion to the population of each cell.
+
+    Cells are grouped into regions: one per base (the cells within a TEL's roaming radius
+    of the base), or a single region covering the whole raster if TELs roam freely. Cells
+    are stored region by region, in the order of the bases, so observers can treat the
+    trucks of every region as arrays of per-cell counts and probabilities.
+    """
+    def __init__(self, c, raster, bases=None):
+        """
+        Args:
+          c: Config object.
+          raster: The PopulationRaster.
+          bases: List of TELBases, or None for free-roaming TELs.
+        """
+        self.c = c
+        self.bases = bases
+        if bases:
+            region_cells = [raster.cells_within(base.location.lat, base.location.lon,
+                                                c.tel_radius_km) for base in bases]
+        else:
+            region_cells = [raster.populated_cells()]
+        # Index of the region each cell is in.
+        self.cell_region = np.repeat(np.arange(len(region_cells)),
+                                     [len(cells) for cells in region_cells])
+        cells = np.concatenate(region_cells)
+        self.trucks = np.floor(c.trucks_per_person * raster.cell_density(cells) *
+                               raster.cell_areas(cells)).astype(np.int64)
+        # Centers of the cells.
+        self.lat, self.lon = raster.cell_centers(cells)
+        self.sun = SunTable(self.lat, self.lon)
+        self.visibility_by_weather = np.zeros(max(Weather) + 1)
+        self.visibility_by_weather[Weather.CLEAR] = 1
+        self.visibility_by_weather[Weather.CLOUDY] = c.cloudy_visibility
+        # Timeline of the weather, and the row of it for each cell. Set by start().
+        self.weather = None
+        self.weather_rows = None
+
+    def __len__(self):
+        return len(self.trucks)
+
+    def start(self, s):
+        """Start the population. The bases (if any) must already be started."""
+        if self.bases:
+            # Each cell has the weather of its region's base.
+            self.weather = self.bases[0].weather
+            self.weather_rows = np.array([base.weather_index
+                                          for base in self.bases])[self.cell_region]
+        else:
+            self.weather = weather_timeline(self.c, s.rng, len(self), s.t, s.end_t)
+            self.weather_rows = np.arange(len(self))
+            s.timelines.append(self.weather)
+
+    def daylight(self, now):
+        """1 for each cell where it's daytime, 0 otherwise."""
+        return self.sun.is_day(now).astype(float)
+
+    def weather_visibility(self, t):
+        """Chance of seeing a truck in each cell, in the weather at time t."""
+        return self.visibility_by_weather[self.weather.value_at(t, self.weather_rows)]
+
+# Tests
+_raster = PopulationRaster(synthetic_population_raster(20, 40, seed=1), (20, 30, 100, 120))
+assert (_raster.cell_centers([0])[0] == 20.25).all() and (_raster.cell_centers([39])[1] == 119.75).all()
+_cells = _raster.cells_within(25, 110, 100)
+_lat, _lon = _raster.cell_centers(_cells)
+assert len(_cells) > 1 and (distances_km(25, 110, _lat, _lon) <= 100).all()
+assert len(_raster.cells_within(25.1, 110.1, 1)) == 1
+assert len(_raster.populated_cells()) == 800
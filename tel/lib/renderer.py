@@ -1,6 +1,7 @@
 from collections import defaultdict
 import csv
 from datetime import timedelta
+from functools import partial
 import os
 
 import matplotlib
@@ -36,22 +37,23 @@ class Renderer:
         
     def start(self, s):
         self.render(s)
-        s.schedule_event_relative(lambda: self.render(s),
-                                  s.render_interval, s.render_interval)
+        render_interval = timedelta(minutes=s.render_interval)
+        s.schedule_event_relative(partial(self.render, s),
+                                  render_interval, render_interval)
         
     def render(self, s):
         if self.c.debug:
-            print("*** Rendering at time:", format_time(s.t))
+            print("*** Rendering at time:", format_time(s.to_datetime()))
             if s.bases:
                 for base in s.bases:
-                    print(base.status())
+                    print(base.status(s.t))
                     print(base.tel_state_summary())
 
                 s.intelligence.perfect_tracker.analyze_files(s.t)
             print()
         
     def final_summary(self, s):
-        ts = s.intelligence.ts
+        ts = [s.to_datetime(t) for t in s.intelligence.ts]
         avg_roam_time_min = []
         area_to_destroy_by_time = defaultdict(list)
         missiles_remaining = []
@@ -86,6 +88,17 @@ class Renderer:
                     d['area_to_destroy_{}min'.format(time)] = '{:,.0f}'.format(area)
                 writer.writerow(d)    
         
+        if s.convergence:
+            print('Convergence of assessments at {}:'.format(format_time(s.to_datetime())))
+            with open(self.c.output_dir + '/convergence.csv', 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['metric', 'warmup_minutes', 'mean', 'half_width', 'target'])
+                for result in s.convergence:
+                    print('  ' + result.summary())
+                    writer.writerow([result.metric, result.warmup_minutes, result.mean,
+                                     result.half_width, result.target])
+            print()
+        
         plt.style.use('seaborn-whitegrid')
 
         fig, ax = plt.subplots()
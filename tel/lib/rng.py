@@ -0,0 +1,70 @@
+import zlib
+
+from numpy.random import Generator, PCG64, SeedSequence
+
+def stable_hash(s):
+    """Hash a string to a non-negative integer.
+
+    Unlike the built-in hash(), which is salted differently in every process, the result
+    is the same across processes and runs.
+    """
+    return zlib.crc32(s.encode('utf-8'))
+
+class RandomStreams:
+    """The random number generators used by one simulation.
+
+    Each subsystem draws from its own named stream, spawned from a single SeedSequence.
+    Streams are independent of each other and of any other simulation, and a stream's
+    draws don't depend on how much the other streams have been used, so adding random
+    draws to one part of the simulation doesn't perturb the rest.
+    """
+    def __init__(self, seed=None):
+        """
+        Args:
+          seed: Optional integer or SeedSequence. If not provided, fresh entropy is
+            drawn from the OS.
+        """
+        self.seed_seq = seed if isinstance(seed, SeedSequence) else SeedSequence(seed)
+        self.generators = {}
+
+        # Streams for the core TEL model.
+        self.schedules = self.get('schedules')   # TEL schedule offsets, mating, update offsets.
+        self.weather = self.get('weather')
+        self.shore = self.get('shore')
+        self.emcon = self.get('emcon')
+        self.locations = self.get('locations')
+
+    def _seed_seq_for(self, name):
+        return SeedSequence(self.seed_seq.entropy,
+                            spawn_key=self.seed_seq.spawn_key + (stable_hash(name),))
+
+    def get(self, name):
+        """Return the Generator for the stream with the given name, creating it if needed."""
+        generator = self.generators.get(name)
+        if generator is None:
+            generator = Generator(PCG64(self._seed_seq_for(name)))
+            self.generators[name] = generator
+        return generator
+
+    def spawn(self, n):
+        """Return n new SeedSequences, independent of each other and of these streams."""
+        return self.seed_seq.spawn(n)
+
+    def reseed(self, seed):
+        """Reseed every stream in place.
+
+        Generators which have already been handed out keep working, and draw from the
+        new streams from now on.
+        """
+        self.seed_seq = seed if isinstance(seed, SeedSequence) else SeedSequence(seed)
+        for name, generator in self.generators.items():
+            generator.bit_generator.state = PCG64(self._seed_seq_for(name)).state
+
+# Tests
+assert stable_hash('Base_TEL_DF_31A_0SAR') == stable_hash('Base_TEL_DF_31A_0' + 'SAR')
+_a, _b = RandomStreams(1), RandomStreams(1)
+_a.get('other').random(10)
+assert _a.weather.random() == _b.weather.random()
+_a.reseed(2)
+_b.reseed(2)
+assert _a.get('other').random() == _b.get('other').random()
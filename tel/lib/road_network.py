@@ -0,0 +1,304 @@
+import csv
+import heapq
+import math
+
+import numpy as np
+
+from lib.location import distances_km
+
+# Shortest length (in km) given to a road, so that vehicles always make progress.
+MIN_ROAD_KM = 1e-3
+
+class RoadNetwork:
+    """A network of two-way roads, stored in compressed sparse row (CSR) form.
+
+    Nodes are numbered from 0, and each road is stored as two directed edges. The edges
+    leaving node u are edges indptr[u] to indptr[u + 1] - 1, and edge e goes from node
+    source[e] to node target[e] and is length[e] km long. reverse[e] is the edge going
+    the other way along the same road.
+    """
+    def __init__(self, lat, lon, from_nodes, to_nodes):
+        """
+        Args:
+          lat, lon: Arrays of the coordinates of each node.
+          from_nodes, to_nodes: Arrays of the nodes at either end of each road.
+        """
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        n = len(self.lat)
+        source = np.concatenate([from_nodes, to_nodes]).astype(np.int64)
+        target = np.concatenate([to_nodes, from_nodes]).astype(np.int64)
+        order = np.lexsort((target, source))
+        self.source = source[order]
+        self.target = target[order]
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(self.source, minlength=n))
+        self.length = np.maximum(distances_km(self.lat[self.source], self.lon[self.source],
+                                              self.lat[self.target], self.lon[self.target]),
+                                 MIN_ROAD_KM)
+        # Edges are sorted by (source, target), so the reverse of each edge can be found
+        # by binary search.
+        keys = self.source * n + self.target
+        self.reverse = np.searchsorted(keys, self.target * n + self.source)
+        # Python lists of indptr, target and length, made when first needed.
+        self._lists = None
+
+    @property
+    def num_nodes(self):
+        return len(self.lat)
+
+    def nearest_nodes(self, lat, lon):
+        """The node nearest to each of an array of points.
+
+        Uses a flat-earth approximation, which is fine for the distances between
+        neighbouring nodes.
+        """
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        nearest = np.zeros(len(lat), dtype=np.int64)
+        # Compare points to every node a chunk at a time, to bound memory use.
+        chunk = max(1, 10**7 // self.num_nodes)
+        cos_lat = np.cos(np.radians(self.lat))
+        for i in range(0, len(lat), chunk):
+            d_lat = lat[i:i + chunk, np.newaxis] - self.lat
+            d_lon = (lon[i:i + chunk, np.newaxis] - self.lon) * cos_lat
+            nearest[i:i + chunk] = np.argmin(d_lat**2 + d_lon**2, axis=1)
+        return nearest
+
+    def shortest_distances(self, start):
+        """Shortest road distance (in km) from node start to every node (Dijkstra's
+        algorithm). Unreachable nodes are at distance inf."""
+        # Plain lists are much faster than numpy arrays for this kind of scalar loop.
+        if self._lists is None:
+            self._lists = (self.indptr.tolist(), self.target.tolist(), self.length.tolist())
+        indptr, target, length = self._lists
+        distance = [math.inf] * self.num_nodes
+        distance[start] = 0.0
+        queue = [(0.0, int(start))]
+        while queue:
+            d, u = heapq.heappop(queue)
+            if d > distance[u]:
+                continue
+            for e in range(indptr[u], indptr[u + 1]):
+                v = target[e]
+                d_v = d + length[e]
+                if d_v < distance[v]:
+                    distance[v] = d_v
+                    heapq.heappush(queue, (d_v, v))
+        return np.array(distance)
+
+    def road_density(self):
+        """km of road per km2, over the bounding box of the network."""
+        height = distances_km(self.lat.min(), 0, self.lat.max(), 0)
+        mid_lat = (self.lat.min() + self.lat.max()) / 2
+        width = distances_km(mid_lat, self.lon.min(), mid_lat, self.lon.max())
+        return self.length.sum() / 2 / max(height * width, MIN_ROAD_KM)
+
+def load_road_network(filename):
+    """Load a road network from a csv file with one road per row, and columns
+    from_lat, from_lon, to_lat and to_lon. Roads which end at the same coordinates are
+    connected."""
+    with open(filename) as csvfile:
+        rows = [(float(row['from_lat']), float(row['from_lon']),
+                 float(row['to_lat']), float(row['to_lon'])) for row in csv.DictReader(csvfile)]
+    ends = np.array(rows, dtype=float).reshape(-1, 4)
+    points = np.vstack([ends[:, 0:2], ends[:, 2:4]])
+    nodes, node_of_point = np.unique(points, axis=0, return_inverse=True)
+    node_of_point = node_of_point.ravel()
+    return RoadNetwork(nodes[:, 0], nodes[:, 1],
+                       node_of_point[:len(ends)], node_of_point[len(ends):])
+
+def write_road_network(filename, network):
+    """Write a road network to a csv file, in the format read by load_road_network()."""
+    roads = np.flatnonzero(network.source < network.target)
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['from_lat', 'from_lon', 'to_lat', 'to_lon'])
+        for e in roads:
+            u, v = network.source[e], network.target[e]
+            writer.writerow([network.lat[u], network.lon[u], network.lat[v], network.lon[v]])
+
+def grid_road_network(num_rows, num_cols, spacing=0.5, lat=25, lon=80):
+    """A synthetic grid of roads, for testing.
+
+    Args:
+      num_rows, num_cols: Number of nodes in each direction.
+      spacing: Degrees between neighbouring nodes.
+      lat, lon: Coordinates of the south-west corner.
+    """
+    rows, cols = np.divmod(np.arange(num_rows * num_cols), num_cols)
+    node = rows * num_cols + cols
+    east = cols < num_cols - 1
+    north = rows < num_rows - 1
+    from_nodes = np.concatenate([node[east], node[north]])
+    to_nodes = np.concatenate([node[east] + 1, node[north] + num_cols])
+    return RoadNetwork(lat + rows * spacing, lon + cols * spacing, from_nodes, to_nodes)
+
+class RoadPositions:
+    """The positions of a number of vehicles (such as TELs) driving on a RoadNetwork.
+
+    Vehicle i is along[i] km along edge edge[i]. Vehicles drive at random: at the end
+    of each road they take a random road out of the node they've reached, other than
+    the one they came along (unless it's a dead end).
+    """
+    def __init__(self, network, rng, home):
+        """
+        Args:
+          network: The RoadNetwork.
+          rng: numpy Generator to draw from.
+          home: Array with the node each vehicle starts at.
+        """
+        self.network = network
+        self.rng = rng
+        self.home = np.asarray(home, dtype=np.int64)
+        self.edge = np.zeros(len(self.home), dtype=np.int64)
+        self.along = np.zeros(len(self.home))
+        self.place(np.arange(len(self.home)), self.home)
+
+    def _random_edges(self, nodes, came_along=None):
+        network = self.network
+        first = network.indptr[nodes]
+        degree = network.indptr[nodes + 1] - first
+        k = (self.rng.random(len(nodes)) * degree).astype(np.int64)
+        edges = first + k
+        if came_along is not None:
+            u_turn = (edges == network.reverse[came_along]) & (degree > 1)
+            edges[u_turn] = first[u_turn] + (k[u_turn] + 1) % degree[u_turn]
+        return edges
+
+    def place(self, indices, nodes):
+        """Put vehicles at the given nodes, facing along a random road."""
+        self.edge[indices] = self._random_edges(nodes)
+        self.along[indices] = 0
+
+    def return_home(self, indices):
+        self.place(indices, self.home[indices])
+
+    def advance(self, indices, km):
+        """Drive each of the given vehicles km along the roads.
+
+        Args:
+          indices: Array of vehicle indices.
+          km: Distance (or array of distances) to drive.
+        """
+        length = self.network.length
+        self.along[indices] += km
+        moving = indices
+        while len(moving):
+            # Vehicles that have reached the end of their road turn onto the next one.
+            moving = moving[self.along[moving] >= length[self.edge[moving]]]
+            edges = self.edge[moving]
+            self.along[moving] -= length[edges]
+            self.edge[moving] = self._random_edges(self.network.target[edges], edges)
+
+    def lat_lon(self, indices=None):
+        """Arrays of the latitude and longitude of each vehicle."""
+        edge = self.edge if indices is None else self.edge[indices]
+        along = self.along if indices is None else self.along[indices]
+        network = self.network
+        f = along / network.length[edge]
+        source, target = network.source[edge], network.target[edge]
+        return (network.lat[source] * (1 - f) + network.lat[target] * f,
+                network.lon[source] * (1 - f) + network.lon[target] * f)
+
+    def nodes(self, indices=None):
+        """The node nearest to each vehicle (whichever end of its road is closer)."""
+        edge = self.edge if indices is None else self.edge[indices]
+        along = self.along if indices is None else self.along[indices]
+        network = self.network
+        return np.where(along < network.length[edge] / 2,
+                        network.source[edge], network.target[edge])
+
+class IsochroneCache:
+    """How many km of road a vehicle can reach from a start node, by minutes of driving.
+
+    Tables are computed once per start node (with a shortest path search over the whole
+    network) the first time the node is asked about, after which looking up any number
+    of (start, minutes) pairs is a single array index.
+    """
+    def __init__(self, network, speed_kmph):
+        """
+        Args:
+          network: The RoadNetwork.
+          speed_kmph: Driving speed.
+        """
+        self.network = network
+        self.km_per_minute = speed_kmph / 60
+        # reachable_km[row, m] is the km of road reachable in m minutes from the start
+        # node with that row. Rows are padded with their last value.
+        self.reachable_km = np.zeros((0, 1), dtype=np.float32)
+        self.row_of_node = {}
+        # Each road once, as indices of one of its directed edges.
+        self.roads = np.flatnonzero(network.source < network.target)
+
+    def _reachable_table(self, start):
+        network = self.network
+        distance = self.network.shortest_distances(start)
+        a = distance[network.source[self.roads]]
+        b = distance[network.target[self.roads]]
+        length = network.length[self.roads]
+        reached = np.isfinite(a)
+        a, b, length = np.minimum(a, b)[reached], np.maximum(a, b)[reached], length[reached]
+        # The km of a road reachable within distance D rises with slope 1 from D = a (the
+        # nearer end), with slope 2 from D = b (the further end), until the whole road
+        # (length L) is reached at D = (L + a + b) / 2. So the total over all roads is a
+        # sum of ramps w * max(0, D - x), evaluated with cumulative sums.
+        x = np.concatenate([a, b, (length + a + b) / 2])
+        w = np.concatenate([np.ones(len(a)), np.ones(len(b)), np.full(len(a), -2.0)])
+        order = np.argsort(x, kind='stable')
+        x, w = x[order], w[order]
+        slope = np.concatenate([[0], np.cumsum(w)])
+        intercept = np.concatenate([[0], np.cumsum(w * x)])
+        if self.km_per_minute > 0:
+            num_minutes = int(math.ceil(x[-1] / self.km_per_minute)) + 1 if len(x) else 1
+        else:
+            num_minutes = 1
+        d = np.arange(num_minutes) * self.km_per_minute
+        k = np.searchsorted(x, d, side='right')
+        return (d * slope[k] - intercept[k]).astype(np.float32)
+
+    def rows(self, nodes):
+        """Row of the table for each of an array of start nodes, computing any tables
+        that are missing."""
+        new_nodes = [int(node) for node in np.unique(nodes) if int(node) not in self.row_of_node]
+        if new_nodes:
+            tables = [self._reachable_table(node) for node in new_nodes]
+            width = max([self.reachable_km.shape[1]] + [len(table) for table in tables])
+            old = self.reachable_km
+            self.reachable_km = np.empty((len(old) + len(tables), width), dtype=np.float32)
+            self.reachable_km[:len(old), :old.shape[1]] = old
+            self.reachable_km[:len(old), old.shape[1]:] = old[:, -1:]
+            for i, (node, table) in enumerate(zip(new_nodes, tables)):
+                row = len(old) + i
+                self.reachable_km[row, :len(table)] = table
+                self.reachable_km[row, len(table):] = table[-1]
+                self.row_of_node[node] = row
+        return np.array([self.row_of_node[int(node)] for node in np.atleast_1d(nodes)],
+                        dtype=np.int64)
+
+    def reachable(self, rows, minutes):
+        """km of road reachable from each start node (given by rows()) in the given number
+        of minutes of driving."""
+        minutes = np.minimum(np.asarray(minutes, dtype=np.int64), self.reachable_km.shape[1] - 1)
+        return self.reachable_km[rows, minutes].astype(float)
+
+# Tests
+_grid = grid_road_network(3, 4)
+assert _grid.num_nodes == 12 and len(_grid.source) == 2 * (3 * 3 + 2 * 4)
+assert (_grid.source[_grid.reverse] == _grid.target).all()
+assert list(_grid.nearest_nodes([25.1, 26.0], [80.1, 81.4])) == [0, 11]
+_positions = RoadPositions(_grid, np.random.default_rng(0), [0, 5, 11])
+_positions.advance(np.array([0, 1]), 200)
+_lat, _lon = _positions.lat_lon()
+assert ((25 <= _lat) & (_lat <= 26) & (80 <= _lon) & (_lon <= 81.5)).all()
+assert _positions.nodes()[2] == 11
+assert (_positions.along < _grid.length[_positions.edge]).all()
+_isochrones = IsochroneCache(_grid, speed_kmph=60)
+_rows = _isochrones.rows([0, 0, 5])
+assert _rows[0] == _rows[1] != _rows[2]
+_roads_km = _grid.length[_isochrones.roads].sum()
+_reached = _isochrones.reachable(_rows, [0, 10 ** 6, 30])
+assert _reached[0] == 0 and abs(_reached[1] - _roads_km) < 1e-3 * _roads_km
+# The first 30 km out of a node are along each of its roads (4 for node 5, 2 for node 0).
+assert abs(_reached[2] - 4 * 30) < 1e-3
+assert abs(_isochrones.reachable(_rows[:1], [30])[0] - 2 * 30) < 1e-3
@@ -0,0 +1,309 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import math
+
+import numpy as np
+
+from lib.location import EARTH_RADIUS
+from lib.timeline import DEFAULT_HORIZON_MINUTES
+
+# Gravitational parameter of the Earth, in km3/s2.
+EARTH_MU = 398600.4418
+# Rotation of the Earth relative to the stars, in radians per second.
+EARTH_ROTATION = 7.2921159e-5
+J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+# Satellites are placed this many times a minute. A location counts as covered for a
+# whole minute if a satellite can see it at any of them.
+SAMPLES_PER_MINUTE = 4
+# Hack alert: Free-roaming TELs (and trucks) are assumed to be somewhere in this box,
+# (lat_min, lat_max, lon_min, lon_max), which is split into square regions for SAR.
+CHINA_BOUNDS = (18, 54, 73, 135)
+
+@dataclass
+class SatelliteConstellation:
+    """A Walker constellation of satellites in circular orbits: num_planes evenly spaced
+    orbital planes, each with satellites_per_plane evenly spaced satellites."""
+    num_planes: int
+    satellites_per_plane: int
+    altitude_km: float
+    inclination_deg: float
+    # Distance from the point directly below a satellite within which it can image the
+    # ground (by looking off to the side).
+    access_radius_km: float
+    # Walker phasing: satellites in adjacent planes are offset by phasing/total satellites
+    # of an orbit.
+    phasing: int = 1
+
+def sidereal_angle(when):
+    """Angle (in radians) the Earth has turned relative to the stars, at timezone-aware
+    datetime `when` (Greenwich mean sidereal time)."""
+    days = (when - J2000).total_seconds() / 86400
+    return math.radians((280.46061837 + 360.98564736629 * days) % 360)
+
+def ground_tracks(constellation, start, minutes):
+    """The points directly below each of the satellites of a constellation.
+
+    Orbits are circular and unperturbed, and the Earth is a sphere, which is plenty for
+    deciding when a satellite is overhead, and needs no orbital data to be downloaded.
+
+    Args:
+      constellation: A SatelliteConstellation.
+      start: Timezone-aware datetime of minute 0.
+      minutes: Array of (possibly fractional) minutes after start.
+    Returns:
+      (lat, lon) arrays in degrees, of shape (number of satellites, len(minutes)).
+    """
+    k = constellation
+    num_satellites = k.num_planes * k.satellites_per_plane
+    plane, slot = np.divmod(np.arange(num_satellites), k.satellites_per_plane)
+    node = (2 * math.pi * plane / k.num_planes)[:, np.newaxis]
+    phase = 2 * math.pi * (slot / k.satellites_per_plane + k.phasing * plane / num_satellites)
+    seconds = np.asarray(minutes, dtype=float) * 60
+    mean_motion = math.sqrt(EARTH_MU / (EARTH_RADIUS + k.altitude_km)**3)
+    u = phase[:, np.newaxis] + mean_motion * seconds
+    inclination = math.radians(k.inclination_deg)
+    x = np.cos(node) * np.cos(u) - np.sin(node) * np.sin(u) * math.cos(inclination)
+    y = np.sin(node) * np.cos(u) + np.cos(node) * np.sin(u) * math.cos(inclination)
+    z = np.sin(u) * math.sin(inclination)
+    lat = np.degrees(np.arcsin(z))
+    lon = np.degrees(np.arctan2(y, x) - sidereal_angle(start) - EARTH_ROTATION * seconds)
+    return lat, (lon + 180) % 360 - 180
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)],
+                    axis=-1)
+
+def covered_minutes(constellation, lats, lons, start, t0, t1, chunk_minutes=720):
+    """Find the minutes when each location is within view of a satellite.
+
+    Args:
+      constellation: A SatelliteConstellation.
+      lats, lons: Arrays of the locations.
+      start: Timezone-aware datetime of minute 0.
+      t0, t1: Minutes to look at, from t0 up to (not including) t1.
+      chunk_minutes: How many minutes of satellite positions to work on at once.
+    Returns:
+      Arrays (locations, minutes), with an entry for each minute a location is covered,
+      ordered by location and then by minute.
+    """
+    lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+    targets = _unit_vectors(lats, lons)
+    radius = constellation.access_radius_km / EARTH_RADIUS
+    # Only satellites over (roughly) the area containing the locations can see any of them.
+    radius_deg = math.degrees(radius)
+    lat_min, lat_max = lats.min() - radius_deg, lats.max() + radius_deg
+    lon_radius = radius_deg / max(math.cos(math.radians(min(max(abs(lat_min), abs(lat_max)),
+                                                             89))), 1e-6)
+    lon_min, lon_width = lons.min() - lon_radius, lons.max() - lons.min() + 2 * lon_radius
+    found = []
+    for chunk_start in range(t0, t1, chunk_minutes):
+        minutes = np.arange(chunk_start * SAMPLES_PER_MINUTE,
+                            min(chunk_start + chunk_minutes, t1) * SAMPLES_PER_MINUTE)
+        lat, lon = ground_tracks(constellation, start, minutes / SAMPLES_PER_MINUTE)
+        near = ((lat_min <= lat) & (lat <= lat_max) &
+                ((lon - lon_min) % 360 <= lon_width))
+        _, samples = np.nonzero(near)
+        if len(samples) == 0:
+            continue
+        points = _unit_vectors(lat[near], lon[near])
+        # Angle between each location and satellite, compared through its cosine.
+        locations, columns = np.nonzero(targets @ points.T >= math.cos(radius))
+        found.append(locations * (t1 - t0) + minutes[samples[columns]] // SAMPLES_PER_MINUTE - t0)
+    if not found:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    locations, minutes = np.divmod(np.unique(np.concatenate(found)), t1 - t0)
+    return locations, minutes + t0
+
+class Coverage(ABC):
+    """When each of a number of locations is within view of SAR satellites."""
+    @abstractmethod
+    def covered(self, t, indices=None):
+        """Whether each location is covered at time t.
+
+        Args:
+          t: Simulation time.
+          indices: Optional array of location indices. Defaults to every location.
+        """
+        pass
+
+    @abstractmethod
+    def any_covered(self, t):
+        """Whether any location is covered at time t."""
+        pass
+
+    @abstractmethod
+    def fraction_covered(self, t):
+        """Fraction of the locations covered at time t."""
+        pass
+
+class CadenceCoverage(Coverage):
+    """Every location is covered for `duration` minutes out of every `cadence`, starting
+    at its own offset, as if a satellite passed over it on a fixed cycle."""
+    def __init__(self, offsets, cadence, duration):
+        """
+        Args:
+          offsets: Array of times at which each location is first covered.
+          cadence: Minutes between the starts of passes.
+          duration: Minutes each pass lasts.
+        """
+        self.offsets = np.asarray(offsets)
+        self.cadence = cadence
+        self.duration = duration
+        # Number of locations covered at each minute of the cycle.
+        starts = np.bincount(self.offsets % cadence, minlength=cadence)
+        self.count = sum(np.roll(starts, d) for d in range(duration))
+
+    def covered(self, t, indices=None):
+        offsets = self.offsets if indices is None else self.offsets[indices]
+        return (t - offsets) % self.cadence < self.duration
+
+    def any_covered(self, t):
+        return self.count[t % self.cadence] > 0
+
+    def fraction_covered(self, t):
+        # Hack alert: This is the fraction averaged over the cycle, rather than at time t,
+        # which is all that is known about locations which aren't tracked individually.
+        return self.duration / self.cadence
+
+class PassCoverage(Coverage):
+    """Coverage of a set of locations by a SatelliteConstellation, precomputed as the
+    sorted intervals of time each location is within view of a satellite.
+
+    Intervals are stored sorted by location and then by start, with a search key
+    (location * span + start) for each, so finding the interval a location is in at time
+    t is a binary search. The number of locations covered at each minute is also kept,
+    so minutes with no coverage anywhere can be skipped in O(1).
+
+    Intervals are computed up to an end time, and extended if asked about a later time.
+    """
+    def __init__(self, constellation, lats, lons, start, t0, t1=None):
+        """
+        Args:
+          constellation: A SatelliteConstellation.
+          lats, lons: Arrays of the locations.
+          start: Timezone-aware datetime of simulation time 0.
+          t0: Simulation time to start at.
+          t1: Optional simulation time to compute intervals up to.
+        """
+        self.constellation = constellation
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.start = start
+        self.t0 = t0
+        self.t1 = t0
+        # Location, start and end (exclusive) of each interval.
+        self.location = np.zeros(0, dtype=np.int64)
+        self.begin = np.zeros(0, dtype=np.int64)
+        self.end = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self._extend(t1 if t1 is not None else t0 + DEFAULT_HORIZON_MINUTES)
+
+    def __len__(self):
+        return len(self.lats)
+
+    def _extend(self, t):
+        """Compute intervals up to at least time t."""
+        if t <= self.t1:
+            return
+        # Grow geometrically, so that lazily extending a long run stays cheap.
+        t = max(t, 2 * self.t1 - self.t0)
+        locations, minutes = covered_minutes(self.constellation, self.lats, self.lons,
+                                             self.start, self.t1, t)
+        # Consecutive minutes of one location make up an interval.
+        first = np.ones(len(minutes), dtype=bool)
+        first[1:] = (locations[1:] != locations[:-1]) | (minutes[1:] != minutes[:-1] + 1)
+        last = np.roll(first, -1)
+        location = np.concatenate([self.location, locations[first]])
+        begin = np.concatenate([self.begin, minutes[first]])
+        end = np.concatenate([self.end, minutes[last] + 1])
+        order = np.lexsort((begin, location))
+        self.location, self.begin, self.end = location[order], begin[order], end[order]
+        self.count = np.concatenate([self.count, np.bincount(minutes - self.t1,
+                                                             minlength=t - self.t1)])
+        self.t1 = t
+        self.span = t - self.t0
+        self.keys = self.location * self.span + (self.begin - self.t0)
+
+    def covered(self, t, indices=None):
+        self._extend(t + 1)
+        rows = np.arange(len(self)) if indices is None else np.asarray(indices)
+        # The last interval of each location starting no later than t.
+        i = np.searchsorted(self.keys, rows * self.span + (t - self.t0), side='right') - 1
+        found = i >= 0
+        i = np.maximum(i, 0)
+        return found & (self.location[i] == rows) & (self.end[i] > t)
+
+    def any_covered(self, t):
+        self._extend(t + 1)
+        return self.count[t - self.t0] > 0
+
+    def fraction_covered(self, t):
+        self._extend(t + 1)
+        return self.count[t - self.t0] / len(self)
+
+class RegionGrid:
+    """Square regions (of size_deg degrees of latitude and longitude) covering a box."""
+    def __init__(self, bounds, size_deg):
+        """
+        Args:
+          bounds: (lat_min, lat_max, lon_min, lon_max) of the box.
+          size_deg: Size of each region.
+        """
+        self.lat_min, lat_max, self.lon_min, lon_max = bounds
+        self.size_deg = size_deg
+        self.num_rows = math.ceil((lat_max - self.lat_min) / size_deg)
+        self.num_cols = math.ceil((lon_max - self.lon_min) / size_deg)
+        rows, cols = np.divmod(np.arange(self.num_rows * self.num_cols), self.num_cols)
+        # Centers of the regions.
+        self.lat = self.lat_min + (rows + .5) * size_deg
+        self.lon = self.lon_min + (cols + .5) * size_deg
+
+    def locate(self, lat, lon):
+        """Index of the region containing each location (or the nearest region, for
+        locations outside the box)."""
+        rows = np.clip(((np.asarray(lat) - self.lat_min) // self.size_deg).astype(np.int64),
+                       0, self.num_rows - 1)
+        cols = np.clip(((np.asarray(lon) - self.lon_min) // self.size_deg).astype(np.int64),
+                       0, self.num_cols - 1)
+        return rows * self.num_cols + cols
+
+def sar_coverage(s, hashes, lats, lons):
+    """The SAR Coverage of some locations in a simulation: from the config's
+    sar_constellation if it has one, and otherwise on a fixed cycle.
+
+    Args:
+      s: The simulation object.
+      hashes: Array of stable hashes of the locations' names, which give their offsets
+        in the cycle.
+      lats, lons: Arrays of the locations.
+    """
+    c = s.c
+    if c.sar_constellation is None:
+        return CadenceCoverage(s.t + np.asarray(hashes) % c.sar_cadence_min,
+                               c.sar_cadence_min, c.sar_duration_min)
+    return PassCoverage(c.sar_constellation, lats, lons, s.start_t, s.t, s.end_t)
+
+# Tests
+_polar = SatelliteConstellation(num_planes=1, satellites_per_plane=1, altitude_km=500,
+                                inclination_deg=90, access_radius_km=500)
+_start = datetime(2021, 1, 20, 4, tzinfo=timezone.utc)
+_lat, _lon = ground_tracks(_polar, _start, np.arange(0, 200, .5))
+assert np.abs(_lat).max() <= 90 and np.abs(_lat).max() > 85
+assert np.all(np.abs(np.diff(_lat[0, :50])) < 4)
+# The satellite sees the point below it, and nothing on the far side of the Earth.
+_locations, _minutes = covered_minutes(_polar, [_lat[0, 20], -_lat[0, 20]],
+                                       [_lon[0, 20], _lon[0, 20] + 180], _start, 0, 20)
+assert 0 in _locations and 10 in _minutes[_locations == 0] and 1 not in _locations
+_coverage = PassCoverage(_polar, [_lat[0, 20], 0, 30], [_lon[0, 20], 0, 100], _start, 0, 100)
+for _t in range(0, 300):
+    _brute = np.zeros(3, dtype=bool)
+    _brute[covered_minutes(_polar, _coverage.lats, _coverage.lons, _start, _t, _t + 1)[0]] = True
+    assert (_coverage.covered(_t) == _brute).all()
+    assert _coverage.any_covered(_t) == _brute.any()
+_cadence = CadenceCoverage(np.array([0, 3, 29]), 30, 5)
+assert list(_cadence.covered(2)) == [True, False, True]
+assert all(_cadence.any_covered(_t) == _cadence.covered(_t).any() for _t in range(60))
+_grid = RegionGrid(CHINA_BOUNDS, 2)
+assert _grid.locate(18.5, 73.5) == 0 and _grid.locate(90, 0) == _grid.num_rows * _grid.num_cols - _grid.num_cols
@@ -1,17 +1,28 @@
 from datetime import datetime, timedelta
 from dateutil import tz
 from enum import Enum, auto
-from heapq import heappop, heappush
-from numpy import random
+import os
+import pickle
+import traceback
 
 from lib.config import DefaultConfig
+from lib.convergence import check_convergence, min_convergence_minutes
 from lib.enums import TLOKind, SimulationMode
+from lib.event_queue import EventQueue, Event, PeriodicEvent, BatchedEventHandle
 from lib.intelligence import Intelligence
+from lib.intelligence_types import IdAllocator
+from lib.population import TruckPopulation, load_population_raster
 from lib.renderer import Renderer
-from lib.tel_base import TELBase, load_bases, load_tels_from_bases
+from lib.rng import RandomStreams
+from lib.tel_base import TELBase, load_bases, load_tels_from_bases, start_bases
+from lib.tel_fleet import TELFleet
+from lib.time import to_minutes, to_datetime
 
 TZ = tz.gettz('Asia/Shanghai')
 
+# Bumped whenever a change to the simulation makes old snapshots unusable.
+SNAPSHOT_VERSION = 17
+
 class Simulation:
     def __init__(self,
                  c=None,
@@ -35,31 +46,57 @@ class Simulation:
           the simulation deterministic. If not provided use a random seed.
         """
         self.c = c if c is not None else DefaultConfig()
-        random.seed(seed=rng_seed)
-        self.event_queue = []
-        self.t = start_datetime.replace(tzinfo=TZ)
-        self.start_t = self.t
-        self.next_event_id = 0
+        # Every random draw in the simulation comes from one of these streams, rather
+        # than numpy's global random state, so simulations are independent of each other.
+        self.rng = RandomStreams(rng_seed)
+        self.event_queue = EventQueue()
+        # Batched PeriodicEvents, keyed by (interval, phase, end time).
+        self.periodic_batches = {}
+        # The simulation clock is an integer count of minutes since start_t. Use
+        # to_datetime() to get the corresponding real time.
+        self.start_t = start_datetime.replace(tzinfo=TZ)
+        self.t = 0
         if runtime:
-            self.end_datetime = self.t + runtime
+            self.end_t = to_minutes(runtime)
+        else:
+            self.end_t = None
         
-        self.render_interval = timedelta(minutes=render_interval_mins)        
+        self.render_interval = render_interval_mins
+        # Timelines of random values sampled ahead of time (such as the weather), and
+        # anything else holding random draws made ahead of time (such as the SIGINT
+        # observer), which have to be redrawn if the random number streams are reseeded.
+        # Each has a resample(t) method.
+        self.timelines = []
+        # Latest list of ConvergenceResults, if the config sets convergence_targets.
+        self.convergence = None
         self.renderer = Renderer(self.c, output_folder)
         
+        # Source of the unique IDs of TELs and other tracked objects.
+        self.ids = IdAllocator()
+        # Every TEL and decoy, whether tied to a base or free-roaming.
+        self.fleet = TELFleet(self.c, self.rng, self.ids)
         if self.c.simulation_mode == SimulationMode.BASE_LOCAL:
-            self.bases = load_bases(self.c)
+            self.bases = load_bases(self.c, self.rng, self.fleet)
         else:
             self.bases = None
     
         if self.c.simulation_mode == SimulationMode.FREE_ROAMING:
-            self.free_tels, self.free_tlos = load_tels_from_bases(self.c)
+            self.free_tels, self.free_tlos = load_tels_from_bases(self.c, self.rng, self.fleet)
         else:
             self.free_tels = None
             self.free_tlos = None
             
-        self.intelligence = Intelligence(self.c)
+        # Trucks spread over a population raster, if the config gives one.
+        raster = load_population_raster(self.c)
+        self.population = TruckPopulation(self.c, raster, self.bases) if raster else None
+            
+        self.intelligence = Intelligence(self.c, self.rng)
         self.start()
         
+    def to_datetime(self, t=None):
+        """Convert a simulation time (defaults to the current time) into a timezone-aware datetime."""
+        return to_datetime(self.start_t, self.t if t is None else t)
+
     def tels(self):
         if self.bases:
             for base in self.bases:
@@ -83,60 +120,254 @@ class Simulation:
     def start(self):
         """Start each of the entities in the simulation (i.e. schedule their update events)."""
         if self.bases:
-            for base in self.bases:
-                base.start(self)
-        if self.free_tels:
-            for tel in self.free_tels:
-                tel.start(self)
+            start_bases(self, self.bases)
+        self.fleet.start(self)
+        if self.population:
+            self.population.start(self)
         self.intelligence.start(self)
         self.renderer.start(self)
         
-    def run(self):
-        """Run the simulation loop until there are no more events, or the max time is reached."""
+    def run(self, snapshot_path=None, snapshot_interval_mins=6*60):
+        """Run the simulation loop until there are no more events, or the max time is reached.
+        
+        Args:
+          snapshot_path: Optional file name. If set, a snapshot of the simulation is
+            saved there periodically (and at the end of the run), so that a long run
+            can be resumed with Simulation.restore() if it is interrupted.
+          snapshot_interval_mins: How often to save a snapshot, in simulated minutes.
+        
+        If the config sets convergence_targets, the run can end before the end time, once
+        the assessments have converged. The last convergence check is kept in
+        self.convergence.
+        """
+        next_snapshot_t = self.t + snapshot_interval_mins
+        if self.c.convergence_targets:
+            next_convergence_t = max(self.t, min_convergence_minutes(self.c,
+                                                                     self.fleet.loop_time))
         while self._process_next_event():
-            pass
+            if snapshot_path and self.t >= next_snapshot_t:
+                self.snapshot(snapshot_path)
+                next_snapshot_t = self.t + snapshot_interval_mins
+            if self.c.convergence_targets and self.t >= next_convergence_t:
+                self.convergence = check_convergence(self.c, self.intelligence.ts,
+                                                     self.intelligence.assessment_stats,
+                                                     self.fleet.loop_time)
+                if all(result.converged for result in self.convergence):
+                    break
+                next_convergence_t = self.t + to_minutes(self.c.convergence_check_interval)
+        if snapshot_path:
+            self.snapshot(snapshot_path)
         self.renderer.render(self)
         self.renderer.final_summary(self)
+        
+    def snapshot(self, path):
+        """Save the full state of the simulation to a file.
+        
+        This includes the clock, the event queue, the state of every TEL and base,
+        the random number generators, the tracker files and the assessments so far.
+        Shouldn't be called from inside an event, since the event being resolved
+        isn't in the queue at that point.
+        """
+        state = {
+            'version': SNAPSHOT_VERSION,
+            'simulation': self,
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            
+    @staticmethod
+    def restore(path, runtime=None):
+        """Load a simulation saved with snapshot(). Calling run() on the result continues
+        the simulation where it left off.
+        
+        Args:
+          path: File the snapshot was saved to.
+          runtime: Optional timedelta (measured from the start of the simulation). If
+            set, replaces the runtime the simulation was originally created with, e.g.
+            to continue a finished run for longer.
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        if state['version'] != SNAPSHOT_VERSION:
+            raise ValueError('Snapshot {} has version {}, expected {}.'.format(
+                path, state['version'], SNAPSHOT_VERSION))
+        s = state['simulation']
+        if runtime:
+            s.end_t = to_minutes(runtime)
+        return s
+    
+    def branch(self, n, warmup, seeds=None, result=None, max_parallel=None):
+        """Run the simulation up to a point, then continue it independently n times.
+        
+        The shared prefix (e.g. the transient while TEL schedules and tracker files
+        settle down) is only simulated once. The simulation then forks into n child
+        processes, which share the parent's memory copy-on-write. Each child reseeds
+        its random number streams and runs the rest of the simulation, and sends its
+        results back to the parent. Requires os.fork(), so is not available on Windows.
+        
+        The parent simulation is left at the end of the shared prefix, and can be
+        continued or branched again.
+        
+        Args:
+          n: Number of continuations to run.
+          warmup: timedelta indicating how long (from the current time) to run the
+            shared prefix for.
+          seeds: Optional list of n seeds (integers or SeedSequences), one per
+            continuation. If not set, independent seeds are spawned from the
+            simulation's own seed.
+          result: Optional function taking the finished child Simulation and returning
+            a picklable result. Defaults to returning (times, assessment_stats) from
+            its Intelligence object.
+          max_parallel: Maximum number of children to run at once. Defaults to the
+            number of CPUs.
+        Returns:
+          A list of the n results, in the same order as seeds.
+        """
+        if not hasattr(os, 'fork'):
+            raise NotImplementedError('Simulation.branch() requires os.fork().')
+        if seeds is None:
+            seeds = self.rng.spawn(n)
+        if len(seeds) != n:
+            raise ValueError('Expected {} seeds, got {}.'.format(n, len(seeds)))
+        if result is None:
+            result = _default_branch_result
+        max_parallel = max_parallel or os.cpu_count() or 1
+        
+        warmup_end_t = self.t + to_minutes(warmup)
+        while self._process_next_event(until=warmup_end_t):
+            pass
+        
+        results = []
+        for start in range(0, n, max_parallel):
+            children = [self._fork_branch(seed, result)
+                        for seed in seeds[start:start + max_parallel]]
+            for pid, read_fd in children:
+                with os.fdopen(read_fd, 'rb') as f:
+                    data = f.read()
+                _, status = os.waitpid(pid, 0)
+                if status != 0 or not data:
+                    raise RuntimeError('Simulation branch (pid {}) failed.'.format(pid))
+                results.append(pickle.loads(data))
+        return results
     
-    def _process_next_event(self):
+    def _fork_branch(self, seed, result):
+        """Fork a child process which finishes the simulation with the given seed.
+        
+        Returns:
+          (pid, read_fd) for the child, where read_fd is a pipe the child writes its
+          pickled result to.
+        """
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid != 0:
+            os.close(write_fd)
+            return pid, read_fd
+        
+        # In the child process.
+        os.close(read_fd)
+        status = 1
+        try:
+            self.rng.reseed(seed)
+            for timeline in self.timelines:
+                timeline.resample(self.t)
+            while self._process_next_event():
+                pass
+            with os.fdopen(write_fd, 'wb') as f:
+                pickle.dump(result(self), f, protocol=pickle.HIGHEST_PROTOCOL)
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+    
+    def _process_next_event(self, until=None):
         """Pop the next event off of the queue and resolve it.
         
+        Args:
+          until: Optional simulation time to stop at, if earlier than the end time.
         Returns:
           True if the simulation is ongoing, or false if it is over.
         """
-        if len(self.event_queue) > 0:
-            t, _, func = heappop(self.event_queue)
-            if (self.end_datetime and t > self.end_datetime):
-                return False
-            self.t = t
-            func()
-            return True
-        else:
+        if until is None or (self.end_t is not None and self.end_t < until):
+            until = self.end_t
+        # Events after the end time are left in the queue, so that a snapshot of a
+        # finished simulation can be continued.
+        next_event = self.event_queue.pop(until=until)
+        if next_event is None:
             return False
+        t, event = next_event
+        self.t = t
+        if event.__class__ is PeriodicEvent:
+            for callback in event.callbacks:
+                callback()
+            # Re-arm the same event object rather than scheduling a new one.
+            next_t = t + event.interval
+            if not event.cancelled and (event.end_t is None or next_t <= event.end_t):
+                event.next_t = next_t
+                self.event_queue.push(next_t, event)
+            else:
+                # Stopped events can't take on new callbacks.
+                key = (event.interval, t % event.interval, event.end_t)
+                if self.periodic_batches.get(key) is event:
+                    del self.periodic_batches[key]
+        else:
+            event.func()
+        return True
 
-    def _schedule_event_at_time(self, event, future_datetime):
+    def _schedule_event_at_time(self, event, future_t):
         """Schedule an event for future execution.
         
         Args:
           event: A lambda (with no arguments) that resolves the effects of
-                 the event (including enqueuing any future events).
-          future_datetime: A datetime indicating when the event should
+                 the event (including enqueuing any future events), or an Event.
+          future_t: Simulation time (minutes since start) when the event should
             take place. Not scheduled if it's in the past.
+        Returns:
+          The scheduled Event, which can be used to cancel it, or None if it wasn't
+          scheduled.
         """
-        if future_datetime < self.t:
+        if future_t < self.t:
             print("ERROR: Tried to schedule event in the past.")
-            print("  Attempted scheduling time: ", future_datetime)
+            print("  Attempted scheduling time: ", future_t)
             print("  Current time: ", self.t)
-            return
+            return None
 
-        # We add an "event id" field to handle events which happen at
-        # the same time. This is just an ever-increasing integer, so it
-        # ensures that events happening at the same time step happen in
-        # the order they were enqueued.
-        heappush(self.event_queue, (future_datetime, self.next_event_id, event))
-        self.next_event_id += 1
-        
-    def schedule_event_relative(self, event, delta, repeat_interval=None):
+        if not isinstance(event, Event):
+            event = Event(event)
+        # The event queue orders events happening at the same time in the
+        # order they were enqueued.
+        self.event_queue.push(future_t, event)
+        return event
+        
+    def _schedule_periodic_event(self, event, first_t, interval, end_t, batch):
+        """Schedule an event which repeats on a fixed interval.
+        
+        If batch is set and a batched event with the same interval, end time and next
+        occurrence is already scheduled, the event is added to it rather than taking
+        up its own slot in the event queue.
+        
+        Returns:
+          A handle which can be used to cancel the event, or None if it wasn't scheduled.
+        """
+        if end_t is not None and first_t > end_t:
+            return None
+        if batch:
+            key = (interval, first_t % interval, end_t)
+            periodic = self.periodic_batches.get(key)
+            # Only join an event which is still waiting in the queue to fire at first_t.
+            if (periodic is not None and not periodic.cancelled and
+                    periodic.queue is not None and periodic.next_t == first_t):
+                return periodic.add(event)
+        periodic = PeriodicEvent(event, first_t, interval, end_t)
+        if self._schedule_event_at_time(periodic, first_t) is None:
+            return None
+        if batch:
+            self.periodic_batches[key] = periodic
+            return BatchedEventHandle(periodic, event)
+        return periodic
+        
+    def schedule_event_relative(self, event, delta, repeat_interval=None,
+                                repeat_until=None, batch=False):
         """Schedule an event to happen at a relative future time
            (e.g. one hour from now).
            
@@ -146,15 +377,26 @@ class Simulation:
           delta: timedelta indicating how far in the future the event should happen.
           repeat_interval: Optional timedelta. If set, repeat the event on this
             interval after the first occurrence.
+          repeat_until: Optional timedelta (relative to now). If set, a repeating
+            event stops repeating after this point.
+          batch: If true, a repeating event may be resolved together with other
+            batched events that share its interval and timing. Useful for large
+            numbers of similar events, such as TEL schedules.
+        Returns:
+          A handle with a cancel() method, which removes the event (and any future
+          repetitions) from the schedule. None if the event couldn't be scheduled.
         """
+        t = self.t + to_minutes(delta)
         if repeat_interval:
-            def repeat_event():
-                event()
-                self.schedule_event_relative(event, repeat_interval,
-                                             repeat_interval=repeat_interval)
-            self._schedule_event_at_time(repeat_event, self.t + delta)
+            end_t = self.t + to_minutes(repeat_until) if repeat_until is not None else None
+            handle = self._schedule_periodic_event(event, t, to_minutes(repeat_interval),
+                                                   end_t, batch)
         else:
-            self._schedule_event_at_time(event, self.t + delta)
+            handle = self._schedule_event_at_time(event, t)
+        return handle
+            
+def _default_branch_result(s):
+    return s.intelligence.ts, s.intelligence.assessment_stats
             
 def run(c, runtime=timedelta(hours=24), rng_seed=42):
     s = Simulation(runtime=runtime, c=c, rng_seed=rng_seed)
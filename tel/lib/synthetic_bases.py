@@ -0,0 +1,88 @@
+import csv
+
+import numpy as np
+
+from lib.enums import TELKind
+
+# Columns of a TEL base file, as read by fleet_template.FleetTemplate.
+BASE_COLUMNS = (['name', 'latitude', 'longitude', 'offshore_observability',
+                 'population_density', 'missile_count'] +
+                [tel_kind.name for tel_kind in TELKind])
+
+def synthetic_bases(num_bases, seed=0, tel_kind_weights=None, kinds_per_base=1,
+                    tels_per_base=(6, 36), population_density=(10, 600),
+                    coastal_fraction=0.2):
+    """Generate made-up TEL bases, for studying how the simulation scales.
+
+    Bases are scattered over the same area as random_locations(), and the other columns
+    are spread over roughly the same ranges as the real bases in data/tel_bases.csv.
+    The same arguments always give the same bases.
+
+    Args:
+      num_bases: Number of bases to generate.
+      seed: Seed for the random number generator.
+      tel_kind_weights: Optional dict from TELKind to how common that kind is. Defaults
+        to every kind being equally common.
+      kinds_per_base: How many different TEL kinds each base has (most real bases
+        only have one).
+      tels_per_base: (min, max) number of TELs at each base.
+      population_density: (min, max) persons per km2 around each base. Densities are
+        spread evenly on a log scale.
+      coastal_fraction: Fraction of bases which are observable from offshore (with an
+        offshore observability of 0.5 or 1).
+    Returns:
+      A list of rows, as dicts from column name (see BASE_COLUMNS) to value.
+    """
+    rng = np.random.default_rng(seed)
+    kinds = list(TELKind)
+    if tel_kind_weights is None:
+        weights = np.ones(len(kinds))
+    else:
+        weights = np.array([tel_kind_weights.get(kind, 0) for kind in kinds], dtype=float)
+    weights /= weights.sum()
+    kinds_per_base = min(kinds_per_base, np.count_nonzero(weights))
+
+    lat = rng.uniform(25, 45, size=num_bases)
+    lon = rng.uniform(80, 120, size=num_bases)
+    coastal = rng.random(num_bases) < coastal_fraction
+    offshore = np.where(coastal, rng.choice([0.5, 1], size=num_bases), 0)
+    log_density = rng.uniform(np.log(population_density[0]), np.log(population_density[1]),
+                              size=num_bases)
+    num_tels = rng.integers(tels_per_base[0], tels_per_base[1] + 1, size=num_bases)
+
+    rows = []
+    for i in range(num_bases):
+        base_kinds = rng.choice(len(kinds), size=kinds_per_base, replace=False, p=weights)
+        counts = np.zeros(len(kinds), dtype=np.int64)
+        counts[base_kinds] = rng.multinomial(num_tels[i], np.full(kinds_per_base,
+                                                                  1 / kinds_per_base))
+        row = {
+            'name': 'Synthetic{}'.format(i),
+            'latitude': round(lat[i], 2),
+            'longitude': round(lon[i], 2),
+            'offshore_observability': float(offshore[i]),
+            'population_density': round(np.exp(log_density[i]), 2),
+            'missile_count': int(num_tels[i]),
+        }
+        for kind, count in zip(kinds, counts):
+            row[kind.name] = int(count)
+        rows.append(row)
+    return rows
+
+def write_bases(filename, rows):
+    """Write TEL base rows (such as from synthetic_bases()) to a csv file, which can be
+    used as Config.bases_filename."""
+    with open(filename, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=BASE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+# Tests
+_rows = synthetic_bases(50, seed=1, kinds_per_base=2)
+assert _rows == synthetic_bases(50, seed=1, kinds_per_base=2)
+assert _rows != synthetic_bases(50, seed=2, kinds_per_base=2)
+assert all(set(row) == set(BASE_COLUMNS) for row in _rows)
+assert all(sum(row[kind.name] for kind in TELKind) == row['missile_count'] for row in _rows)
+assert all(6 <= row['missile_count'] <= 36 for row in _rows)
+_rows = synthetic_bases(20, tel_kind_weights={TELKind.DF_26: 1})
+assert all(row['DF_26'] == row['missile_count'] for row in _rows)
@@ -1,149 +1,137 @@
-from datetime import timedelta
-from enum import Enum, auto
-import math
-from numpy import random
-from uuid import uuid4
-
-from lib.enums import TELState, TLOKind, TELKind, SimulationMode, Weather
-from lib.intelligence_types import TLO
-from lib.location import random_location
-from lib.time import format_time
+from lib.enums import TELState, TLOKind, TELKind, Weather
+from lib.location import Location
 
 class TEL:
     """A single Transporter-Erector-Launcher.
-    
+
     TELs are not modeled as having a precise geographic location. Instead, they are
     associated with a TEL base (which does have a location), and at any given
     moment are in one out of a set of possible states (in base, roaming, hiding in a
     tunnel, etc).
+
+    The data for every TEL (and decoy) in the simulation is stored in columns of a
+    TELFleet. A TEL object is only a lightweight view of one row of the fleet, which is
+    convenient for debugging and for code that deals with one TEL at a time. Code which
+    loops over all of the TELs should use the fleet's arrays instead.
     """
-    
-    def __init__(self, c, base, name, tel_kind=None, tlo_kind=None, is_decoy=False):
-        """Initialize a TEL object.
-        
+    __slots__ = ('fleet', 'index', 'uid')
+
+    def __init__(self, fleet, index, uid):
+        """
         Args:
-          c: Config object.
-          base: The TELBase this TEL belongs to. None for free-roaming TELs.
-          name: Human readable name for this TEL.
-          tel_kind: A TELKind enum value.
-          tlo_kind: A TLOKind enum (indicating whether this is a TEL or a decoy).
+          fleet: The TELFleet holding this TEL's data.
+          index: The TEL's row in the fleet.
+          uid: The TEL's unique ID, from the simulation's IdAllocator.
         """
-        self.c = c
-        self.base = base
-        self.name = name
-        self.uid = uuid4().int
-        assert tel_kind is not None
-        self.kind = tel_kind
-        self.tlo_kind = tlo_kind
-        if not self.base:
-            self.update_weather()
-            self.update_shore()
-            # Hack alert: Give non-base TELs a random location somewhere vaguely in China,
-            # so that they can have a realistic distribution of sunrise times.
-            self.location = random_location()
-
-        # For the schedule stored in the TEL object, we use the format (offset, state),
-        # where offsets are relative to the loop time and shifted randomly for each TEL.
-        self.loop_time = timedelta()
-        for (duration, _) in c.tel_schedule:
-            self.loop_time += duration
-        offset = timedelta(minutes=random.randint(self.loop_time / timedelta(minutes=1)))
-        self.offset_schedule = []
-        for (duration, state) in c.tel_schedule:
-            if offset >= self.loop_time:
-                offset -= self.loop_time
-            assert offset < self.loop_time
-            self.offset_schedule.append((offset, state))
-            offset += duration
-        # Sorting the schedule has the effect of rotating the order of states around based
-        # on the current offset.
-        self.offset_schedule.sort()
-        
-        self.state_history = []
-        self.mated = random.random() < c.mating_fraction
-        
-    def update_weather(self):
-        self.weather = Weather(random.choice(list(self.c.weather_probabilities.keys()),
-                                             p=list(self.c.weather_probabilities.values())))
-        #print("Weather around {} is now {}".format(self.name, self.weather.name))
-        
-    def update_shore(self):
-        self.near_shore = random.random() < self.c.offshore_observability
-        
-    def start(self, s):
-        if self.offset_schedule[0][0] == timedelta():
-            self.update_state(s, self.offset_schedule[0][1])
-        else:
-            self.update_state(s, self.offset_schedule[-1][1])
-
-        for offset, state in self.offset_schedule:
-            s.schedule_event_relative(lambda state=state: self.update_state(s, state),
-                                      offset, repeat_interval=self.loop_time)
-            
-        if not self.base:
-            frequency = self.c.weather_change_frequency
-            offset = timedelta(minutes=random.randint(frequency / timedelta(minutes=1)))
-            s.schedule_event_relative(self.update_weather, offset, repeat_interval=frequency)
-            
-            offset_mins = hash(self.name + "SAR") % self.c.sar_cadence_min
-            self.sar_offset = s.t + timedelta(minutes=offset_mins)  
-            
-            frequency = self.c.offshore_change_frequency
-            offset = timedelta(minutes=random.randint(frequency / timedelta(minutes=1)))
-            s.schedule_event_relative(self.update_shore, offset, repeat_interval=frequency)
-        
-    
-    def update_state(self, s, state):
-        self.state = state
-        self.state_history.append((s.t, state))
-        self.emcon = random.random() < self.c.emcon_fraction
-        self.ground_sensor_attempted = False
-                
-    def status(self):
+        self.fleet = fleet
+        self.index = index
+        self.uid = uid
+
+    def __eq__(self, other):
+        return (isinstance(other, TEL) and self.fleet is other.fleet and
+                self.index == other.index)
+
+    def __hash__(self):
+        return hash(self.index)
+
+    @property
+    def name(self):
+        return self.fleet.name(self.index)
+
+    @property
+    def kind(self):
+        return TELKind(self.fleet.kind[self.index])
+
+    @property
+    def tlo_kind(self):
+        return TLOKind(self.fleet.tlo_kind[self.index])
+
+    @property
+    def base(self):
+        """The TELBase this TEL belongs to. None for free-roaming TELs."""
+        base = self.fleet.base[self.index]
+        return self.fleet.bases[base] if base >= 0 else None
+
+    @property
+    def state(self):
+        return TELState(self.fleet.state[self.index])
+
+    @property
+    def emcon(self):
+        return bool(self.fleet.emcon[self.index])
+
+    @property
+    def mated(self):
+        return bool(self.fleet.mated[self.index])
+
+    def weather_at(self, t):
+        """Local weather at time t. Only tracked for free-roaming TELs."""
+        return Weather(self.fleet.weather_at(t, self.index))
+
+    def near_shore_at(self, t):
+        """Whether the TEL is observable from offshore at time t. Only tracked for
+        free-roaming TELs."""
+        return bool(self.fleet.near_shore_at(t, self.index))
+
+    @property
+    def location(self):
+        """The TEL's position on the road network, if the config gives one. Otherwise, a
+        random location used for sunrise and sunset times (only set for free-roaming TELs)."""
+        if self.fleet.roads is not None:
+            lat, lon = self.fleet.positions(self.index)
+            return Location(lat, lon)
+        return Location(self.fleet.lat[self.index], self.fleet.lon[self.index])
+
+    @property
+    def loop_time(self):
+        return self.fleet.loop_time
+
+    @property
+    def offset_schedule(self):
+        """The TEL's schedule as a sorted list of (offset, state), where offsets (in minutes)
+        are relative to the loop time and shifted randomly for each TEL."""
+        return self.fleet.offset_schedule(self.index)
+
+    def time_of_day(self, t):
+        """TimeOfDay at the TEL's location at (timezone-aware) time t. Only for free-roaming TELs."""
+        return self.fleet.time_of_day(self.index, t)
+
+    def state_at(self, t):
+        """The state the TEL is in at time t (minutes since start), according to its schedule."""
+        return TELState(self.fleet.states_at(t, self.index))
+
+    def state_changes(self, t0, t1):
+        """The state changes between times t0 and t1 (inclusive), as a list of (t, state)
+        tuples in chronological order. Starting the schedule counts as a change."""
+        _, times, states = self.fleet.state_changes_between(t0, t1, [self.index])
+        return [(int(t), TELState(state)) for t, state in zip(times, states)]
+
+    def status(self, t):
+        """Description of the TEL at time t (normally the current time)."""
         if self.base:
             return '{} {} associated with {} Base. uid: {}, current state: {}'.format(
                 self.kind.name, self.tlo_kind.name,
                 self.base.name, self.uid, self.state.name)
         else:
             return '{} {}. uid: {}, current state: {}, weather: {}'.format(
-                self.kind.name, self.tlo_kind.name, self.uid, self.state.name, self.weather.name)
-    
+                self.kind.name, self.tlo_kind.name, self.uid, self.state.name,
+                self.weather_at(t).name)
+
     def roaming_time_since_observation(self, obs, current_t):
-        """How long the TEL has been roaming since the observation."""
-        last_state = None
-        last_t = obs.t
-        roam_time = timedelta()
-        for (t, state) in self.state_history + [(current_t, None)]:
-            if t > last_t:
-                if last_state == TELState.ROAMING:
-                    roam_time += t - last_t
-                last_state = state
-                last_t = t
-            last_state = state
-        return roam_time
-            
-    def destruction_area(self, obs, current_t, target_t):
+        """How long (in minutes) the TEL has been roaming since the observation."""
+        return int(self.fleet.roaming_time([self.index], [obs.t], current_t)[0])
+
+    def destruction_area(self, obs, current_t, target_t, roam_time=None):
         """km2 that must be destroyed to destroy this TEL.
-        
+
         Args:
           obs: Last known observation of this TEL.
+          current_t: Current simulation time (minutes since start).
           target_t: Time missile will land (not necessary current time).
+          roam_time: Optional result of roaming_time_since_observation(obs, current_t),
+            if the caller has already computed it.
         """
-        # TELs that are in a base (and not leaving soon) are destroyed when the base is blown up, no
-        # extra missiles needed.
-        if self.state in {TELState.IN_BASE, TELState.ARRIVING_BASE}:
-            return -1
-        
-        # Significant simplification:
-        # I am only calculating how much time the TEL *did in fact spend roaming* since it was last
-        # observed. In cases where the TEL went into a shelter the US may actually have a large
-        # degree of uncertainty about this. E.g. suppose that since observation, the TEL drove for
-        # 10 minutes, then hid in an overpass for 3 hours and is still there. The US would just know
-        # it hasn't seen it for 3 hours 10 mins, and could maybe guess it had stopped, but wouldn't
-        # really know. This calculation gives the US credit for knowing it only drove 10 minutes.
-        roam_time = self.roaming_time_since_observation(obs, current_t)
-        roam_time += target_t - current_t
-        
-        roam_dist = self.c.tel_speed_kmph * (roam_time / timedelta(hours=1))
-        roam_area = math.pi * roam_dist**2
-        return roam_area * self.c.destruction_area_factor
\ No newline at end of file
+        if roam_time is None:
+            roam_time = self.roaming_time_since_observation(obs, current_t)
+        return float(self.fleet.destruction_areas([self.index], [roam_time],
+                                                  target_t - current_t)[0])
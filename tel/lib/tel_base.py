@@ -1,68 +1,58 @@
 from collections import Counter
-import csv
-from datetime import timedelta
-import numpy.random as random
 
-from lib.enums import TELState, TELKind, TLOKind, Weather
+import numpy as np
+
+from lib.enums import TELState, TLOKind, Weather
+from lib.fleet_template import fleet_template
 from lib.intelligence_types import TLO
-from lib.location import Location
-from lib.tel import TEL
+from lib.location import Location, SunTable
+from lib.rng import stable_hash
+from lib.satellites import sar_coverage
+from lib.timeline import weather_timeline
 
 class TELBase:
     """A home base out of which several TELs are stationed."""
-    def __init__(self, c, name, location, offshore_observability=0):
+    def __init__(self, c, rng, fleet, name, location, offshore_observability=0):
         self.c = c
+        self.rng = rng
+        self.fleet = fleet
         self.name = name
         self.location = location
-        self.tel_count_by_kind = Counter()
         self.tels = []
         self.tlos = []
         self.offshore_observability = offshore_observability    
 
-    def update_weather(self):
-        self.weather = Weather(random.choice(list(self.c.weather_probabilities.keys()),
-                                             p=list(self.c.weather_probabilities.values())))
-        if self.c.debug:
-            print("Weather in {} is now {}".format(self.name, self.weather.name))
+    def weather_at(self, t):
+        """The weather at the base at time t."""
+        return Weather(self.weather.value_at(t, self.weather_index))
+
+    def is_day(self, now):
+        """Whether it's daytime at the base at (timezone-aware) time now."""
+        return bool(self.sun.is_day(now, self.sun_index))
         
-    def add_tel(self, c, baseless=False, **kwargs):
-        """Construct a TEL and add it to this base.
-        Forwards all keyword args to the TEL constructor.
+    def start(self, s, weather, sun, sar, index):
+        """Start the base. The TELs are started by the fleet.
         
         Args:
-          c: Config
-          baseless: If true, don't permanently link the TEL to this base.
-        
-        Returns: The TEL which was added.
+          s: The simulation.
+          weather: Timeline of the weather at every base.
+          sun: SunTable of every base.
+          sar: SAR Coverage of every base.
+          index: This base's row of weather, sun and sar.
         """
-        tel_kind = kwargs["tel_kind"]
-        tlo_kind = kwargs["tlo_kind"]
-        name = '{}_{}_{}_{}'.format(self.name, tlo_kind.name, tel_kind.name,
-                                    self.tel_count_by_kind[(tlo_kind, tel_kind)])
-        if baseless:
-            tel = TEL(c, None, name, **kwargs)
-        else:
-            tel = TEL(c, self, name, **kwargs)
-            self.tels.append(tel)
-        
-        self.tel_count_by_kind[(tlo_kind, tel_kind)] += 1
-        return tel
-        
-    def start(self, s):
-        self.update_weather()
-        for tel in self.tels:
-            tel.start(s)
-            
-        frequency = self.c.weather_change_frequency
-        offset = timedelta(minutes=random.randint(frequency / timedelta(minutes=1)))
-        s.schedule_event_relative(self.update_weather, offset, repeat_interval=frequency)
-        
-        offset_mins = hash(self.name + "SAR") % self.c.sar_cadence_min
-        self.sar_offset = s.t + timedelta(minutes=offset_mins)   
+        self.weather = weather
+        self.weather_index = index
+        self.sun = sun
+        self.sun_index = index
+        self.sar = sar
+        self.sar_index = index
+        # Fleet indices of the base's TELs, in the same order as the start of self.tlos.
+        self.tel_indices = np.array([tel.index for tel in self.tels], dtype=np.int64)
     
-    def status(self):
+    def status(self, t):
+        """Description of the base at time t (normally the current time)."""
         return '{} TEL Base ({} TELs) {} is {}'.format(
-            self.name, len(self.tels), self.location.to_string(), self.weather.name)
+            self.name, len(self.tels), self.location.to_string(), self.weather_at(t).name)
 
     def tel_state_summary(self):
         state_counts = Counter()
@@ -73,106 +63,51 @@ class TELBase:
             ['  {} TELs in state {}'.format(state_counts[state], state.name)
              for state in TELState])
 
-def load_base(c, row):
-    name = row['name']
-    lat = float(row['latitude'])
-    lon = float(row['longitude'])
-    offshore_observability = float(row['offshore_observability'])
-    persons_per_km2 = float(row['population_density'])
-    
-    base = TELBase(c, name, Location(lat, lon), offshore_observability=offshore_observability)
-    for tel_kind in TELKind:
-        if c.tel_kinds is not None and tel_kind not in c.tel_kinds:
-            continue
-        if tel_kind.name not in row:
-            print("No column for {} in TEL base csv file".format(tel_kind.name))
-            continue
-            
-        num_tels = round(c.tel_count_multiplier * int(row[tel_kind.name]))
-        for _ in range(num_tels):
-            tel = base.add_tel(c, tel_kind=tel_kind, tlo_kind=TLOKind.TEL)
-            tlo = TLO(kind=TLOKind.TEL, tel=tel, uid=tel.uid, base=base)
-            base.tlos.append(tlo)
-            
-        num_decoys = int(c.decoy_ratio * num_tels)
-        for _ in range(num_decoys):
-            tel = base.add_tel(c, tel_kind=tel_kind, tlo_kind=TLOKind.DECOY)
-            tlo = TLO(kind=TLOKind.DECOY, tel=tel, uid=tel.uid, base=base)
-            base.tlos.append(tlo)
-            
-        num_secret_decoys = int(c.secret_decoy_ratio * num_tels)
-        for _ in range(num_secret_decoys):
-            tel = base.add_tel(c, tel_kind=tel_kind, tlo_kind=TLOKind.SECRET_DECOY)
-            tlo = TLO(kind=TLOKind.SECRET_DECOY, tel=tel, uid=tel.uid, base=base)
-            base.tlos.append(tlo)
+def start_bases(s, bases):
+    """Start each of the bases, sampling the weather at every base for the whole run, and
+    working out when each is within view of SAR satellites."""
+    weather = weather_timeline(s.c, s.rng, len(bases), s.t, s.end_t)
+    s.timelines.append(weather)
+    lats = [base.location.lat for base in bases]
+    lons = [base.location.lon for base in bases]
+    sun = SunTable(lats, lons)
+    sar = sar_coverage(s, [stable_hash(base.name + "SAR") for base in bases], lats, lons)
+    for i, base in enumerate(bases):
+        base.start(s, weather, sun, sar, i)
 
-    num_trucks = c.trucks_per_person * persons_per_km2 * c.tel_area_km2
-    trucks = TLO(TLOKind.TRUCK, base=base, multiplicity=num_trucks)
-    base.tlos.append(trucks)
-    
-    if len(base.tels) > 0:
-        return base
-    else:
-        return None
+def load_bases(c, rng, fleet):
+    """Load the TEL bases, and their TELs into fleet.
 
-def load_bases(c):
-    with open(c.bases_filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        bases = []
-        for row in reader:
-            base = load_base(c, row)
-            if base is not None:
-                bases.append(base)
-        return bases
+    The bases file is only read the first time it's needed (see fleet_template()). Each
+    call makes new TELBase, TEL and TLO objects, and new random draws for the fleet.
+    """
+    template = fleet_template(c)
+    bases = [TELBase(c, rng, fleet, name, Location(lat, lon), offshore_observability=offshore)
+             for name, lat, lon, offshore in zip(template.base_names, template.base_lat,
+                                                  template.base_lon, template.base_offshore)]
+    fleet.load(template, bases)
+    for i, (b, tlo_kind) in enumerate(zip(template.base.tolist(), template.tlo_kinds)):
+        base = bases[b]
+        tel = fleet.tel(i)
+        base.tels.append(tel)
+        base.tlos.append(TLO(kind=tlo_kind, tel=tel, uid=tel.uid, base=base))
+    for base, num_trucks in zip(bases, template.base_trucks):
+        base.tlos.append(TLO(TLOKind.TRUCK, base=base, multiplicity=num_trucks))
+    return bases
 
-def load_tels_from_base(c, row):
-    tels = []
-    tlos = []
-    name = row['name']
-    
-    # Hack alert: We create base to help with naming and initializing the TELs, and then discard it.
-    base = TELBase(c, name, Location(0, 0))
-    for tel_kind in TELKind:
-        if c.tel_kinds is not None and tel_kind not in c.tel_kinds:
-            continue
-        if tel_kind.name not in row:
-            print("No column for {} in TEL base csv file".format(tel_kind.name))
-            continue
-            
-        num_tels = round(c.tel_count_multiplier * int(row[tel_kind.name]))
-        for _ in range(num_tels):
-            tel = base.add_tel(c, baseless=True, tel_kind=tel_kind, tlo_kind=TLOKind.TEL)
-            tlo = TLO(kind=TLOKind.TEL, tel=tel, uid=tel.uid)
-            tels.append(tel)
-            tlos.append(tlo)
-            
-        num_decoys = int(c.decoy_ratio * num_tels)
-        for _ in range(num_decoys):
-            tel = base.add_tel(c, baseless=True, tel_kind=tel_kind, tlo_kind=TLOKind.DECOY)
-            tlo = TLO(kind=TLOKind.DECOY, tel=tel, uid=tel.uid)
-            tels.append(tel)
-            tlos.append(tlo)
-            
-        num_secret_decoys = int(c.secret_decoy_ratio * num_tels)
-        for _ in range(num_secret_decoys):
-            tel = base.add_tel(c, baseless=True, tel_kind=tel_kind, tlo_kind=TLOKind.SECRET_DECOY)
-            tlo = TLO(kind=TLOKind.SECRET_DECOY, tel=tel, uid=tel.uid)
-            tels.append(tel)
-            tlos.append(tlo)
-    
-    return tels, tlos
+def load_tels_from_bases(c, rng, fleet):
+    """Load free-roaming TELs (with the numbers given for each base) into fleet.
 
-def load_tels_from_bases(c):
-    with open(c.bases_filename) as csvfile:
-        reader = csv.DictReader(csvfile)
-        tels = []
-        tlos = []
-        for row in reader:
-            new_tels, new_tlos = load_tels_from_base(c, row)
-            tels += new_tels
-            tlos += new_tlos
+    As with load_bases(), the bases file is only read the first time it's needed.
 
-        trucks = TLO(TLOKind.TRUCK, multiplicity=c.trucks_in_china)
-        tlos.append(trucks)
-        return tels, tlos
-    
\ No newline at end of file
+    Returns:
+      (list of TELs, list of TLOs), where the TLOs are those of the TELs followed by
+      the trucks.
+    """
+    template = fleet_template(c)
+    fleet.load(template)
+    tels = fleet.tels()
+    tlos = [TLO(kind=tlo_kind, tel=tel, uid=tel.uid)
+            for tel, tlo_kind in zip(tels, template.tlo_kinds)]
+    tlos.append(TLO(TLOKind.TRUCK, multiplicity=template.trucks_in_china))
+    return tels, tlos
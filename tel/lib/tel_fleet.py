@@ -0,0 +1,419 @@
+from collections import namedtuple
+from datetime import timedelta
+from functools import partial
+import math
+
+import numpy as np
+
+from lib.enums import TELState, TimeOfDay, Weather
+from lib.intelligence_types import IdAllocator, ObservationBatch
+from lib.location import SunTable, random_locations
+from lib.road_network import IsochroneCache, RoadPositions, load_road_network
+from lib.satellites import CHINA_BOUNDS, RegionGrid, sar_coverage
+from lib.tel import TEL
+from lib.time import to_minutes
+from lib.timeline import weather_timeline, shore_timeline
+
+# Tables of a TEL schedule, indexed by how many minutes (the phase) into the loop a TEL
+# is. entry_at_phase[p] is the schedule entry a TEL is in p minutes into the loop,
+# starts_at_phase[p] whether an entry starts then, and roam_before_phase[p] the number of
+# minutes spent roaming before that (with an extra entry at the end, for the whole loop).
+ScheduleTables = namedtuple('ScheduleTables', [
+    'loop_time', 'entry_states', 'entry_starts', 'entry_at_phase', 'starts_at_phase',
+    'roam_before_phase'])
+
+def schedule_tables(tel_schedule):
+    """The ScheduleTables of a schedule, given as a list of (timedelta, TELState)."""
+    loop_time = sum(to_minutes(duration) for duration, _ in tel_schedule)
+    entry_states = np.array([int(state) for _, state in tel_schedule], dtype=np.int8)
+    entry_starts = np.zeros(len(tel_schedule), dtype=np.int64)
+    entry_at_phase = np.zeros(loop_time, dtype=np.int64)
+    starts_at_phase = np.zeros(loop_time, dtype=bool)
+    roam_before_phase = np.zeros(loop_time + 1, dtype=np.int64)
+    phase = 0
+    for i, (duration, state) in enumerate(tel_schedule):
+        minutes = to_minutes(duration)
+        entry_starts[i] = phase
+        entry_at_phase[phase:phase + minutes] = i
+        if minutes > 0:
+            starts_at_phase[phase] = True
+        roaming = 1 if state == TELState.ROAMING else 0
+        roam_before_phase[phase + 1:phase + minutes + 1] = (
+            roam_before_phase[phase] + roaming * np.arange(1, minutes + 1))
+        phase += minutes
+    return ScheduleTables(loop_time, entry_states, entry_starts, entry_at_phase,
+                          starts_at_phase, roam_before_phase)
+
+class TELFleet:
+    """Every TEL (and decoy) in a simulation, stored as columns of numpy arrays.
+
+    Row i of each column holds the data for TEL i. The columns are filled in by load(),
+    from the FleetTemplate of the bases file. Individual TELs can still be looked at
+    through TEL objects, which are lightweight views of one row.
+
+    All TELs follow the same schedule (c.tel_schedule), shifted by a random offset. So
+    a TEL's state and roaming time at any time can be computed directly from tables of
+    the schedule, indexed by how far into the schedule loop the TEL is.
+    """
+    def __init__(self, c, rng, ids=None):
+        """
+        Args:
+          c: Config object.
+          rng: The simulation's RandomStreams.
+          ids: The simulation's IdAllocator, which the TELs' uids come from. If not set,
+            the fleet uses its own.
+        """
+        self.c = c
+        self.rng = rng
+        self.ids = ids if ids is not None else IdAllocator()
+        # TELBases that have TELs in the fleet. Column `base` indexes into this list.
+        self.bases = []
+        # Template the fleet was loaded from. Its columns (kind, base, names, etc) are
+        # shared by the fleet, and must not be modified.
+        self.template = None
+        self.size = 0
+
+        # Tables of the schedule (see ScheduleTables).
+        tables = schedule_tables(c.tel_schedule)
+        self.loop_time = tables.loop_time
+        self.entry_states = tables.entry_states
+        self.entry_starts = tables.entry_starts
+        self.entry_at_phase = tables.entry_at_phase
+        self.starts_at_phase = tables.starts_at_phase
+        self.roam_before_phase = tables.roam_before_phase
+        self.roam_per_loop = int(self.roam_before_phase[-1])
+        # Time the TELs started following their schedules. Set by start().
+        self.start_t = 0
+
+        num_states = max(TELState) + 1
+        # TELs and decoys in physical shelters can't be observed by satellites.
+        self.obstructed_by_state = np.zeros(num_states, dtype=bool)
+        self.obstructed_by_state[[TELState.IN_BASE, TELState.SHELTERING]] = True
+        # TELs that are in a base (and not leaving soon) are destroyed when the base is
+        # blown up.
+        self.in_base_by_state = np.zeros(num_states, dtype=bool)
+        self.in_base_by_state[[TELState.IN_BASE, TELState.ARRIVING_BASE]] = True
+        self.visibility_by_weather = np.zeros(max(Weather) + 1)
+        self.visibility_by_weather[Weather.CLEAR] = 1
+        self.visibility_by_weather[Weather.CLOUDY] = c.cloudy_visibility
+        # Local weather and shore proximity of free-roaming TELs. Set by start().
+        self.weather = None
+        self.near_shore = None
+
+    def load(self, template, bases=None):
+        """Fill in the fleet from a FleetTemplate, drawing each TEL's random schedule offset
+        and mating (and location, for free-roaming TELs).
+
+        Args:
+          template: The FleetTemplate.
+          bases: List of TELBases, matching the template's bases. None for free-roaming TELs.
+        """
+        c = self.c
+        rng = self.rng
+        n = template.size
+        self.template = template
+        self.bases = bases if bases is not None else []
+        self.size = n
+        self.uid = self.ids.allocate_range(n)
+        self.group = template.group
+        self.number = template.number
+        self.kind = template.kind
+        self.tlo_kind = template.tlo_kind
+        self.base = template.base
+
+        self.lat = np.full(n, math.nan)
+        self.lon = np.full(n, math.nan)
+        free = np.flatnonzero(self.base < 0)
+        # Hack alert: Give non-base TELs a random location somewhere vaguely in China,
+        # so that they can have a realistic distribution of sunrise times.
+        self.lat[free], self.lon[free] = random_locations(rng.locations, len(free))
+        self.offset = rng.schedules.integers(self.loop_time, size=n)
+        self.mated = rng.schedules.random(n) < c.mating_fraction
+
+        self.state = np.zeros(n, dtype=np.int8)
+        self.emcon = np.zeros(n, dtype=bool)
+        self.sigint_offset = template.sigint_hash % 60
+        # Functions called with the indices of the TELs whose EMCON has just changed.
+        self.emcon_listeners = []
+        # Functions called with (time, indices, states) of the TELs which have just started
+        # a new schedule entry.
+        self.state_listeners = []
+        # SAR Coverage of free-roaming TELs, and the regions it's divided into (if it
+        # comes from a satellite constellation). Set by start().
+        self.sar = None
+        self.sar_regions = None
+        # Sunrise and sunset times of free-roaming TELs (base TELs have no location).
+        self.sun = SunTable(self.lat, self.lon)
+        # RoadPositions of every TEL, and the road reachable from each TEL's starting
+        # node, if the config gives a road network.
+        self.roads = None
+        self.isochrones = None
+
+    def tel(self, i):
+        return TEL(self, i, int(self.uid[i]))
+
+    def tels(self):
+        return [self.tel(i) for i in range(self.size)]
+
+    def name(self, i):
+        """Human readable name of TEL i."""
+        return self.template.name(i)
+
+    def offset_schedule(self, i):
+        """TEL i's schedule as a sorted list of (offset, state), where offsets (in minutes)
+        are relative to the loop time and shifted by the TEL's random offset."""
+        return sorted(((int(self.offset[i]) + int(start)) % self.loop_time, TELState(state))
+                      for start, state in zip(self.entry_starts, self.entry_states))
+
+    def start(self, s):
+        """Put every TEL into its starting state, and schedule the updates to the TELs."""
+        c = self.c
+        rng = self.rng
+        self.start_t = s.t
+        self.state[:] = self.states_at(s.t)
+        self.emcon[:] = rng.emcon.random(self.size) < c.emcon_fraction
+
+        # TELs which start a schedule entry at the same point of the loop are updated by
+        # a single event, in order of their index.
+        num_entries = len(self.entry_starts)
+        phases = (self.offset[:, np.newaxis] + self.entry_starts) % self.loop_time
+        order = np.argsort(phases, axis=None, kind='stable')
+        indices, entries = np.divmod(order, num_entries)
+        self._schedule_groups(s, partial(self.update_states, s), phases.ravel()[order],
+                              indices, timedelta(minutes=self.loop_time),
+                              self.entry_states[entries])
+
+        # Free-roaming TELs have their own weather and shore proximity, sampled for the
+        # whole run. The timelines have a row for every TEL, but in practice either all
+        # of the TELs are free-roaming or none are.
+        if (self.base < 0).any():
+            self.weather = weather_timeline(c, rng, self.size, s.t, s.end_t)
+            self.near_shore = shore_timeline(c, rng, self.size, s.t, s.end_t)
+            s.timelines += [self.weather, self.near_shore]
+            if c.sar_constellation is None:
+                self.sar = sar_coverage(s, self.template.sar_hash, self.lat, self.lon)
+            else:
+                # Satellite passes are worked out for regions of China rather than for
+                # each TEL, since the TELs can be anywhere.
+                self.sar_regions = RegionGrid(CHINA_BOUNDS, c.sar_region_size_deg)
+                self.sar = sar_coverage(s, None, self.sar_regions.lat, self.sar_regions.lon)
+
+        if c.road_network_filename is not None:
+            self._start_roads(s)
+
+    def _start_roads(self, s):
+        """Give every TEL a position on the road network, starting at the node nearest
+        its base (or its random location, for free-roaming TELs), and schedule moving
+        the roaming TELs."""
+        network = load_road_network(self.c.road_network_filename)
+        lat = self.lat.copy()
+        lon = self.lon.copy()
+        based = np.flatnonzero(self.base >= 0)
+        lat[based] = [self.bases[b].location.lat for b in self.base[based]]
+        lon[based] = [self.bases[b].location.lon for b in self.base[based]]
+        self.roads = RoadPositions(network, self.rng.get('roads'),
+                                   network.nearest_nodes(lat, lon))
+        self.road_sun = SunTable(network.lat, network.lon)
+        self.isochrones = IsochroneCache(network, self.c.tel_speed_kmph)
+        self.isochrone_row = self.isochrones.rows(self.roads.home)
+        self.road_density = network.road_density()
+        interval = self.c.road_movement_interval
+        s.schedule_event_relative(self.move_tels, interval, repeat_interval=interval,
+                                  batch=True)
+
+    def move_tels(self):
+        """Drive every roaming TEL along the roads, for one road_movement_interval."""
+        c = self.c
+        roaming = np.flatnonzero(self.state == TELState.ROAMING)
+        km = c.tel_speed_kmph * (c.road_movement_interval / timedelta(hours=1))
+        self.roads.advance(roaming, km)
+
+    def _schedule_groups(self, s, update, offsets, indices, interval, *columns):
+        """Schedule a repeating update for each group of TELs with the same offset.
+
+        Args:
+          s: The simulation.
+          update: Method called with the indices of the TELs in a group (and the matching
+            entries of columns).
+          offsets: Sorted array of the offset (in minutes) of each update.
+          indices: Array with the index of the TEL for each update.
+          interval: timedelta between updates.
+          columns: Optional extra arrays, one entry per update.
+        """
+        boundaries = np.flatnonzero(np.diff(offsets)) + 1
+        for group in np.split(np.arange(len(offsets)), boundaries):
+            if len(group) == 0:
+                continue
+            # Events are bound methods rather than lambdas, so that they can be saved in
+            # a snapshot of the simulation.
+            event = partial(update, indices[group], *[column[group] for column in columns])
+            s.schedule_event_relative(event, timedelta(minutes=int(offsets[group[0]])),
+                                      repeat_interval=interval, batch=True)
+
+    def update_states(self, s, indices, states):
+        self.state[indices] = states
+        for listener in self.state_listeners:
+            listener(s.t, indices, states)
+        emcon = self.rng.emcon.random(len(indices)) < self.c.emcon_fraction
+        changed = indices[emcon != self.emcon[indices]]
+        self.emcon[indices] = emcon
+        if len(changed):
+            for listener in self.emcon_listeners:
+                listener(changed)
+        if self.roads is not None:
+            # Hack alert: TELs don't drive back to base. They are put back at their
+            # starting point when they get there.
+            self.roads.return_home(indices[states == TELState.IN_BASE])
+
+    def unannounced_at_start(self):
+        """The TELs whose starting state is not passed to the state_listeners, because
+        their schedule doesn't start a new entry at the start time.
+
+        Returns:
+          Arrays (indices, states).
+        """
+        indices = np.flatnonzero(~self.starts_at_phase[self._phases(self.start_t, None)])
+        return indices, self.state[indices]
+
+    def _phases(self, t, indices):
+        offset = self.offset if indices is None else self.offset[indices]
+        return (t - self.start_t - offset) % self.loop_time
+
+    def states_at(self, t, indices=None):
+        """The state (as an int) each TEL is in at time t (minutes since start), according
+        to its schedule.
+
+        Args:
+          t: Simulation time.
+          indices: Optional index or array of indices of TELs. Defaults to every TEL.
+        """
+        return self.entry_states[self.entry_at_phase[self._phases(t, indices)]]
+
+    def obstructed_at(self, t, indices=None):
+        """Whether each TEL is in a shelter (so can't be seen by satellites) at time t."""
+        return self.obstructed_by_state[self.states_at(t, indices)]
+
+    def state_changes_between(self, t0, t1, indices=None):
+        """The state changes between times t0 and t1 (inclusive). Starting the schedule
+        counts as a change.
+
+        Returns:
+          Arrays (indices, times, states) with one entry per change, ordered by TEL and
+          then by time.
+        """
+        indices = np.arange(self.size) if indices is None else np.asarray(indices)
+        changed, times, states = [], [], []
+        for t in range(max(t0, self.start_t), t1 + 1):
+            if t == self.start_t:
+                rows = indices
+            else:
+                rows = indices[self.starts_at_phase[self._phases(t, indices)]]
+            changed.append(rows)
+            times.append(np.full(len(rows), t, dtype=np.int64))
+            states.append(self.states_at(t, rows))
+        if not changed:
+            return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.int8))
+        changed = np.concatenate(changed)
+        order = np.argsort(changed, kind='stable')
+        return changed[order], np.concatenate(times)[order], np.concatenate(states)[order]
+
+    def _roaming_time_before(self, t, indices):
+        """Minutes each TEL spent roaming before time t, counted from an arbitrary point
+        (so only differences are meaningful)."""
+        loops, phase = np.divmod(t - self.start_t - self.offset[indices], self.loop_time)
+        return loops * self.roam_per_loop + self.roam_before_phase[phase]
+
+    def roaming_time(self, indices, obs_t, t):
+        """How long (in minutes) each TEL has been roaming between obs_t and t.
+
+        Args:
+          indices: Array of TEL indices.
+          obs_t: Array with the time of the last observation of each TEL.
+          t: Current simulation time.
+        """
+        obs_t = np.asarray(obs_t)
+        roam_time = (self._roaming_time_before(t, indices) -
+                     self._roaming_time_before(obs_t, indices))
+        return np.where(obs_t < t, roam_time, 0)
+
+    def destruction_areas(self, indices, roam_time, extra_minutes):
+        """km2 that must be destroyed to destroy each TEL, or -1 for TELs in a base (which
+        are destroyed along with the base, no extra missiles needed).
+
+        Args:
+          indices: Array of TEL indices.
+          roam_time: Array of how long each TEL has been roaming since it was last
+            observed (see roaming_time()).
+          extra_minutes: Time until the missile lands.
+        """
+        # Significant simplification:
+        # I am only calculating how much time the TEL *did in fact spend roaming* since it was last
+        # observed. In cases where the TEL went into a shelter the US may actually have a large
+        # degree of uncertainty about this. E.g. suppose that since observation, the TEL drove for
+        # 10 minutes, then hid in an overpass for 3 hours and is still there. The US would just know
+        # it hasn't seen it for 3 hours 10 mins, and could maybe guess it had stopped, but wouldn't
+        # really know. This calculation gives the US credit for knowing it only drove 10 minutes.
+        roam_minutes = np.asarray(roam_time) + extra_minutes
+        roam_dist = self.c.tel_speed_kmph * (roam_minutes / 60)
+        roam_area = math.pi * roam_dist**2
+        if self.isochrones is not None:
+            # With a road network, the TEL can only be on the roads it could have reached
+            # from its starting point. Convert the km of road to the area containing that
+            # much road, at the network's road density.
+            road_km = self.isochrones.reachable(self.isochrone_row[indices], roam_minutes)
+            roam_area = np.minimum(roam_area, road_km / self.road_density)
+        in_base = self.in_base_by_state[self.state[indices]]
+        return np.where(in_base, -1, roam_area * self.c.destruction_area_factor)
+
+    def weather_at(self, t, indices):
+        """Local weather (as an int) of each free-roaming TEL at time t."""
+        return self.weather.value_at(t, indices)
+
+    def weather_visibility(self, t, indices):
+        """Chance of seeing each free-roaming TEL in its local weather at time t."""
+        return self.visibility_by_weather[self.weather.value_at(t, indices)]
+
+    def near_shore_at(self, t, indices):
+        """Whether each free-roaming TEL is observable from offshore at time t."""
+        return self.near_shore.value_at(t, indices).astype(bool)
+
+    def sar_visible(self, t, indices):
+        """Whether each (free-roaming) TEL is in view of SAR satellites at time t."""
+        if self.sar_regions is None:
+            return self.sar.covered(t, indices)
+        if self.roads is not None:
+            lat, lon = self.positions(indices)
+        else:
+            lat, lon = self.lat[indices], self.lon[indices]
+        return self.sar.covered(t, self.sar_regions.locate(lat, lon))
+
+    def daylight(self, now, indices):
+        """1 for each (free-roaming) TEL where it's daytime, 0 otherwise.
+
+        Args:
+          now: Timezone-aware time (such as Simulation.to_datetime()).
+          indices: Array of TEL indices.
+        """
+        if self.roads is not None:
+            return self.road_sun.is_day(now, self.roads.nodes(indices)).astype(float)
+        return self.sun.is_day(now, indices).astype(float)
+
+    def positions(self, indices=None):
+        """Arrays of the latitude and longitude of each TEL. Only available if the config
+        gives a road network."""
+        return self.roads.lat_lon(indices)
+
+    def time_of_day(self, i, now):
+        return TimeOfDay.DAY if self.daylight(now, [i])[0] else TimeOfDay.NIGHT
+
+    def observations(self, indices, t, method):
+        """An ObservationBatch of the TELs indices, each seen once.
+
+        Args:
+          indices: Array of TEL indices.
+          t: Time each TEL was seen at, as an array or a single time.
+          method: The DetectionMethod.
+        """
+        return ObservationBatch(t, method, self.uid[indices], self.states_at(t, indices),
+                                self.tlo_kind[indices], np.ones(len(indices)))
@@ -1,2 +1,20 @@
+from datetime import timedelta
+
+# The simulation clock is an integer number of minutes since the simulation started.
+# Datetimes are only constructed where they are really needed (sunrise/sunset lookups,
+# printing, and plotting).
+MINUTE = timedelta(minutes=1)
+
+def to_minutes(delta):
+    """Convert a timedelta into a number of minutes (an int, if it's a whole number)."""
+    minutes = delta / MINUTE
+    if minutes.is_integer():
+        return int(minutes)
+    return minutes
+
+def to_datetime(start_t, t):
+    """Convert a simulation time (minutes since start_t) into a datetime."""
+    return start_t + timedelta(minutes=t)
+
 def format_time(t):
-    return t.strftime('%Y/%m/%d-%H:%M')
\ No newline at end of file
+    return t.strftime('%Y/%m/%d-%H:%M')
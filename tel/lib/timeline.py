@@ -0,0 +1,144 @@
+import numpy as np
+
+from lib.time import to_minutes
+
+# How far ahead to sample a timeline if the simulation has no end time. Timelines are
+# extended automatically if asked about a later time.
+DEFAULT_HORIZON_MINUTES = 7 * 24 * 60
+
+class Timeline:
+    """A random categorical value (such as the weather) for each of a number of entities,
+    sampled ahead of time.
+
+    Each entity's value changes every `period` minutes, starting `offset` minutes after
+    start_t (different for each entity, so the changes are spread out). Values are
+    stored as an int8 array indexed by (entity, period), where period 0 holds the value
+    before the first change. Looking a value up is an index into this array, so no
+    events are needed to keep it up to date.
+
+    Each new value is drawn from p, or, if a transition matrix is given, from the row of
+    the matrix for the entity's previous value, which lets values persist for longer than
+    one period.
+    """
+    def __init__(self, rng, codes, p, period, start_t, offsets, end_t=None, transitions=None):
+        """
+        Args:
+          rng: numpy Generator to draw from.
+          codes: List of the possible values (ints, e.g. Weather enum values).
+          p: Probability of each value.
+          period: Minutes between changes.
+          start_t: Simulation time the timeline starts at.
+          offsets: Array with the time of each entity's first change, in minutes after
+            start_t (between 0 and period).
+          end_t: Optional simulation time to sample up to. More is sampled if needed.
+          transitions: Optional matrix, where transitions[i][j] is the probability of
+            changing from codes[i] to codes[j].
+        """
+        self.rng = rng
+        self.codes = np.array(codes, dtype=np.int8)
+        self.p = np.array(p, dtype=float)
+        self.cumulative_transitions = (None if transitions is None else
+                                       np.cumsum(np.array(transitions, dtype=float), axis=1))
+        self.period = period
+        self.start_t = start_t
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Position in codes of each entity's value in each period.
+        self.values = np.zeros((len(self.offsets), 0), dtype=np.int8)
+        if end_t is None:
+            end_t = start_t + DEFAULT_HORIZON_MINUTES
+        self._extend(self._periods_until(end_t))
+
+    def _periods_until(self, t):
+        return (t - self.start_t) // self.period + 2
+
+    def _sample(self, previous):
+        n = len(self.offsets)
+        if previous is None or self.cumulative_transitions is None:
+            return self.rng.choice(len(self.codes), p=self.p, size=n).astype(np.int8)
+        u = self.rng.random(n)
+        cumulative = self.cumulative_transitions[previous]
+        values = (u[:, np.newaxis] >= cumulative).sum(axis=1)
+        # Guard against the rows summing to slightly less than 1.
+        return np.minimum(values, len(self.codes) - 1).astype(np.int8)
+
+    def _extend(self, num_periods):
+        """Sample values until there are at least num_periods periods."""
+        old = self.values.shape[1]
+        if num_periods <= old:
+            return
+        # Grow geometrically, so that lazily extending a long run stays cheap.
+        num_periods = max(num_periods, 2 * old)
+        values = np.zeros((len(self.offsets), num_periods), dtype=np.int8)
+        values[:, :old] = self.values
+        for j in range(old, num_periods):
+            values[:, j] = self._sample(values[:, j - 1] if j > 0 else None)
+        self.values = values
+
+    def _period_index(self, t, offsets):
+        return np.maximum((t - self.start_t - offsets) // self.period + 1, 0)
+
+    def value_at(self, t, indices=None):
+        """The value of each entity at time t.
+
+        Args:
+          t: Simulation time.
+          indices: Optional index or array of indices of entities. Defaults to all of them.
+        Returns:
+          The value (as an int from codes) for each entity.
+        """
+        if indices is None:
+            indices = np.arange(len(self.offsets))
+        k = self._period_index(t, self.offsets[indices])
+        if t >= self.start_t + (self.values.shape[1] - 1) * self.period:
+            self._extend(self._periods_until(t))
+        return self.codes[self.values[indices, k]]
+
+    def resample(self, t):
+        """Redraw every value from the first change after time t onwards, e.g. after the
+        random number generator has been reseeded."""
+        current = self._period_index(t, self.offsets)
+        for j in range(int(current.min()) + 1, self.values.shape[1]):
+            column = self._sample(self.values[:, j - 1])
+            redraw = j > current
+            self.values[redraw, j] = column[redraw]
+
+def weather_timeline(c, rng, num_entities, start_t, end_t):
+    """Sample the weather of a number of places (bases or free-roaming TELs).
+
+    Args:
+      c: Config object.
+      rng: The simulation's RandomStreams.
+      num_entities: Number of places.
+      start_t: Current simulation time.
+      end_t: Optional simulation time to sample up to.
+    """
+    codes = [int(w) for w in c.weather_probabilities.keys()]
+    transitions = None
+    if c.weather_transition_probabilities is not None:
+        transitions = [[c.weather_transition_probabilities[w_from].get(w_to, 0)
+                        for w_to in c.weather_probabilities.keys()]
+                       for w_from in c.weather_probabilities.keys()]
+    period = to_minutes(c.weather_change_frequency)
+    offsets = rng.schedules.integers(period, size=num_entities)
+    return Timeline(rng.weather, codes, list(c.weather_probabilities.values()), period,
+                    start_t, offsets, end_t, transitions)
+
+def shore_timeline(c, rng, num_entities, start_t, end_t):
+    """Sample whether each of a number of free-roaming TELs is near the shore (1) or not
+    (0), so observable from offshore. Arguments are as for weather_timeline()."""
+    period = to_minutes(c.offshore_change_frequency)
+    offsets = rng.schedules.integers(period, size=num_entities)
+    return Timeline(rng.shore, [0, 1], [1 - c.offshore_observability, c.offshore_observability],
+                    period, start_t, offsets, end_t)
+
+# Tests
+_timeline = Timeline(np.random.default_rng(0), [5, 7], [.5, .5], 10, 0, [0, 3], end_t=50,
+                     transitions=[[1, 0], [0, 1]])
+assert (_timeline.value_at(0) == _timeline.value_at(1000)).all()
+assert _timeline.values.shape[1] >= 101
+_timeline = Timeline(np.random.default_rng(0), [5, 7], [.5, .5], 10, 0, [0, 3], end_t=50)
+_before = _timeline.values.copy()
+_timeline.resample(25)
+assert (_timeline.values[0, :4] == _before[0, :4]).all()
+assert (_timeline.values[1, :3] == _before[1, :3]).all()
+assert set(_timeline.value_at(7, [0, 1])) <= {5, 7}
@@ -1,47 +1,96 @@
 from abc import ABC, abstractmethod
-from datetime import timedelta
+
+import numpy as np
 
 from lib.enums import TLOKind, DetectionMethod
-from lib.intelligence_types import File, Observation
+from lib.intelligence_types import File, ObservationBatch
        
 class Tracker:
     def __init__(self, c):
         super().__init__()
         self.c = c
-        self.files = {}
+        # Fleet indices of the TELs there are files for, and each file's latest
+        # observation, as an ObservationBatch with a row per file. latest_t is its t column.
+        self.fleet = None
+        self.tel_indices = None
+        self.latest = None
+        self.latest_t = None
+        # Position of the file for each uid (-1 if none), and ObservationBatches of every
+        # observation assigned to a file.
+        self.position_of_uid = None
+        self.history = []
         
     def start(self, s):
-        for tel in s.tels():
-            initial_obs = Observation(s.t, DetectionMethod.INITIAL, tel.uid,
-                                      tel.state, tlo_kind=TLOKind.TEL)
-            self.files[tel.uid] = File(uid=tel.uid, tel=tel, obs=[initial_obs])
+        fleet = s.fleet
+        tels = list(s.tels())
+        self.fleet = fleet
+        self.tel_indices = np.array([tel.index for tel in tels], dtype=np.int64)
+        uids = fleet.uid[self.tel_indices]
+        n = len(tels)
+        self.latest = ObservationBatch(
+            np.full(n, s.t), np.full(n, DetectionMethod.INITIAL), uids.copy(),
+            fleet.state[self.tel_indices].astype(np.int64), np.full(n, TLOKind.TEL), np.ones(n))
+        self.latest_t = self.latest.t
+        self.position_of_uid = np.full(uids.max() + 1 if n else 0, -1, dtype=np.int64)
+        self.position_of_uid[uids] = np.arange(n)
+        self.history = [self.latest[np.arange(n)]]
                
     @abstractmethod
     def assign_observations(self, observations):
-        """Assign observations to files."""
+        """Assign an ObservationBatch to files."""
         pass
+
+    def positions(self, uids):
+        """The position of the file for each of an array of uids, or -1 if there's none."""
+        positions = np.full(len(uids), -1, dtype=np.int64)
+        known = (uids >= 0) & (uids < len(self.position_of_uid))
+        positions[known] = self.position_of_uid[uids[known]]
+        return positions
+
+    def file(self, uid):
+        """The File of TEL uid, with every observation assigned to it."""
+        self.history = [ObservationBatch.concatenate(self.history)]
+        obs = self.history[0][self.history[0].uid == uid].observations()
+        tel = self.fleet.tel(self.tel_indices[self.position_of_uid[uid]])
+        return File(uid=uid, tel=tel, obs=obs)
     
     def analyze_files(self, t):
-        for f in self.files.values():
-            f.obs.sort()
-            obs = f.obs[-1]
+        for position, i in enumerate(self.tel_indices):
+            tel = self.fleet.tel(i)
+            obs = self.latest.observation(position)
             print("Latest observation of TEL {} was {} minutes ago by {} in state {}, current state {}. Roam time {}.".format(
-                f.tel.name, (t - obs.t)/timedelta(minutes=1), obs.method.name,
-                obs.state.name, f.tel.state.name,
-                f.tel.roaming_time_since_observation(obs, t)))
+                tel.name, t - obs.t, obs.method.name,
+                obs.state.name, tel.state.name,
+                tel.roaming_time_since_observation(obs, t)))
         
 class PerfectTracker(Tracker):
     def __init__(self, c):
         super().__init__(c)
 
     def assign_observations(self, observations):
-        for obs in observations:
-            if obs.uid in self.files:
-                self.files[obs.uid].add_observation(obs)
+        positions = self.positions(observations.uid)
+        rows = np.flatnonzero(positions >= 0)
+        if len(rows) == 0:
+            return
+        assigned = observations[rows]
+        positions = positions[rows]
+        self.history.append(assigned)
+        # Hack alert: the history is joined up every so often, rather than keeping a
+        # small batch per tick.
+        if len(self.history) > 64:
+            self.history = [ObservationBatch.concatenate(self.history)]
+
+        # A file's latest observation is the last one assigned with the latest time.
+        order = np.lexsort((np.arange(len(rows)), assigned.t, positions))
+        sorted_positions = positions[order]
+        last = order[np.append(sorted_positions[1:] != sorted_positions[:-1], True)]
+        last = last[assigned.t[last] >= self.latest_t[positions[last]]]
+        for column in ObservationBatch.__slots__:
+            getattr(self.latest, column)[positions[last]] = getattr(assigned, column)[last]
     
 class RealisticTracker(Tracker):
     def __init__(self, c):
         super().__init__(c)
 
     def assign_observations(self, observations):
-        pass
\ No newline at end of file
+        pass